@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+"""Measures the throughput and latency of sending, getting and deleting pastes, by default against a stand-in host.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench --output results.json
+    python -m benchmarks.bench --compare results.json
+
+Every combination of the chosen operations, modes, text sizes, attachment sizes, compression settings and concurrency
+levels is one scenario. The results are written as JSON, so that runs can be compared between releases.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import privatebinapi
+from privatebinapi.serialization import get_json_backend
+from tests.server import serve
+
+__all__ = ('Scenario', 'compare', 'main', 'run_scenario', 'scenarios')
+
+OPERATIONS = ('send', 'get', 'delete')
+MODES = ('sync', 'async')
+COMPRESSIONS = {'zlib': 'zlib', 'auto': 'auto', 'none': None}
+PERCENTILES = (50, 90, 99)
+WORDS = b'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt '
+
+
+class Scenario(NamedTuple):
+    """One combination of settings to measure."""
+    operation: str
+    mode: str
+    text_size: int
+    attachment_size: int
+    compression: str
+    concurrency: int
+
+    @property
+    def name(self) -> str:
+        """A short unique name, used to match scenarios between runs."""
+        return '%s/%s/text=%d/attachment=%d/%s/c=%d' % self
+
+
+def parse_size(value: str) -> int:
+    """Parse a size such as 512, 64K or 10M into bytes."""
+    units = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30}
+    value = value.strip().upper()
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def parse_list(parse: Callable[[str], object]) -> Callable[[str], list]:
+    """Build an argparse type for comma separated lists."""
+    return lambda value: [parse(item) for item in value.split(',') if item]
+
+
+def scenarios(operations: Iterable[str], modes: Iterable[str], text_sizes: Iterable[int],
+              attachment_sizes: Iterable[int], compressions: Iterable[str],
+              concurrencies: Iterable[int]) -> List[Scenario]:
+    """List every combination of settings."""
+    return [Scenario(*combination) for combination in product(
+        operations, modes, text_sizes, attachment_sizes, compressions, concurrencies
+    )]
+
+
+def make_text(size: int) -> str:
+    """Build compressible text of the given size."""
+    return (WORDS * (size // len(WORDS) + 1))[:size].decode()
+
+
+def make_attachment(directory: str, size: int) -> Optional[str]:
+    """Write an incompressible attachment of the given size, returning its path, or None if size is 0."""
+    if not size:
+        return None
+    path = os.path.join(directory, 'attachment-%d.bin' % size)
+    if not os.path.exists(path):
+        with open(path, 'wb') as file:
+            for offset in range(0, size, 2 ** 20):
+                file.write(os.urandom(min(2 ** 20, size - offset)))
+    return path
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Calculate a percentile by linear interpolation between the closest ranks."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(scenario: Scenario, latencies: List[float], elapsed: float, payload_size: int) -> dict:
+    """Turn the measurements of one scenario into a JSON-serializable result."""
+    result = {'name': scenario.name, **scenario._asdict(), 'count': len(latencies), 'seconds': elapsed}
+    result['operations_per_second'] = len(latencies) / elapsed
+    result['megabytes_per_second'] = len(latencies) * payload_size / elapsed / 2 ** 20
+    result['latency'] = {
+        'mean': statistics.mean(latencies), 'min': min(latencies), 'max': max(latencies),
+        **{'p%d' % percent: percentile(latencies, percent) for percent in PERCENTILES}
+    }
+    return result
+
+
+def timed(func: Callable, *args, **kwargs) -> float:
+    """Call a function and return how long it took."""
+    started = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+async def timed_async(func: Callable, *args, **kwargs) -> float:
+    """Await a coroutine function and return how long it took."""
+    started = time.perf_counter()
+    await func(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def run_sync(scenario: Scenario, server: str, options: dict, count: int) -> dict:
+    """Measure a scenario with the synchronous client and a pool of threads."""
+    with privatebinapi.PrivateBinClient(pool_maxsize=scenario.concurrency) as client:
+        pastes = []
+        if scenario.operation != 'send':
+            pastes = [client.send(server, **options) for _ in range(count)]
+        calls = {
+            'send': lambda _: timed(client.send, server, **options),
+            'get': lambda paste: timed(client.get, paste['full_url']),
+            'delete': lambda paste: timed(client.delete, paste['full_url'], paste['deletetoken'])
+        }
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=scenario.concurrency) as executor:
+            latencies = list(executor.map(calls[scenario.operation], pastes or range(count)))
+        return {'latencies': latencies, 'elapsed': time.perf_counter() - started}
+
+
+async def run_async(scenario: Scenario, server: str, options: dict, count: int) -> dict:
+    """Measure a scenario with the asynchronous client, keeping concurrency requests in flight."""
+    async with privatebinapi.AsyncPrivateBinClient(max_connections=scenario.concurrency) as client:
+        pastes = []
+        if scenario.operation != 'send':
+            pastes = [await client.send(server, **options) for _ in range(count)]
+        calls = {
+            'send': lambda _: timed_async(client.send, server, **options),
+            'get': lambda paste: timed_async(client.get, paste['full_url']),
+            'delete': lambda paste: timed_async(client.delete, paste['full_url'], paste['deletetoken'])
+        }
+        semaphore = asyncio.Semaphore(scenario.concurrency)
+
+        async def bounded(item) -> float:
+            async with semaphore:
+                return await calls[scenario.operation](item)
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(bounded(item) for item in pastes or range(count)))
+        return {'latencies': list(latencies), 'elapsed': time.perf_counter() - started}
+
+
+def run_scenario(scenario: Scenario, server: str, directory: str, count: int) -> dict:
+    """Measure one scenario.
+
+    :param scenario: The settings to measure.
+    :param server: The home URL of the host.
+    :param directory: Where to keep generated attachments.
+    :param count: How many operations to time.
+    :return: The summarized result.
+    """
+    options = {
+        'text': make_text(scenario.text_size), 'file': make_attachment(directory, scenario.attachment_size),
+        'compression': COMPRESSIONS[scenario.compression]
+    }
+    if scenario.mode == 'sync':
+        measured = run_sync(scenario, server, options, count)
+    else:
+        measured = asyncio.get_event_loop().run_until_complete(run_async(scenario, server, options, count))
+    return summarize(scenario, measured['latencies'], measured['elapsed'],
+                     scenario.text_size + scenario.attachment_size)
+
+
+def package_version() -> Optional[str]:
+    """Find the installed version of this package, if it is installed."""
+    try:
+        from importlib.metadata import version  # pylint: disable=import-outside-toplevel
+        return version('PrivateBinAPI')
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def environment() -> Dict[str, str]:
+    """Describe where the benchmark ran."""
+    return {
+        'python': platform.python_version(), 'implementation': platform.python_implementation(),
+        'platform': platform.platform(), 'machine': platform.machine(),
+        'json_backend': get_json_backend().name
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Find the scenarios whose median latency grew by more than a threshold.
+
+    :param baseline: The results of an earlier run.
+    :param current: The results of this run.
+    :param threshold: The allowed growth, as a fraction.
+    :return: A description of each regression.
+    """
+    before = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        if result['name'] not in before:
+            continue
+        old, new = before[result['name']]['latency']['p50'], result['latency']['p50']
+        if new > old * (1 + threshold):
+            regressions.append('%s: p50 %.1f ms -> %.1f ms (%+.0f%%)' % (
+                result['name'], old * 1000, new * 1000, (new / old - 1) * 100
+            ))
+    return regressions
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', help='benchmark a real host instead of a stand-in one')
+    parser.add_argument('--server-version', type=int, choices=(1, 2), default=2,
+                        help='the API version of the stand-in host (default: 2)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the stand-in host waits before each answer (default: 0)')
+    parser.add_argument('--operations', type=parse_list(str), default=list(OPERATIONS))
+    parser.add_argument('--modes', type=parse_list(str), default=list(MODES))
+    parser.add_argument('--text-sizes', type=parse_list(parse_size), default=[1024, 2 ** 20])
+    parser.add_argument('--attachment-sizes', type=parse_list(parse_size), default=[0, 2 ** 20])
+    parser.add_argument('--compressions', type=parse_list(str), default=['zlib'])
+    parser.add_argument('--concurrency', type=parse_list(int), default=[1, 8])
+    parser.add_argument('--count', type=int, default=16, help='operations timed per scenario (default: 16)')
+    parser.add_argument('--output', help='write the results to this file instead of standard output')
+    parser.add_argument('--compare', metavar='BASELINE', help='report scenarios slower than an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='the median latency growth counted as a regression (default: 0.1)')
+    args = parser.parse_args(argv)
+    for name, allowed in (('operations', OPERATIONS), ('modes', MODES), ('compressions', COMPRESSIONS)):
+        unknown = set(getattr(args, name)) - set(allowed)
+        if unknown:
+            parser.error('unknown %s: %s' % (name, ', '.join(sorted(unknown))))
+    return args
+
+
+def main(argv: List[str] = None) -> int:
+    """Run the benchmark.
+
+    :return: 1 if a regression against the baseline was found, else 0.
+    """
+    args = parse_args(argv)
+    host = None if args.url else serve(args.server_version, latency=args.latency)
+    server = args.url or host.url
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for scenario in scenarios(args.operations, args.modes, args.text_sizes, args.attachment_sizes,
+                                      args.compressions, args.concurrency):
+                result = run_scenario(scenario, server, directory, args.count)
+                results.append(result)
+                print('%-60s %8.1f ops/s  p50 %7.1f ms  p99 %7.1f ms' % (
+                    scenario.name, result['operations_per_second'], result['latency']['p50'] * 1000,
+                    result['latency']['p99'] * 1000
+                ), file=sys.stderr)
+    finally:
+        if host is not None:
+            host.__exit__(None, None, None)
+
+    report = {
+        'version': package_version(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'environment': environment(),
+        'server': {'url': args.url, 'version': None if args.url else args.server_version, 'latency': args.latency},
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), report, args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
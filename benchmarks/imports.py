@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""Measures how long importing this package takes, and which heavy dependencies each entry point pulls in.
+
+Run from the root of the repository:
+
+    python -m benchmarks.imports --output imports.json
+    python -m benchmarks.imports --compare imports.json
+
+Each statement is run in a fresh interpreter, so that nothing is already imported, and timed from inside it.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import Dict, List, NamedTuple
+
+from benchmarks.bench import compare, environment, package_version, percentile, PERCENTILES
+
+__all__ = ('Statement', 'STATEMENTS', 'main', 'measure')
+
+HEAVY_MODULES = ('requests', 'httpx', 'pbincli', 'Crypto', 'Cryptodome')
+STATEMENTS = (
+    ('import', 'import privatebinapi'),
+    ('exceptions', 'from privatebinapi import PrivateBinAPIError'),
+    ('delete', 'from privatebinapi import delete'),
+    ('get', 'from privatebinapi import get'),
+    ('send', 'from privatebinapi import send'),
+    ('async', 'from privatebinapi import AsyncPrivateBinClient; AsyncPrivateBinClient()'),
+)
+PROBE = '''
+import sys, time
+started = time.perf_counter()
+exec(sys.argv[1])
+elapsed = time.perf_counter() - started
+print(elapsed, ' '.join(name for name in sys.argv[2:] if name in sys.modules))
+'''
+
+
+class Statement(NamedTuple):
+    """One way of starting to use the package."""
+    name: str
+    code: str
+
+
+def measure(code: str) -> Dict[str, object]:
+    """Time a statement in a fresh interpreter.
+
+    :param code: The statement to run.
+    :return: The seconds it took and the heavy modules it loaded.
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, code, *HEAVY_MODULES], stdout=subprocess.PIPE, check=True,
+        universal_newlines=True
+    ).stdout.split(' ', 1)
+    return {'seconds': float(output[0]), 'modules': output[1].split()}
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--statements', type=lambda value: value.split(','), default=[name for name, _ in STATEMENTS],
+                        help='which statements to time (default: all)')
+    parser.add_argument('--count', type=int, default=10, help='interpreters started per statement (default: 10)')
+    parser.add_argument('--output', help='write the results to this file instead of standard output')
+    parser.add_argument('--compare', metavar='BASELINE', help='report statements slower than an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='the median import time growth counted as a regression (default: 0.25)')
+    args = parser.parse_args(argv)
+    unknown = set(args.statements) - {name for name, _ in STATEMENTS}
+    if unknown:
+        parser.error('unknown statements: %s' % ', '.join(sorted(unknown)))
+    return args
+
+
+def main(argv: List[str] = None) -> int:
+    """Run the benchmark.
+
+    :return: 1 if a regression against the baseline was found, else 0.
+    """
+    args = parse_args(argv)
+    results = []
+    for statement in (Statement(*item) for item in STATEMENTS if item[0] in args.statements):
+        runs = [measure(statement.code) for _ in range(args.count)]
+        seconds = [run['seconds'] for run in runs]
+        results.append({
+            'name': 'import/' + statement.name, 'code': statement.code, 'count': len(runs),
+            'modules': runs[-1]['modules'],
+            'latency': {
+                'min': min(seconds), **{'p%d' % percent: percentile(seconds, percent) for percent in PERCENTILES}
+            }
+        })
+        print('%-20s p50 %7.1f ms  loads %s' % (
+            statement.name, results[-1]['latency']['p50'] * 1000, ', '.join(runs[-1]['modules']) or 'nothing heavy'
+        ), file=sys.stderr)
+
+    report = {
+        'version': package_version(), 'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': environment(), 'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), report, args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
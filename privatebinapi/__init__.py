@@ -1,17 +1,82 @@
 # -*- coding: utf-8 -*-
 
-"""Wrapper for the PrivateBin API."""
+"""Wrapper for the PrivateBin API.
+
+Only the exceptions, hooks and result types are imported with the package. Everything else, along with requests, httpx
+and pbincli, is imported the first time it is used, so that scripts which only delete pastes, or only import the
+exceptions, start quickly.
+"""
+
+import importlib
+import sys
+from typing import TYPE_CHECKING, Any, List
 
-from privatebinapi.deletion import delete, delete_async
-from privatebinapi.download import get, get_async
 from privatebinapi.exceptions import BadCompressionTypeError, BadExpirationTimeError, BadFormatError, \
-    PrivateBinAPIError, BadServerResponseError, UnsupportedFeatureError
-from privatebinapi.upload import send, send_async
+    PrivateBinAPIError, BadServerResponseError, ServerUnavailableError, UnsupportedFeatureError
+from privatebinapi.hooks import Event, add_hook, clear_hooks, remove_hook
+from privatebinapi.results import Attachment, Comment, DeleteResult, PasteResult, UploadResult
+
+if TYPE_CHECKING:
+    from privatebinapi.cache import DiskCache, MemoryCache
+    from privatebinapi.client import AsyncPrivateBinClient, PrivateBinClient
+    from privatebinapi.comments import comment, comment_async
+    from privatebinapi.common import RateLimiter, RetryPolicy
+    from privatebinapi.dedup import Deduplicator, MemoryIndex, SQLiteIndex
+    from privatebinapi.deletion import delete, delete_async, delete_many, delete_many_async
+    from privatebinapi.download import get, get_async, get_many, get_many_async, get_stream, get_stream_async
+    from privatebinapi.hostpool import HostPool, HostStatus
+    from privatebinapi.upload import encrypt_paste, send, send_async, send_many, send_many_async, submit_payload, \
+        submit_payload_async
 
 __all__ = (
-    'delete', 'delete_async', 'get', 'get_async', 'send', 'send_async', 'BadCompressionTypeError',
+    'AsyncPrivateBinClient', 'Attachment', 'Comment', 'DeleteResult', 'Deduplicator', 'DiskCache', 'Event',
+    'HostPool', 'HostStatus', 'MemoryCache', 'MemoryIndex', 'PasteResult', 'PrivateBinClient', 'RateLimiter',
+    'RetryPolicy', 'SQLiteIndex', 'UploadResult',
+    'add_hook', 'clear_hooks', 'comment', 'comment_async', 'delete', 'delete_async', 'delete_many',
+    'delete_many_async', 'encrypt_paste', 'get', 'get_async', 'get_many', 'get_many_async', 'get_stream',
+    'get_stream_async', 'remove_hook', 'send', 'send_async', 'send_many', 'send_many_async', 'submit_payload',
+    'submit_payload_async', 'BadCompressionTypeError',
     'BadExpirationTimeError', 'BadFormatError', 'BadServerResponseError', 'PrivateBinAPIError',
-    'UnsupportedFeatureError'
+    'ServerUnavailableError', 'UnsupportedFeatureError'
 )
 
 __author__ = 'Pioverpie'
+
+LAZY_NAMES = {
+    'AsyncPrivateBinClient': 'client', 'PrivateBinClient': 'client',
+    'DiskCache': 'cache', 'MemoryCache': 'cache',
+    'comment': 'comments', 'comment_async': 'comments',
+    'Deduplicator': 'dedup', 'MemoryIndex': 'dedup', 'SQLiteIndex': 'dedup',
+    'RateLimiter': 'common', 'RetryPolicy': 'common',
+    'delete': 'deletion', 'delete_async': 'deletion', 'delete_many': 'deletion', 'delete_many_async': 'deletion',
+    'get': 'download', 'get_async': 'download', 'get_many': 'download', 'get_many_async': 'download',
+    'get_stream': 'download', 'get_stream_async': 'download',
+    'HostPool': 'hostpool', 'HostStatus': 'hostpool',
+    'encrypt_paste': 'upload', 'send': 'upload', 'send_async': 'upload', 'send_many': 'upload',
+    'send_many_async': 'upload', 'submit_payload': 'upload', 'submit_payload_async': 'upload'
+}
+
+
+def __getattr__(name: str) -> Any:
+    """Import a public name from its module the first time it is looked up.
+
+    :param name: The name being looked up.
+    :return: The object the name refers to.
+    """
+    try:
+        module = LAZY_NAMES[name]
+    except KeyError:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name)) from None
+    value = getattr(importlib.import_module('privatebinapi.' + module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(LAZY_NAMES))
+
+
+if sys.version_info < (3, 7):  # Module __getattr__ needs Python 3.7, so import everything up front
+    for _name in LAZY_NAMES:
+        __getattr__(_name)
+    del _name
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+"""Runs the command line interface with python -m privatebinapi."""
+
+import sys
+
+from privatebinapi.cli import main
+
+sys.exit(main())
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""Reads the attachment of a paste from a path, a buffer already in memory or a file object.
+
+Large files are memory-mapped rather than read into a copy, and buffers are used in place, so the only copy made of an
+attachment is its base64 encoding.
+"""
+
+import contextlib
+import mmap
+import ntpath
+import os
+from mimetypes import guess_type
+from typing import IO, Iterator, NamedTuple, Optional, Tuple, Union
+
+__all__ = (
+    'AttachmentSource', 'FileSource', 'MMAP_THRESHOLD', 'attachment_name', 'guess_mimetype', 'is_file_object',
+    'is_path', 'open_attachment', 'read_file_object'
+)
+
+# Files at least this large are memory-mapped instead of read
+MMAP_THRESHOLD = 2 ** 20
+DEFAULT_MIMETYPE = 'application/octet-stream'
+
+FileSource = Union[str, 'os.PathLike', bytes, bytearray, memoryview, mmap.mmap, IO[bytes]]
+
+
+class AttachmentSource(NamedTuple):
+    """The content of an attachment, ready to be encoded.
+
+    content is a flat memoryview of the bytes, which is only valid inside the open_attachment block that made it.
+    """
+    content: memoryview
+    name: str
+    mimetype: str
+
+
+def is_path(file: FileSource) -> bool:
+    """Check whether an attachment is given as the path of a file rather than its content."""
+    return isinstance(file, (str, os.PathLike))
+
+
+def is_file_object(file: FileSource) -> bool:
+    """Check whether an attachment is given as a file object, which can only be read once."""
+    return not is_path(file) and hasattr(file, 'read') and not isinstance(file, mmap.mmap)
+
+
+def attachment_name(file: FileSource, filename: Optional[str]) -> str:
+    """Work out the name an attachment is uploaded under.
+
+    :param file: The attachment.
+    :param filename: The name given for it, if any.
+    :return: The name.
+    :raises ValueError: No name was given for an attachment which has none of its own.
+    """
+    if filename:
+        return filename
+    path = os.fspath(file) if is_path(file) else getattr(file, 'name', None)
+    if isinstance(path, str) and path:
+        return ntpath.basename(path) or ntpath.basename(ntpath.dirname(path))
+    raise ValueError("filename is required for attachments which are not paths")
+
+
+def guess_mimetype(name: str, mimetype: Optional[str]) -> str:
+    """Use the given MIME type, or guess one from the name of the attachment."""
+    return mimetype or guess_type(name, strict=False)[0] or DEFAULT_MIMETYPE
+
+
+def read_file_object(file: FileSource, filename: str = None) -> Tuple[FileSource, Optional[str]]:
+    """Read a file object once, so that the attachment can be encrypted again if an upload is retried.
+
+    Paths and buffers are returned as they are.
+
+    :param file: The attachment.
+    :param filename: The name given for it, if any.
+    :return: The attachment, with file objects read into bytes, and its name.
+    """
+    if file is None or not is_file_object(file):
+        return file, filename
+    return file.read(), attachment_name(file, filename)
+
+
+@contextlib.contextmanager
+def open_attachment(file: FileSource, filename: str = None, mimetype: str = None) -> Iterator[AttachmentSource]:
+    """Open an attachment for reading.
+
+    :param file: The path of a file, a bytes-like object such as bytes, memoryview or mmap, or a binary file object.
+    :param filename: The name to upload the attachment under. Required unless file is a path or a named file.
+    :param mimetype: The MIME type of the attachment. If None, it is guessed from the name.
+    :return: A context manager giving an AttachmentSource.
+    """
+    name = attachment_name(file, filename)
+    mimetype = guess_mimetype(name, mimetype)
+    if is_path(file):
+        with open(file, 'rb') as handle:
+            if os.fstat(handle.fileno()).st_size < MMAP_THRESHOLD:
+                yield AttachmentSource(memoryview(handle.read()), name, mimetype)
+                return
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                yield AttachmentSource(view, name, mimetype)
+        return
+    if is_file_object(file):
+        file = file.read()
+    with memoryview(file) as view:
+        if view.ndim != 1 or view.format != 'B':
+            view = view.cast('B')
+        yield AttachmentSource(view, name, mimetype)
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+
+"""Keeps downloaded pastes locally, so that reading the same paste again needs no request.
+
+Only what the host sent is cached: the encrypted paste, never its key or plaintext. Reading a cached paste therefore
+still decrypts it; enable the key cache in privatebinapi.crypto to make that cheap too.
+"""
+
+import abc
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from privatebinapi.common import host_key
+
+__all__ = ('CacheEntry', 'DiskCache', 'MemoryCache', 'PasteCache', 'paste_key')
+
+DEFAULT_MAXSIZE = 256
+
+
+class CacheEntry(NamedTuple):
+    """A downloaded paste, as the host sent it.
+
+    expires is when the paste expires on the host, as a time.time() timestamp, or None if it never does. stale_after
+    is when the entry has to be checked with the host again, or None if it never has to be. etag and last_modified
+    are the validators the host sent, used to check the entry without downloading the paste again.
+    """
+    data: dict
+    expires: Optional[float]
+    stale_after: Optional[float]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    def expired(self, now: float = None) -> bool:
+        """Whether the paste has expired on the host."""
+        return self.expires is not None and (time.time() if now is None else now) >= self.expires
+
+    def stale(self, now: float = None) -> bool:
+        """Whether the entry has to be checked with the host before it is used."""
+        return self.stale_after is not None and (time.time() if now is None else now) >= self.stale_after
+
+    def conditional_headers(self) -> dict:
+        """Build the headers which ask the host to answer 304 Not Modified if the paste has not changed."""
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def paste_key(url: str) -> str:
+    """Build the cache key of a paste: its host and ID, without the passphrase.
+
+    :param url: The URL of the paste. Anything after '#' is ignored.
+    :return: The key.
+    :raises ValueError: The URL has no paste ID.
+    """
+    parts = urlsplit(url.split('#', 1)[0])
+    if not parts.query:
+        raise ValueError("url must be a full, valid PrivateBin link")
+    return host_key(url) + '?' + parts.query
+
+
+def time_to_live(data: dict) -> Optional[float]:
+    """Find how many more seconds a downloaded paste lives for, from its meta data.
+
+    :param data: The JSON component of a response from a PrivateBin host.
+    :return: The number of seconds, or None if the paste never expires.
+    """
+    meta = data.get('meta') or {}
+    for field in ('time_to_live', 'remaining_time'):
+        if meta.get(field) is not None:
+            return float(meta[field])
+    if meta.get('expire_date') is not None:
+        return float(meta['expire_date']) - time.time()
+    return None
+
+
+def burns_after_reading(data: dict) -> bool:
+    """Check whether a downloaded paste is deleted by the host once it has been read.
+
+    :param data: The JSON component of a response from a PrivateBin host.
+    :return: True for burn after reading pastes.
+    """
+    try:
+        if 'adata' in data:
+            return bool(data['adata'][3])
+    except (IndexError, TypeError):
+        return False
+    return bool((data.get('meta') or {}).get('burnafterreading'))
+
+
+class PasteCache(abc.ABC):
+    """The policy shared by every cache backend.
+
+    Subclasses store CacheEntry objects under string keys by implementing load, save, discard and clear. blocking
+    tells the async functions whether the backend does I/O and should be used from an executor.
+    """
+
+    blocking = False
+
+    def __init__(self, *, max_age: float = None):
+        """
+        :param max_age: How many seconds an entry is used for before it is checked with the host again. If None,
+            entries are used until their paste expires.
+        """
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    @abc.abstractmethod
+    def load(self, key: str) -> Optional[CacheEntry]:
+        """Look up an entry.
+
+        :param key: The key built by paste_key.
+        :return: The entry, or None if there is none.
+        """
+
+    @abc.abstractmethod
+    def save(self, key: str, entry: CacheEntry):
+        """Store an entry, replacing any existing one.
+
+        :param key: The key built by paste_key.
+        :param entry: The entry.
+        """
+
+    @abc.abstractmethod
+    def discard(self, key: str):
+        """Remove an entry, if there is one.
+
+        :param key: The key built by paste_key.
+        """
+
+    @abc.abstractmethod
+    def clear(self):
+        """Remove every entry."""
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        """Find the cached copy of a paste, dropping it if the paste has expired.
+
+        :param url: The URL of the paste.
+        :return: The entry, which may be stale, or None if there is none.
+        """
+        key = paste_key(url)
+        entry = self.load(key)
+        if entry is not None and entry.expired():
+            self.discard(key)
+            entry = None
+        if entry is None or entry.stale():
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, url: str, data: dict, headers=None) -> Optional[CacheEntry]:
+        """Cache a downloaded paste, unless it burns after reading or has already expired.
+
+        :param url: The URL of the paste.
+        :param data: The JSON component of the host's response.
+        :param headers: The headers of the host's response, for their validators.
+        :return: The new entry, or None if the paste is not cacheable.
+        """
+        key = paste_key(url)
+        ttl = time_to_live(data)
+        if burns_after_reading(data) or (ttl is not None and ttl <= 0):
+            self.discard(key)
+            return None
+        now = time.time()
+        headers = headers or {}
+        entry = CacheEntry(
+            data, None if ttl is None else now + ttl, None if self.max_age is None else now + self.max_age,
+            headers.get('ETag'), headers.get('Last-Modified')
+        )
+        self.save(key, entry)
+        return entry
+
+    def refresh(self, url: str, entry: CacheEntry) -> CacheEntry:
+        """Mark an entry as checked with the host, after it answered 304 Not Modified.
+
+        :param url: The URL of the paste.
+        :param entry: The entry which was checked.
+        :return: The refreshed entry.
+        """
+        if self.max_age is not None:
+            entry = entry._replace(stale_after=time.time() + self.max_age)
+            self.save(paste_key(url), entry)
+        return entry
+
+
+class MemoryCache(PasteCache):
+    """Keeps the most recently used pastes in memory, for as long as the process lives."""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, *, max_age: float = None):
+        """
+        :param maxsize: The maximum number of pastes to keep.
+        :param max_age: How many seconds an entry is used for before it is checked with the host again. If None,
+            entries are used until their paste expires.
+        """
+        super().__init__(max_age=max_age)
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def save(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskCache(PasteCache):
+    """Keeps pastes as JSON files in a directory, so that they outlive the process and can be shared between
+    processes.
+
+    Files are named after a hash of their key and replaced atomically. Expired entries are removed when they are
+    looked up, or all at once by prune().
+    """
+
+    blocking = True
+
+    def __init__(self, directory: str, *, max_age: float = None):
+        """
+        :param directory: The directory to keep the files in. It is created if it does not exist.
+        :param max_age: How many seconds an entry is used for before it is checked with the host again. If None,
+            entries are used until their paste expires.
+        """
+        super().__init__(max_age=max_age)
+        self.directory = os.fspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+    def _paths(self) -> Iterator[str]:
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                yield os.path.join(self.directory, name)
+
+    @staticmethod
+    def _read(path: str) -> Optional[CacheEntry]:
+        try:
+            with open(path, 'rb') as file:
+                return CacheEntry(**json.loads(file.read().decode('utf-8')))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def load(self, key: str) -> Optional[CacheEntry]:
+        return self._read(self._path(key))
+
+    def save(self, key: str, entry: CacheEntry):
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(json.dumps(entry._asdict()).encode('utf-8'))
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def discard(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for path in self._paths():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def prune(self) -> int:
+        """Remove the entries of every expired paste, and any unreadable files.
+
+        :return: The number of files removed.
+        """
+        removed = 0
+        now = time.time()
+        for path in self._paths():
+            entry = self._read(path)
+            if entry is None or entry.expired(now):
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
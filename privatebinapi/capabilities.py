@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""Discovers and caches what each PrivateBin host supports, so it only has to be asked once."""
+
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, NamedTuple, Optional, Union
+
+from privatebinapi import hooks
+from privatebinapi.common import DEFAULT_HEADERS, AsyncClientContext, RetryPolicy, call_with_retry, \
+    call_with_retry_async, check_availability, host_key, session_context
+from privatebinapi.exceptions import BadServerResponseError
+from privatebinapi.serialization import loads
+
+if TYPE_CHECKING:  # The HTTP libraries are only imported once a request is made
+    import httpx
+    import requests
+
+__all__ = ('CapabilityCache', 'HostCapabilities', 'CAPABILITY_CACHE', 'get_capabilities', 'get_capabilities_async')
+
+DEFAULT_CAPABILITY_TTL = 3600.0
+
+
+class HostCapabilities(NamedTuple):
+    """What a PrivateBin host is known to support.
+
+    supports_deletion is None until a deletion has been attempted on the host.
+    """
+    version: Optional[int]
+    supports_deletion: Optional[bool]
+    expires: float
+
+    @property
+    def supports_zlib(self) -> bool:
+        """Whether or not the host accepts zlib compressed pastes."""
+        return self.version is not None and self.version >= 2
+
+
+class CapabilityCache:
+    """A thread-safe, per-host cache of HostCapabilities with a time to live."""
+
+    def __init__(self, ttl: float = DEFAULT_CAPABILITY_TTL):
+        """
+        :param ttl: How many seconds an entry stays valid for.
+        """
+        self.ttl = ttl
+        self._entries: Dict[str, HostCapabilities] = {}
+        self._lock = threading.Lock()
+
+    def get(self, server: str) -> Optional[HostCapabilities]:
+        """Look up the capabilities of a host.
+
+        :param server: The home URL of the PrivateBin host.
+        :return: The cached capabilities, or None if there are none or they have expired.
+        """
+        key = host_key(server)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                del self._entries[key]
+                entry = None
+        return entry
+
+    def update(self, server: str, **changes) -> HostCapabilities:
+        """Record new information about a host, keeping anything already known.
+
+        :param server: The home URL of the PrivateBin host.
+        :param changes: The HostCapabilities fields to set.
+        :return: The updated capabilities.
+        """
+        key = host_key(server)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires <= time.monotonic():
+                entry = HostCapabilities(version=None, supports_deletion=None, expires=0)
+            entry = entry._replace(expires=time.monotonic() + self.ttl, **changes)
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, server: str = None):
+        """Forget what is known about a host.
+
+        :param server: The home URL of the PrivateBin host. If None, every host is forgotten.
+        """
+        with self._lock:
+            if server is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(host_key(server), None)
+
+
+CAPABILITY_CACHE = CapabilityCache()
+
+
+def parse_version(response: 'Union[requests.Response, httpx.Response]') -> int:
+    """Extract the API version from a host's JSON-LD paste schema.
+
+    :param response: The response to a request for ?jsonld=paste.
+    :return: The API version of the host.
+    """
+    check_availability(response)
+    try:
+        schema = loads(response.content)
+    except ValueError as error:
+        raise BadServerResponseError("The host failed to respond with PrivateBin version information.") from error
+    try:
+        return schema['@context']['v']['@value']
+    except (KeyError, TypeError):
+        return 1
+
+
+def get_capabilities(server: str, *, session: 'requests.Session' = None, proxies: dict = None,
+                     cache: CapabilityCache = CAPABILITY_CACHE, retry_policy: RetryPolicy = None) -> HostCapabilities:
+    """Get the capabilities of a host, asking the host only if they are not cached.
+
+    :param server: The home URL of the PrivateBin host.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
+    :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param cache: The cache to read from and update.
+    :param retry_policy: How to retry the request if it fails. If None, it is not retried.
+    :return: The capabilities of the host.
+    """
+    capabilities = cache.get(server)
+    if capabilities is not None and capabilities.version is not None:
+        return capabilities
+    started = hooks.start()
+    with session_context(session) as session:
+        def request() -> int:
+            return parse_version(session.get(server + '?jsonld=paste', headers=DEFAULT_HEADERS, proxies=proxies))
+
+        version = call_with_retry(request, server, retry_policy, operation='send')
+    hooks.finish(started, 'send', 'capabilities', server, version=version)
+    return cache.update(server, version=version)
+
+
+async def get_capabilities_async(server: str, *, client: 'httpx.AsyncClient' = None, proxies: dict = None,
+                                 cache: CapabilityCache = CAPABILITY_CACHE,
+                                 retry_policy: RetryPolicy = None) -> HostCapabilities:
+    """Asynchronously get the capabilities of a host, asking the host only if they are not cached.
+
+    :param server: The home URL of the PrivateBin host.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :param proxies: A dict of proxies to pass to an httpx.AsyncClient object.
+    :param cache: The cache to read from and update.
+    :param retry_policy: How to retry the request if it fails. If None, it is not retried.
+    :return: The capabilities of the host.
+    """
+    capabilities = cache.get(server)
+    if capabilities is not None and capabilities.version is not None:
+        return capabilities
+    started = hooks.start()
+    async with AsyncClientContext(client, proxies=proxies) as client:
+        async def request() -> int:
+            return parse_version(await client.get(server + '?jsonld=paste', headers=DEFAULT_HEADERS))
+
+        version = await call_with_retry_async(request, server, retry_policy, operation='send')
+    hooks.finish(started, 'send', 'capabilities', server, version=version)
+    return cache.update(server, version=version)
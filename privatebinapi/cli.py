@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+
+"""A command line interface for uploading, downloading and deleting many pastes at once.
+
+    privatebinapi send https://privatebin.net/ 'logs/*.txt' > pastes.jsonl
+    privatebinapi get < pastes.jsonl
+    privatebinapi delete < pastes.jsonl
+
+Each subcommand takes its inputs as arguments, or one per line on standard input if none are given, and writes one
+JSON object per line to standard output as each item finishes. Requests run concurrently on one event loop, and
+encryption and decryption run in a pool of processes, so a large batch uses every core.
+"""
+
+import argparse
+import asyncio
+import base64
+import glob
+import json
+import os
+import re
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from privatebinapi.client import AsyncPrivateBinClient
+from privatebinapi.common import BulkResult, RetryPolicy, run_bounded_async
+from privatebinapi.compression import COMPRESSION_TYPES
+from privatebinapi.hostpool import HostPool
+from privatebinapi.upload import EXPIRATION_TIMES, FORMAT_TYPES
+
+__all__ = ('main',)
+
+DEFAULT_CONCURRENCY = 32
+
+
+def read_inputs(arguments: List[str], stdin: TextIO) -> Iterator[str]:
+    """List the inputs of a subcommand.
+
+    :param arguments: The inputs given on the command line.
+    :param stdin: Where to read inputs from, one per line, if none were given on the command line.
+    :return: An iterator of the inputs, without blank lines.
+    """
+    lines = arguments if arguments else (line.rstrip('\r\n') for line in stdin)
+    return (line for line in lines if line.strip())
+
+
+def expand_paths(patterns: Iterable[str]) -> Iterator[str]:
+    """Expand glob patterns into the files they match.
+
+    Patterns without wildcards are passed through as they are, so a missing file is reported when it is uploaded.
+
+    :param patterns: Paths and glob patterns.
+    :return: An iterator of paths.
+    """
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            yield from sorted(path for path in glob.iglob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            yield pattern
+
+
+def parse_link(line: str) -> Tuple[str, Optional[str]]:
+    """Read a paste's link and delete token from a line of input.
+
+    A line is either a link optionally followed by whitespace and a delete token, or a JSON object such as the ones
+    the send subcommand writes.
+
+    :param line: The line.
+    :return: The link and the delete token, or None if the line has none.
+    :raises ValueError: The line holds no link.
+    """
+    line = line.strip()
+    if line.startswith('{'):
+        record = json.loads(line)
+        record = record.get('result') or record
+        if 'full_url' not in record:
+            raise ValueError("no full_url in %s" % line)
+        return record['full_url'], record.get('deletetoken')
+    parts = line.split()
+    return parts[0], parts[1] if len(parts) > 1 else None
+
+
+def parse_links(lines: Iterable[str], output: TextIO) -> Tuple[List[Optional[Tuple[str, Optional[str]]]], bool]:
+    """Read the link and delete token of every line, reporting the lines which hold none.
+
+    :param lines: The lines of input.
+    :param output: Where to report lines which hold no link.
+    :return: The output of parse_link for each line, or None for the lines which failed, and True if none did.
+    """
+    links, succeeded = [], True
+    for line in lines:
+        try:
+            links.append(parse_link(line))
+        except ValueError as error:
+            succeeded = report(output, line, BulkResult(len(links), None, error)) and succeeded
+            links.append(None)
+    return links, succeeded
+
+
+def encode_json(value):
+    """Encode what json cannot: bytes and memoryviews as base64, and results as plain dicts."""
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(value).decode('ascii')
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    raise TypeError('%s is not JSON serializable' % type(value).__name__)
+
+
+def report(output: TextIO, item: str, outcome: BulkResult) -> bool:
+    """Write the outcome of one item as a line of JSON.
+
+    :param output: Where to write.
+    :param item: The input the item was made from.
+    :param outcome: The BulkResult of the item.
+    :return: True if the item succeeded.
+    """
+    record = {'index': outcome.index, 'input': item}
+    if outcome.error is None:
+        record['result'] = outcome.result
+    else:
+        record['error'] = {'type': type(outcome.error).__name__, 'message': str(outcome.error)}
+    output.write(json.dumps(record, default=encode_json) + '\n')
+    output.flush()
+    return outcome.error is None
+
+
+def save_attachment(directory: str, result) -> dict:
+    """Write the attachment of a downloaded paste to a directory instead of the output.
+
+    The file is named after the paste's ID and the attachment's name, so pastes with attachments of the same name do
+    not overwrite each other.
+
+    :param directory: The directory to write to.
+    :param result: The downloaded paste.
+    :return: The paste as a dict, with the path of the file in place of the attachment's content.
+    :raises ValueError: The host sent a paste ID which is not hexadecimal, so it cannot be used in a file name.
+    """
+    data = result.to_dict()
+    attachment = data.get('attachment') or {}
+    if attachment.get('content') is not None:
+        if not re.fullmatch('[0-9a-f]+', str(result['id'])):
+            raise ValueError("invalid paste ID %r" % result['id'])
+        name = os.path.basename(attachment['filename'] or 'attachment')
+        path = os.path.join(directory, '%s-%s' % (result['id'], name))
+        with open(path, 'wb') as file:
+            file.write(attachment['content'])
+        data['attachment'] = {**attachment, 'content': None, 'path': path}
+    return data
+
+
+async def run_send(args: argparse.Namespace, client: AsyncPrivateBinClient, executor: Optional[Executor],
+                   inputs: Iterable[str], output: TextIO) -> bool:
+    """Upload a paste for every file."""
+    server = HostPool(args.server) if len(args.server) > 1 else args.server[0]
+    options = {
+        'password': args.password, 'expiration': args.expiration, 'formatting': args.formatting,
+        'compression': None if args.compression == 'none' else args.compression,
+        'burn_after_reading': args.burn_after_reading, 'discussion': args.discussion
+    }
+    paths, positions = [], []
+    succeeded = True
+
+    def items() -> Iterator[dict]:
+        nonlocal succeeded
+        for path in expand_paths(inputs):
+            paths.append(path)
+            if args.text:
+                try:
+                    with open(path, encoding='utf-8') as file:
+                        item = {'text': file.read(), **options}
+                except (OSError, UnicodeDecodeError) as error:
+                    succeeded = report(output, path, BulkResult(len(paths) - 1, None, error)) and succeeded
+                    continue
+            else:
+                item = {'file': path, **options}
+            positions.append(len(paths) - 1)
+            yield item
+
+    async for outcome in client.send_many(server, items(), concurrency=args.concurrency, executor=executor):
+        outcome = outcome._replace(index=positions[outcome.index])
+        succeeded = report(output, paths[outcome.index], outcome) and succeeded
+    return succeeded
+
+
+async def run_get(args: argparse.Namespace, client: AsyncPrivateBinClient, executor: Optional[Executor],
+                  inputs: Iterable[str], output: TextIO) -> bool:
+    """Download and decrypt every paste."""
+    links, succeeded = parse_links(inputs, output)
+    if args.attachments:
+        os.makedirs(args.attachments, exist_ok=True)
+
+    indexes = [index for index, link in enumerate(links) if link is not None]
+    downloads = client.get_many(
+        [links[index][0] for index in indexes], concurrency=args.concurrency, password=args.password,
+        decrypt_executor=executor
+    )
+    async for outcome in downloads:
+        outcome = outcome._replace(index=indexes[outcome.index])
+        if outcome.error is None and args.attachments:
+            try:
+                outcome = outcome._replace(result=save_attachment(args.attachments, outcome.result))
+            except (OSError, ValueError) as error:
+                outcome = outcome._replace(result=None, error=error)
+        succeeded = report(output, links[outcome.index][0], outcome) and succeeded
+    return succeeded
+
+
+async def run_delete(args: argparse.Namespace, client: AsyncPrivateBinClient, executor: Optional[Executor],
+                     inputs: Iterable[str], output: TextIO) -> bool:
+    """Delete every paste with its delete token."""
+    del executor  # Deleting needs no cryptography
+    links, succeeded = parse_links(inputs, output)
+    indexes = [index for index, link in enumerate(links) if link is not None]
+
+    async def delete_one(index: int) -> dict:
+        link, token = links[index]
+        if token is None:
+            raise ValueError("no delete token for %s" % link)
+        return await client.delete(link, token)
+
+    async for outcome in run_bounded_async(delete_one, indexes, args.concurrency):
+        outcome = outcome._replace(index=indexes[outcome.index])
+        succeeded = report(output, links[outcome.index][0], outcome) and succeeded
+    return succeeded
+
+
+COMMANDS = {'send': run_send, 'get': run_get, 'delete': run_delete}
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(prog='privatebinapi', description=__doc__.split('\n')[0])
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='requests in flight at once (default: %d)' % DEFAULT_CONCURRENCY)
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help='processes to encrypt and decrypt in, or 0 for threads (default: one per core)')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='attempts per request before giving up, or 1 to never retry (default: 3)')
+    parser.add_argument('--proxy', action='append', default=[], metavar='SCHEME=URL',
+                        help='a proxy to use for a URL scheme, such as https=http://proxy:3128')
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+    subparsers.required = True
+
+    send_parser = subparsers.add_parser('send', help='upload files as pastes')
+    send_parser.add_argument('server', help='the home URL of the PrivateBin host')
+    send_parser.add_argument('files', nargs='*', help='files or glob patterns to upload (default: read from stdin)')
+    send_parser.add_argument('--also', dest='servers', action='append', default=[], metavar='SERVER',
+                             help='spread the uploads across another host as well')
+    send_parser.add_argument('--text', action='store_true',
+                             help='send the contents of each file as the text of its paste instead of attaching it')
+    send_parser.add_argument('--password', help='a password to secure the pastes')
+    send_parser.add_argument('--expiration', default='1day', choices=EXPIRATION_TIMES)
+    send_parser.add_argument('--formatting', default='plaintext', choices=FORMAT_TYPES)
+    send_parser.add_argument('--compression', default='zlib',
+                             choices=[value or 'none' for value in COMPRESSION_TYPES])
+    send_parser.add_argument('--burn-after-reading', action='store_true')
+    send_parser.add_argument('--discussion', action='store_true')
+
+    get_parser = subparsers.add_parser('get', help='download and decrypt pastes')
+    get_parser.add_argument('links', nargs='*', help='links of the pastes (default: read from stdin)')
+    get_parser.add_argument('--password', help='the password of the pastes')
+    get_parser.add_argument('--attachments', metavar='DIRECTORY',
+                            help='write attachments to this directory instead of the output')
+
+    delete_parser = subparsers.add_parser('delete', help='delete pastes')
+    delete_parser.add_argument('links', nargs='*',
+                               help='lines of a link and a delete token (default: read from stdin)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'send':
+        args.server = [args.server] + args.servers
+    try:
+        args.proxies = dict(proxy.split('=', 1) for proxy in args.proxy) or None
+    except ValueError:
+        parser.error('proxies must be given as SCHEME=URL')
+    if args.concurrency < 1 or args.processes < 0 or args.retries < 1:
+        parser.error('--concurrency and --retries must be at least 1, and --processes at least 0')
+    return args
+
+
+async def run(args: argparse.Namespace, stdin: TextIO = None, output: TextIO = None) -> bool:
+    """Run a parsed command line.
+
+    :param args: The parsed command line.
+    :param stdin: Where to read inputs from if none were given. If None, standard input is used.
+    :param output: Where to write the results. If None, standard output is used.
+    :return: True if every item succeeded.
+    """
+    inputs = read_inputs(args.files if args.command == 'send' else args.links, stdin or sys.stdin)
+    executor = ProcessPoolExecutor(args.processes) if args.processes else None
+    try:
+        async with AsyncPrivateBinClient(proxies=args.proxies, max_connections=args.concurrency,
+                                         retry_policy=RetryPolicy(attempts=args.retries)) as client:
+            return await COMMANDS[args.command](args, client, executor, inputs, output or sys.stdout)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def main(argv: List[str] = None) -> int:
+    """Run the command line interface.
+
+    :return: 0 if every item succeeded, else 1.
+    """
+    args = parse_args(argv)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return 0 if loop.run_until_complete(run(args)) else 1
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
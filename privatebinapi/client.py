@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""Provides long-lived clients that reuse pooled connections across requests."""
+
+import importlib.util
+from typing import AsyncIterator, Iterable, Iterator, List, Tuple, Union
+
+from privatebinapi.cache import PasteCache
+from privatebinapi.comments import comment, comment_async
+from privatebinapi.common import DEFAULT_HEADERS, BulkResult, RetryPolicy, new_session
+from privatebinapi.dedup import Deduplicator
+from privatebinapi.deletion import delete, delete_async, delete_many, delete_many_async
+from privatebinapi.download import get, get_async, get_many, get_many_async, get_stream, get_stream_async
+from privatebinapi.hostpool import HostPool
+from privatebinapi.results import Comment
+from privatebinapi.upload import send, send_async, send_many, send_many_async
+
+__all__ = ('PrivateBinClient', 'AsyncPrivateBinClient')
+
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+class PrivateBinClient:
+    """A synchronous client which keeps one pooled requests.Session open for all of its requests.
+
+    Connections are kept alive between calls, so only the first request to each host pays for the TCP and TLS
+    handshakes. Use it as a context manager or call close() when finished.
+    """
+
+    def __init__(self, *, proxies: dict = None, pool_connections: int = 10, pool_maxsize: int = 10,
+                 retry_policy: RetryPolicy = None, cache: PasteCache = None,
+                 dedup: Deduplicator = None):
+        """
+        :param proxies: A dict of proxies to pass to the requests.Session object.
+        :param pool_connections: The number of hosts to keep connection pools for.
+        :param pool_maxsize: The maximum number of connections to keep open to each host.
+        :param retry_policy: The RetryPolicy used by every call that does not pass its own.
+        :param cache: The PasteCache used by every get that does not pass its own.
+        :param dedup: The Deduplicator used by every send and send_many that does not pass its own.
+        """
+        self.retry_policy = retry_policy
+        self.cache = cache
+        self.dedup = dedup
+        self.session = new_session(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.headers.update(DEFAULT_HEADERS)
+        if proxies:
+            self.session.proxies.update(proxies)
+
+    def _options(self, kwargs: dict) -> dict:
+        kwargs.setdefault('retry_policy', self.retry_policy)
+        return kwargs
+
+    def send(self, server: Union[str, HostPool], **kwargs) -> dict:
+        """Upload a paste to a PrivateBin host. Accepts the same keyword arguments as privatebinapi.send."""
+        kwargs.setdefault('dedup', self.dedup)
+        return send(server, session=self.session, **self._options(kwargs))
+
+    def send_many(self, server: Union[str, HostPool], items: Iterable[dict], **kwargs) -> Iterator[BulkResult]:
+        """Upload many pastes to a PrivateBin host. Accepts the same keyword arguments as privatebinapi.send_many."""
+        kwargs.setdefault('dedup', self.dedup)
+        return send_many(server, items, session=self.session, **self._options(kwargs))
+
+    def get(self, url: str, **kwargs) -> dict:
+        """Download a paste from a PrivateBin host. Accepts the same keyword arguments as privatebinapi.get."""
+        kwargs.setdefault('cache', self.cache)
+        return get(url, session=self.session, **self._options(kwargs))
+
+    def get_many(self, urls: Iterable[str], **kwargs) -> Iterator[BulkResult]:
+        """Download many pastes. Accepts the same keyword arguments as privatebinapi.get_many."""
+        return get_many(urls, session=self.session, **self._options(kwargs))
+
+    def get_stream(self, url: str, sink, **kwargs) -> dict:
+        """Download a paste, writing its attachment to sink. Accepts the same keyword arguments as
+        privatebinapi.get_stream."""
+        return get_stream(url, sink, session=self.session, **self._options(kwargs))
+
+    def comment(self, url: str, text: str, **kwargs) -> Comment:
+        """Post a comment on a paste. Accepts the same keyword arguments as privatebinapi.comment."""
+        return comment(url, text, session=self.session, **self._options(kwargs))
+
+    def delete(self, url: str, token: str, **kwargs) -> dict:
+        """Delete a paste from PrivateBin. Accepts the same keyword arguments as privatebinapi.delete."""
+        return delete(url, token, session=self.session, **self._options(kwargs))
+
+    def delete_many(self, items: Iterable[Tuple[str, str]], **kwargs) -> List[BulkResult]:
+        """Delete many pastes. Accepts the same keyword arguments as privatebinapi.delete_many."""
+        return delete_many(items, session=self.session, **self._options(kwargs))
+
+    def close(self):
+        """Close the underlying session and all of its pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncPrivateBinClient:
+    """An asynchronous client which keeps one pooled httpx.AsyncClient open for all of its requests.
+
+    HTTP/2 is used by default when the h2 package is installed. Use it as an async context manager or await
+    aclose() when finished.
+    """
+
+    def __init__(self, *, proxies: dict = None, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 http2: bool = None, retry_policy: RetryPolicy = None, cache: PasteCache = None,
+                 dedup: Deduplicator = None):
+        """
+        :param proxies: A dict of proxies to pass to the httpx.AsyncClient object.
+        :param max_connections: The maximum number of concurrent connections.
+        :param max_keepalive_connections: The maximum number of idle connections to keep alive.
+        :param http2: Whether or not to use HTTP/2. If None, it is used when the h2 package is installed.
+        :param retry_policy: The RetryPolicy used by every call that does not pass its own.
+        :param cache: The PasteCache used by every get that does not pass its own.
+        :param dedup: The Deduplicator used by every send and send_many that does not pass its own.
+        """
+        self.retry_policy = retry_policy
+        self.cache = cache
+        self.dedup = dedup
+        if http2 is None:
+            http2 = HTTP2_AVAILABLE
+        import httpx  # pylint: disable=import-outside-toplevel
+
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.client = httpx.AsyncClient(proxies=proxies, headers=DEFAULT_HEADERS, limits=limits, http2=http2)
+
+    def _options(self, kwargs: dict) -> dict:
+        kwargs.setdefault('retry_policy', self.retry_policy)
+        return kwargs
+
+    async def send(self, server: Union[str, HostPool], **kwargs) -> dict:
+        """Upload a paste to a PrivateBin host. Accepts the same keyword arguments as privatebinapi.send_async."""
+        kwargs.setdefault('dedup', self.dedup)
+        return await send_async(server, client=self.client, **self._options(kwargs))
+
+    def send_many(self, server: Union[str, HostPool], items: Iterable[dict], **kwargs) -> AsyncIterator[BulkResult]:
+        """Upload many pastes to a PrivateBin host. Accepts the same keyword arguments as
+        privatebinapi.send_many_async."""
+        kwargs.setdefault('dedup', self.dedup)
+        return send_many_async(server, items, client=self.client, **self._options(kwargs))
+
+    async def get(self, url: str, **kwargs) -> dict:
+        """Download a paste from a PrivateBin host. Accepts the same keyword arguments as privatebinapi.get_async."""
+        kwargs.setdefault('cache', self.cache)
+        return await get_async(url, client=self.client, **self._options(kwargs))
+
+    def get_many(self, urls: Iterable[str], **kwargs) -> AsyncIterator[BulkResult]:
+        """Download many pastes. Accepts the same keyword arguments as privatebinapi.get_many_async."""
+        return get_many_async(urls, client=self.client, **self._options(kwargs))
+
+    async def get_stream(self, url: str, sink, **kwargs) -> dict:
+        """Download a paste, writing its attachment to sink. Accepts the same keyword arguments as
+        privatebinapi.get_stream_async."""
+        return await get_stream_async(url, sink, client=self.client, **self._options(kwargs))
+
+    async def comment(self, url: str, text: str, **kwargs) -> Comment:
+        """Post a comment on a paste. Accepts the same keyword arguments as privatebinapi.comment_async."""
+        return await comment_async(url, text, client=self.client, **self._options(kwargs))
+
+    async def delete(self, url: str, token: str, **kwargs) -> dict:
+        """Delete a paste from PrivateBin. Accepts the same keyword arguments as privatebinapi.delete_async."""
+        return await delete_async(url, token, client=self.client, **self._options(kwargs))
+
+    async def delete_many(self, items: Iterable[Tuple[str, str]], **kwargs) -> List[BulkResult]:
+        """Delete many pastes. Accepts the same keyword arguments as privatebinapi.delete_many_async."""
+        return await delete_many_async(items, client=self.client, **self._options(kwargs))
+
+    async def aclose(self):
+        """Close the underlying client and all of its pooled connections."""
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
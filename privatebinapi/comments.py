@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""Provides functions to post comments on pastes and to decrypt the discussion a paste is downloaded with.
+
+PrivateBin sends every comment of a paste in the same response as the paste, so a whole discussion is read in one
+request. What takes time is decrypting it: every comment has a salt of its own, so each one needs its own PBKDF2
+derivation. Comments are therefore decrypted in chunks, which an executor can work on side by side.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, List, Sequence, Union
+
+from privatebinapi import hooks
+from privatebinapi.common import DEFAULT_HEADERS, AsyncClientContext, RetryPolicy, call_with_retry, \
+    call_with_retry_async, get_loop, session_context, verify_response, with_timeout
+from privatebinapi.crypto import KeyCache, Paste, get_key_cache
+from privatebinapi.deletion import process_url
+from privatebinapi.results import Comment
+from privatebinapi.serialization import dumps
+
+if TYPE_CHECKING:  # The HTTP libraries are only imported once a request is made
+    import httpx
+    import requests
+
+__all__ = ('comment', 'comment_async')
+
+COMMENT_CHUNK_SIZE = 16
+
+
+def decrypt_comments(comments: Sequence[dict], passphrase: str, password: str = None, *, version: int = 2,
+                     key_cache: KeyCache = None) -> List[Comment]:
+    """Decrypt a batch of comments on a paste.
+
+    Comments in the batch which share a salt only have their key derived once, even if the process-wide key cache is
+    disabled. Anyone can post to an open discussion, so a comment which cannot be decrypted does not fail the batch;
+    it is returned without its text and nickname instead.
+
+    :param comments: The comments, as the host sent them.
+    :param passphrase: The part of the paste's URL trailing the '#'.
+    :param password: Password for decrypting the paste.
+    :param version: The version of the paste.
+    :param key_cache: A KeyCache to derive keys through. If None, the process-wide cache is used if enabled.
+    :return: The decrypted comments, in the same order.
+    """
+    started = hooks.start()
+    if key_cache is None:
+        key_cache = get_key_cache()
+    batch_cache = KeyCache(len(comments)) if key_cache is None and len(comments) > 1 else None
+    paste = Paste(key_cache=key_cache if key_cache is not None else batch_cache)
+    if password:
+        paste.setPassword(password)
+    paste.setVersion(version)
+    paste.setHash(passphrase)
+    output = []
+    try:
+        for data in comments:
+            try:
+                text, nickname = paste.decryptComment(data)
+            except Exception:  # pylint: disable=broad-except
+                text, nickname = None, None
+            output.append(Comment(data, text, nickname))
+    finally:
+        if batch_cache is not None:
+            batch_cache.clear()
+    if started is not None:
+        hooks.finish(started, 'get', 'decrypt', None, version=version, comments=len(comments))
+    return output
+
+
+def split_comments(comments: Sequence[dict], chunk_size: int) -> List[Sequence[dict]]:
+    """Split a discussion into the chunks it is decrypted in.
+
+    :param comments: The comments, as the host sent them.
+    :param chunk_size: How many comments to decrypt in one call.
+    :return: The chunks.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    return [comments[start:start + chunk_size] for start in range(0, len(comments), chunk_size)]
+
+
+def decrypt_discussion(data: dict, passphrase: str, password: str = None, *, executor: Executor = None,
+                       chunk_size: int = COMMENT_CHUNK_SIZE) -> List[Comment]:
+    """Decrypt every comment a paste was downloaded with.
+
+    :param data: The JSON component of a response from a PrivateBin host.
+    :param passphrase: The part of the URL trailing the '#'.
+    :param password: Password for decrypting the paste.
+    :param executor: A concurrent.futures.Executor to decrypt chunks of comments in side by side. If None, they are
+        decrypted in the calling thread.
+    :param chunk_size: How many comments to decrypt in one call.
+    :return: The decrypted comments, in the order the host sent them.
+    """
+    comments = data.get('comments') or []
+    func = functools.partial(decrypt_comments, passphrase=passphrase, password=password, version=data.get('v', 1))
+    if executor is None or len(comments) <= chunk_size:
+        return func(comments)
+    return [item for chunk in executor.map(func, split_comments(comments, chunk_size)) for item in chunk]
+
+
+async def decrypt_discussion_async(data: dict, passphrase: str, password: str = None, *, executor: Executor = None,
+                                   chunk_size: int = COMMENT_CHUNK_SIZE) -> List[Comment]:
+    """Decrypt every comment a paste was downloaded with, in the executor, without blocking the event loop.
+
+    Takes the same arguments as decrypt_discussion, except that if executor is None, the loop's default executor is
+    used.
+    """
+    comments = data.get('comments') or []
+    if not comments:
+        return []
+    loop = get_loop()
+    func = functools.partial(decrypt_comments, passphrase=passphrase, password=password, version=data.get('v', 1))
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(executor, func, chunk) for chunk in split_comments(comments, chunk_size)
+    ))
+    return [item for chunk in chunks for item in chunk]
+
+
+def encrypt_comment(version: int, passphrase: str, text: str, *, paste_id: str, parent_id: str = None,
+                    nickname: str = None, password: str = None) -> Union[bytes, dict]:
+    """Encrypt a comment, ready to POST to the host.
+
+    :param version: The version of the paste. Comments are encrypted the same way as the paste they are on.
+    :param passphrase: The part of the paste's URL trailing the '#'.
+    :param text: The text of the comment.
+    :param paste_id: The ID of the paste.
+    :param parent_id: The ID of the comment to reply to. If None, the comment replies to the paste.
+    :param nickname: The name to post the comment under. If None, it is posted anonymously.
+    :param password: The paste's password, if it has one.
+    :return: The body of the request: JSON bytes for version 2 pastes, or a dict of form fields for version 1 pastes.
+    """
+    started = hooks.start()
+    paste = Paste()
+    if password:
+        paste.setPassword(password)
+    paste.setVersion(version)
+    paste.setHash(passphrase)
+    fields = {**paste.encryptComment(text, nickname), 'pasteid': paste_id, 'parentid': parent_id or paste_id}
+    payload = dumps(fields) if version == 2 else fields
+    if started is not None:
+        hooks.finish(started, 'comment', 'encrypt', None, version=version)
+    return payload
+
+
+def process_comment_response(response: 'Union[requests.Response, httpx.Response]', text: str, *, paste_id: str,
+                             parent_id: str = None, nickname: str = None) -> Comment:
+    """Verify the response to posting a comment.
+
+    :param response: The response from the PrivateBin host.
+    :param text: The text of the comment.
+    :param paste_id: The ID of the paste.
+    :param parent_id: The ID of the comment it replies to, or None.
+    :param nickname: The nickname it was posted under, or None.
+    :return: The comment, as it will be read back.
+    """
+    data = verify_response(response, operation='comment')
+    return Comment({'id': data['id'], 'parentid': parent_id or paste_id}, text, nickname or None)
+
+
+def comment(url: str, text: str, *, nickname: str = None, parent_id: str = None, password: str = None,
+            version: int = None, proxies: dict = None, retry_policy: RetryPolicy = None,
+            session: 'requests.Session' = None) -> Comment:
+    """Post a comment on a paste which has discussion enabled.
+
+    :param url: The full URL of a paste, including passphrase.
+    :param text: The text of the comment.
+    :param nickname: The name to post the comment under. If None, it is posted anonymously.
+    :param parent_id: The ID of the comment to reply to. If None, the comment replies to the paste.
+    :param password: The paste's password, if it has one.
+    :param version: The version of the paste. If None, the paste is downloaded to find it out.
+    :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param retry_policy: How to retry the request if it fails and limit the rate it is made at. If None, it is not.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
+    :return: The comment, with the ID the host gave it.
+    """
+    server, paste_id = process_url(url)
+    passphrase = url[url.find('#') + 1:]
+    with session_context(session) as session:
+        if version is None:
+            data = call_with_retry(
+                lambda: verify_response(session.get(url, headers=DEFAULT_HEADERS, proxies=proxies), operation='get'),
+                server, retry_policy, operation='get'
+            )
+            version = data.get('v', 1)
+        payload = encrypt_comment(version, passphrase, text, paste_id=paste_id, parent_id=parent_id,
+                                  nickname=nickname, password=password)
+
+        def request() -> Comment:
+            response = session.post(server, headers=DEFAULT_HEADERS, proxies=proxies, data=payload)
+            return process_comment_response(response, text, paste_id=paste_id, parent_id=parent_id,
+                                            nickname=nickname)
+
+        return call_with_retry(request, server, retry_policy, idempotent=False, operation='comment')
+
+
+@with_timeout
+async def comment_async(url: str, text: str, *, nickname: str = None, parent_id: str = None, password: str = None,
+                        version: int = None, proxies: dict = None, retry_policy: RetryPolicy = None,
+                        executor: Executor = None, client: 'httpx.AsyncClient' = None) -> Comment:
+    """Asynchronously post a comment on a paste which has discussion enabled.
+
+    :param url: The full URL of a paste, including passphrase.
+    :param text: The text of the comment.
+    :param nickname: The name to post the comment under. If None, it is posted anonymously.
+    :param parent_id: The ID of the comment to reply to. If None, the comment replies to the paste.
+    :param password: The paste's password, if it has one.
+    :param version: The version of the paste. If None, the paste is downloaded to find it out.
+    :param proxies: A dict of proxies to pass to an httpx.AsyncClient object.
+    :param retry_policy: How to retry the request if it fails and limit the rate it is made at. If None, it is not.
+    :param executor: A concurrent.futures.Executor instance used for encryption.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :param timeout: A deadline in seconds for the whole request. If it passes, asyncio.TimeoutError is raised.
+    :return: The comment, with the ID the host gave it.
+    """
+    server, paste_id = process_url(url)
+    passphrase = url[url.find('#') + 1:]
+    async with AsyncClientContext(client, proxies=proxies) as client:
+        if version is None:
+
+            async def fetch() -> dict:
+                return verify_response(await client.get(url, headers=DEFAULT_HEADERS), operation='get')
+
+            version = (await call_with_retry_async(fetch, server, retry_policy, operation='get')).get('v', 1)
+        func = functools.partial(encrypt_comment, version, passphrase, text, paste_id=paste_id, parent_id=parent_id,
+                                 nickname=nickname, password=password)
+        payload = await get_loop().run_in_executor(executor, func)
+
+        async def request() -> Comment:
+            if isinstance(payload, dict):
+                response = await client.post(server, headers=DEFAULT_HEADERS, data=payload)
+            else:
+                response = await client.post(server, headers=DEFAULT_HEADERS, content=payload)
+            return process_comment_response(response, text, paste_id=paste_id, parent_id=parent_id,
+                                            nickname=nickname)
+
+        return await call_with_retry_async(request, server, retry_policy, idempotent=False, operation='comment')
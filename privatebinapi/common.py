@@ -3,31 +3,108 @@
 """This module provides functions and constants used in other modules in this package."""
 
 import asyncio
-import json
-from typing import Union
+import concurrent.futures
+import contextlib
+import email.utils
+import functools
+import random
+import re
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, NamedTuple, \
+    Optional, Pattern, Tuple, TypeVar, Union
+from urllib.parse import urlsplit
 
-import httpx
-import requests
+from privatebinapi import hooks
+from privatebinapi.exceptions import BadServerResponseError, PrivateBinAPIError, ServerUnavailableError
+from privatebinapi.serialization import loads
 
-from privatebinapi.exceptions import BadServerResponseError, PrivateBinAPIError
+if TYPE_CHECKING:  # The HTTP libraries are only imported once a request is made
+    import httpx
+    import requests
 
-__all__ = ('get_loop', 'verify_response', 'DEFAULT_HEADERS')
+__all__ = (
+    'call_with_retry', 'call_with_retry_async', 'check_availability', 'get_loop', 'host_key', 'iterate_in_executor',
+    'loaded_classes', 'new_session', 'run_bounded', 'run_bounded_async', 'session_context', 'verify_response',
+    'with_timeout', 'AsyncClientContext',
+    'BulkResult', 'RateLimiter', 'RetryPolicy', 'DEFAULT_HEADERS'
+)
+
+T = TypeVar('T')
 
 DEFAULT_HEADERS = {'X-Requested-With': 'JSONHttpRequest'}
+UNAVAILABLE_STATUSES = (429, 502, 503, 504)
+# Statuses which mean the request was turned away before a paste could have been created or deleted
+REJECTED_STATUSES = (429, 503)
+RETRYABLE_MESSAGES = (
+    re.compile(r'Please wait (\d+) seconds between each post'),
+)
+TRANSPORT_ERRORS = ('requests.exceptions.RequestException', 'httpx.TransportError')
+CONNECT_ERRORS = ('requests.exceptions.ConnectTimeout', 'httpx.ConnectError', 'httpx.ConnectTimeout')
+
 
+def host_key(server: str) -> str:
+    """Normalize a server URL so that equivalent spellings share one cache entry.
+
+    :param server: The home URL of the PrivateBin host, or the URL of a paste on it.
+    :return: The normalized URL.
+    """
+    parts = urlsplit(server)
+    return '%s://%s%s' % (parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'))
 
-def verify_response(response: Union[requests.Response, httpx.Response]) -> dict:
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header, which holds either a number of seconds or an HTTP date.
+
+    :param value: The value of the header.
+    :return: How many seconds to wait, or None if the header is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+def check_availability(response: 'Union[requests.Response, httpx.Response]'):
+    """Raise ServerUnavailableError if a host turned a request away because it is busy or down.
+
+    :param response: An HTTP response from a PrivateBin host.
+    :raises ServerUnavailableError: The response has a 429, 502, 503 or 504 status.
+    """
+    if response.status_code in UNAVAILABLE_STATUSES:
+        raise ServerUnavailableError(
+            '%s is unavailable (HTTP %d)' % (response.url, response.status_code), status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers.get('Retry-After'))
+        )
+
+
+def verify_response(response: 'Union[requests.Response, httpx.Response]', *, operation: str = None) -> dict:
     """Checks a response to see it it contains JSON.
 
     :param response: An HTTP response from a PrivateBin host.
+    :param operation: 'send', 'get', 'delete' or 'comment', for reporting to hooks.
     :return: The JSON data included in the response.
     """
+    started = hooks.start()
+    if started is not None:
+        hooks.record_response(operation, response)
+    check_availability(response)
     try:
-        data = response.json()
-    except json.JSONDecodeError as error:
+        data = loads(response.content)
+    except ValueError as error:
         raise BadServerResponseError('Unable to parse response from %s' % response.url) from error
     if data['status'] != 0:
         raise PrivateBinAPIError(data['message'])
+    if started is not None:
+        hooks.finish(started, operation, 'verify', str(response.url))
 
     return data
 
@@ -43,3 +120,391 @@ def get_loop():
         return asyncio.get_running_loop()
     except AttributeError:
         return asyncio.get_event_loop()
+
+
+async def iterate_in_executor(iterator: Iterator, executor: concurrent.futures.Executor = None) -> AsyncIterator:
+    """Consume a blocking iterator without blocking the event loop, by advancing it in an executor.
+
+    :param iterator: The iterator to consume.
+    :param executor: The executor to advance the iterator in. If None, the loop's default executor is used.
+    :return: An async iterator over the same items.
+    """
+    finished = object()
+    loop = get_loop()
+    while True:
+        item = await loop.run_in_executor(executor, next, iterator, finished)
+        if item is finished:
+            return
+        yield item
+
+
+def new_session(*, pool_connections: int = 10, pool_maxsize: int = 10) -> 'requests.Session':
+    """Create a requests.Session with a connection pool of the given size.
+
+    :param pool_connections: The number of hosts to keep connection pools for.
+    :param pool_maxsize: The maximum number of connections to keep open to each host.
+    :return: The new session.
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+    from requests.adapters import HTTPAdapter  # pylint: disable=import-outside-toplevel
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@contextlib.contextmanager
+def session_context(session: 'requests.Session' = None, *, pool_maxsize: int = 10):
+    """Provides a requests.Session for the duration of a with block.
+
+    :param session: An existing session to use. If None, a temporary session is opened and closed on exit.
+    :param pool_maxsize: The maximum number of connections per host of a temporary session.
+    :return: A context manager yielding a requests.Session.
+    """
+    if session is not None:
+        yield session
+    else:
+        with new_session(pool_maxsize=pool_maxsize) as temporary_session:
+            yield temporary_session
+
+
+class AsyncClientContext:
+    """Provides an httpx.AsyncClient for the duration of an async with block.
+
+    If no client is given, a temporary one is opened and closed on exit. This is a class rather than an
+    asynccontextmanager because Python 3.6 is still supported.
+    """
+
+    def __init__(self, client: 'httpx.AsyncClient' = None, *, proxies: dict = None):
+        self.client = client
+        self.proxies = proxies
+        self._owned = None
+
+    async def __aenter__(self) -> 'httpx.AsyncClient':
+        if self.client is not None:
+            return self.client
+        import httpx  # pylint: disable=import-outside-toplevel
+
+        self._owned = httpx.AsyncClient(proxies=self.proxies, headers=DEFAULT_HEADERS)
+        return self._owned
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._owned is not None:
+            await self._owned.aclose()
+            self._owned = None
+
+
+class BulkResult(NamedTuple):
+    """The outcome of one item of a bulk operation.
+
+    Exactly one of result and error is set.
+    """
+    index: int
+    result: Any
+    error: Optional[BaseException]
+
+
+def run_bounded(executor: concurrent.futures.Executor, func: Callable, items: Iterable,
+                concurrency: int) -> Iterator[BulkResult]:
+    """Call func on each item in an executor, with at most concurrency calls in flight at once.
+
+    Items are pulled from the iterable lazily, so it may be arbitrarily long.
+
+    :param executor: The executor to run the calls in.
+    :param func: The function to call with each item.
+    :param items: The items to process.
+    :param concurrency: The maximum number of calls in flight.
+    :return: An iterator of BulkResults in the order they complete.
+    """
+    iterator = enumerate(items)
+    pending = {}
+    try:
+        while True:
+            for index, item in iterator:
+                pending[executor.submit(func, item)] = index
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                error = future.exception()
+                yield BulkResult(index, None if error else future.result(), error)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def run_bounded_async(func: Callable[[Any], Awaitable], items: Iterable,
+                            concurrency: int) -> AsyncIterator[BulkResult]:
+    """Await func for each item, with at most concurrency coroutines running at once.
+
+    Items are pulled from the iterable lazily, so it may be arbitrarily long.
+
+    :param func: The coroutine function to call with each item.
+    :param items: The items to process.
+    :param concurrency: The maximum number of coroutines running at once.
+    :return: An async iterator of BulkResults in the order they complete.
+    """
+    iterator = enumerate(items)
+    pending = {}
+    try:
+        while True:
+            for index, item in iterator:
+                pending[asyncio.ensure_future(func(item))] = index
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                error = future.exception()
+                yield BulkResult(index, None if error else future.result(), error)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class RateLimiter:
+    """A token bucket for each host, shared by every thread and task that holds a reference to it.
+
+    Each request takes a token. Tokens refill at rate per second, up to burst. A request that finds the bucket empty
+    reserves the next token and waits for it, so waiting callers are served in order.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: The sustained number of requests per second allowed to each host.
+        :param burst: How many requests may be made at once after a quiet period.
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _refill(self, key: str, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def reserve(self, server: str) -> float:
+        """Take a token from a host's bucket.
+
+        :param server: The URL of the PrivateBin host, or of a paste on it.
+        :return: How many seconds to wait before the token may be used.
+        """
+        key = host_key(server)
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._refill(key, now) - 1
+            self._buckets[key] = (tokens, now)
+        return max(-tokens / self.rate, 0.0)
+
+    def defer(self, server: str, seconds: float):
+        """Hold back every request to a host for a while, such as when it responds with Retry-After.
+
+        :param server: The URL of the PrivateBin host, or of a paste on it.
+        :param seconds: How long to hold requests back for.
+        """
+        key = host_key(server)
+        now = time.monotonic()
+        with self._lock:
+            self._buckets[key] = (min(self._refill(key, now), 1 - seconds * self.rate), now)
+
+    def acquire(self, server: str):
+        """Wait for a token from a host's bucket.
+
+        :param server: The URL of the PrivateBin host, or of a paste on it.
+        """
+        delay = self.reserve(server)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, server: str):
+        """Wait for a token from a host's bucket without blocking the event loop.
+
+        :param server: The URL of the PrivateBin host, or of a paste on it.
+        """
+        delay = self.reserve(server)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def loaded_classes(*paths: str) -> Tuple[type, ...]:
+    """Look up classes by their dotted paths, leaving out those whose module has not been imported.
+
+    An exception can only have been raised by a library that is already imported, so matching against the exceptions
+    of requests and httpx this way never imports either of them.
+
+    :param paths: Paths such as 'httpx.ConnectError'.
+    :return: The classes that were found.
+    """
+    classes = []
+    for path in paths:
+        module, _, name = path.rpartition('.')
+        cls = getattr(sys.modules.get(module), name, None)
+        if cls is not None:
+            classes.append(cls)
+    return tuple(classes)
+
+
+def connection_failed(error: BaseException) -> bool:
+    """Whether an exception means that a request never reached the host, so it is safe to repeat even if it is not
+    idempotent.
+
+    :param error: The exception raised by requests or httpx.
+    :return: True if the connection could not be established.
+    """
+    if isinstance(error, loaded_classes(*CONNECT_ERRORS)):
+        return True
+    if isinstance(error, loaded_classes('requests.exceptions.ConnectionError')) and error.args:
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, loaded_classes('urllib3.exceptions.NewConnectionError'))
+    return False
+
+
+class RetryPolicy(NamedTuple):
+    """How failed requests are retried, and optionally how fast requests may be made to each host.
+
+    Retries back off exponentially with full jitter, unless the host says how long to wait with Retry-After or one of
+    the retryable messages. Requests that may have changed something on the host, like creating or deleting a paste,
+    are only retried when the host is known to have turned them away.
+    """
+    attempts: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+    max_retry_after: float = 120.0
+    statuses: Tuple[int, ...] = UNAVAILABLE_STATUSES
+    messages: Tuple[Pattern, ...] = RETRYABLE_MESSAGES
+    rate_limiter: Optional[RateLimiter] = None
+
+    def classify(self, error: BaseException, idempotent: bool = True) -> Tuple[bool, Optional[float]]:
+        """Decide whether a failed request can be retried.
+
+        :param error: The exception the request raised.
+        :param idempotent: Whether or not the request can safely be repeated after reaching the host.
+        :return: A tuple of whether it can be retried and how many seconds the host asked to wait, if it did.
+        """
+        if isinstance(error, ServerUnavailableError):
+            statuses = self.statuses if idempotent else [status for status in self.statuses
+                                                         if status in REJECTED_STATUSES]
+            return error.status_code in statuses, error.retry_after
+        if isinstance(error, PrivateBinAPIError):
+            for pattern in self.messages:
+                match = pattern.search(str(error))
+                if match:
+                    return True, float(match.group(1)) if match.groups() else None
+            return False, None
+        if isinstance(error, loaded_classes(*TRANSPORT_ERRORS)):
+            return idempotent or connection_failed(error), None
+        return False, None
+
+    def delay(self, error: BaseException, attempt: int, idempotent: bool = True) -> Optional[float]:
+        """Work out how long to wait before retrying a failed request.
+
+        :param error: The exception the request raised.
+        :param attempt: How many times the request has failed before, starting from 0.
+        :param idempotent: Whether or not the request can safely be repeated after reaching the host.
+        :return: The number of seconds to wait, or None if the request should not be retried.
+        """
+        if attempt + 1 >= self.attempts:
+            return None
+        retryable, retry_after = self.classify(error, idempotent)
+        if not retryable:
+            return None
+        jitter = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after is None:
+            return jitter
+        if retry_after > self.max_retry_after:
+            return None
+        return retry_after + jitter * 0.1
+
+
+def call_with_retry(func: Callable[[], T], server: str, policy: Optional[RetryPolicy], *,
+                    idempotent: bool = True, operation: str = None) -> T:
+    """Call a function which makes a request, retrying it according to a policy.
+
+    :param func: The function to call.
+    :param server: The URL the request is made to, used for rate limiting.
+    :param policy: The RetryPolicy to follow. If None, func is called once.
+    :param idempotent: Whether or not the request can safely be repeated after reaching the host.
+    :param operation: 'send', 'get', 'delete' or 'comment', for reporting retries to hooks.
+    :return: The return value of func.
+    """
+    if policy is None:
+        return func()
+    attempt = 0
+    while True:
+        if policy.rate_limiter is not None:
+            policy.rate_limiter.acquire(server)
+        try:
+            return func()
+        except Exception as error:  # pylint: disable=broad-except
+            delay = policy.delay(error, attempt, idempotent)
+            if delay is None:
+                raise
+            # When the host asks for a pause, every request to it waits, not just this one
+            deferred = policy.rate_limiter is not None and policy.classify(error, idempotent)[1] is not None
+            if deferred:
+                policy.rate_limiter.defer(server, delay)
+            hooks.emit(operation, 'retry', server, delay, attempt=attempt + 1, error=error, deferred=deferred)
+        if not deferred:
+            time.sleep(delay)
+        attempt += 1
+
+
+async def call_with_retry_async(func: Callable[[], Awaitable[T]], server: str, policy: Optional[RetryPolicy], *,
+                                idempotent: bool = True, operation: str = None) -> T:
+    """Await a coroutine function which makes a request, retrying it according to a policy.
+
+    :param func: The coroutine function to call.
+    :param server: The URL the request is made to, used for rate limiting.
+    :param policy: The RetryPolicy to follow. If None, func is awaited once.
+    :param idempotent: Whether or not the request can safely be repeated after reaching the host.
+    :param operation: 'send', 'get', 'delete' or 'comment', for reporting retries to hooks.
+    :return: The return value of func.
+    """
+    if policy is None:
+        return await func()
+    attempt = 0
+    while True:
+        if policy.rate_limiter is not None:
+            await policy.rate_limiter.acquire_async(server)
+        try:
+            return await func()
+        except Exception as error:  # pylint: disable=broad-except
+            delay = policy.delay(error, attempt, idempotent)
+            if delay is None:
+                raise
+            # When the host asks for a pause, every request to it waits, not just this one
+            deferred = policy.rate_limiter is not None and policy.classify(error, idempotent)[1] is not None
+            if deferred:
+                policy.rate_limiter.defer(server, delay)
+            hooks.emit(operation, 'retry', server, delay, attempt=attempt + 1, error=error, deferred=deferred)
+        if not deferred:
+            await asyncio.sleep(delay)
+        attempt += 1
+
+
+def with_timeout(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Give a coroutine function a timeout keyword argument, a deadline in seconds for the whole call.
+
+    The deadline covers every request and retry the call makes. When it passes, the call is cancelled with
+    asyncio.wait_for, which works with any event loop, and asyncio.TimeoutError is raised. Work already handed to an
+    executor is left to finish, but its result is dropped.
+
+    :param func: The coroutine function.
+    :return: The wrapped coroutine function. If timeout is None, it has no deadline.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, timeout: float = None, **kwargs) -> T:
+        if timeout is None:
+            return await func(*args, **kwargs)
+        return await asyncio.wait_for(func(*args, **kwargs), timeout)
+
+    return wrapper
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""Chooses how the plaintext of a paste is deflated before it is encrypted."""
+
+import math
+import os
+import zlib
+from collections import Counter
+from typing import NamedTuple, Optional
+
+__all__ = ('Deflate', 'byte_entropy', 'choose_deflate', 'sample_entropy')
+
+COMPRESSION_TYPES = ('zlib', 'auto', None)
+COMPRESSION_LEVELS = tuple(range(-1, 10))
+DEFAULT_LEVEL = zlib.Z_DEFAULT_COMPRESSION
+ENTROPY_THRESHOLD = 7.5  # Bits per byte. Compressed and encrypted data sits just under 8.
+SAMPLE_SIZE = 2 ** 14
+SAMPLE_COUNT = 4
+
+
+class Deflate(NamedTuple):
+    """Settings for the raw deflate stream that PrivateBin calls 'zlib' compression.
+
+    Every level and strategy produces a stream that any PrivateBin client can inflate, so they can be chosen freely.
+    """
+    level: int = DEFAULT_LEVEL
+    strategy: int = zlib.Z_DEFAULT_STRATEGY
+
+    def compressobj(self):
+        """Create a compressor for these settings.
+
+        :return: A zlib compression object producing a raw deflate stream.
+        """
+        return zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, self.strategy)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress data in one go.
+
+        :param data: The data to compress.
+        :return: The raw deflate stream.
+        """
+        compressor = self.compressobj()
+        return compressor.compress(data) + compressor.flush()
+
+
+def byte_entropy(data: bytes) -> float:
+    """Calculate the Shannon entropy of some data.
+
+    :param data: The data to measure.
+    :return: The entropy in bits per byte, between 0 and 8.
+    """
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+def sample_entropy(file, sample_size: int = SAMPLE_SIZE, samples: int = SAMPLE_COUNT) -> float:
+    """Estimate the entropy of a file from a few blocks spread evenly through it, without reading all of it.
+
+    :param file: The path of the file, or its content as a bytes-like object.
+    :param sample_size: The size of each block in bytes.
+    :param samples: The number of blocks to read.
+    :return: The lowest entropy of any block in bits per byte, so that a compressible section is not missed.
+    """
+    if not isinstance(file, (str, os.PathLike)):
+        with memoryview(file) as view:
+            view = view.cast('B') if view.ndim != 1 or view.format != 'B' else view
+            size = view.nbytes
+            step = max((size - sample_size) // max(samples - 1, 1), 1)
+            return min(
+                byte_entropy(bytes(view[offset:offset + sample_size]))
+                for offset in range(0, max(size - sample_size, 0) + 1, step)[:samples]
+            )
+    size = os.path.getsize(file)
+    step = max((size - sample_size) // max(samples - 1, 1), 1)
+    entropies = []
+    with open(file, 'rb') as data:
+        for offset in range(0, max(size - sample_size, 0) + 1, step)[:samples]:
+            data.seek(offset)
+            entropies.append(byte_entropy(data.read(sample_size)))
+    return min(entropies)
+
+
+def choose_deflate(compression: Optional[str], level: int = DEFAULT_LEVEL, *, text: str = None,
+                   file=None) -> Optional[Deflate]:
+    """Pick the deflate settings for a paste.
+
+    With 'auto', a paste whose attachment (or text, if it has none) looks like it has already been compressed is
+    deflated with Huffman coding only. The attachment travels base64 encoded, which Huffman coding alone shrinks back
+    by a quarter, but searching already compressed data for repeated strings is wasted work.
+
+    :param compression: 'zlib', 'auto' or None.
+    :param level: The zlib compression level, from 0 (store) to 9, or -1 for zlib's default.
+    :param text: The text content of the paste.
+    :param file: The path of a file to attach to the paste, or its content as a bytes-like object.
+    :return: The deflate settings, or None if the paste should not be compressed.
+    """
+    if compression is None:
+        return None
+    if compression == 'auto' and level != 0:
+        if file:
+            entropy = sample_entropy(file)
+        else:
+            entropy = byte_entropy((text or '').encode()[:SAMPLE_SIZE])
+        if entropy >= ENTROPY_THRESHOLD:
+            return Deflate(level, zlib.Z_HUFFMAN_ONLY)
+    return Deflate(level)
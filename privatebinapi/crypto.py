@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+
+"""Provides the version 2 PrivateBin cipher as incremental, chunk at a time operations."""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, Optional, Tuple
+import zlib
+
+from pbincli import format as pbincli_format
+from pbincli.format import AES, CIPHER_BLOCK_BITS, CIPHER_ITERATION_COUNT, CIPHER_TAG_BITS, get_random_bytes
+from pbincli.utils import json_encode
+from sjcl import SJCL
+
+from privatebinapi.compression import Deflate
+
+__all__ = (
+    'Base64Decoder', 'Base64Encoder', 'KeyCache', 'Paste', 'StreamDecryptor', 'clear_key_cache', 'derive_key',
+    'disable_key_cache', 'enable_key_cache', 'encrypt_stream', 'get_key_cache', 'make_adata', 'make_spec',
+    'new_key'
+)
+
+KEY_BYTES = CIPHER_BLOCK_BITS // 8
+TAG_BYTES = CIPHER_TAG_BITS // 8
+DEFAULT_KEY_CACHE_SIZE = 256
+
+
+def new_key() -> bytes:
+    """Generate a random paste key, the secret that ends up after the '#' of a paste's URL.
+
+    :return: The key.
+    """
+    return get_random_bytes(KEY_BYTES)
+
+
+class KeyCache:
+    """A thread-safe, bounded LRU cache of derived paste keys.
+
+    Entries are looked up by an HMAC of the paste key, password, salt, iteration count and key length under a
+    secret that never leaves the process, so neither the paste key nor the password is kept as a dict key. The
+    derived keys are held in bytearrays, which clear() overwrites with zeros before dropping them.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_KEY_CACHE_SIZE):
+        """
+        :param maxsize: The maximum number of derived keys to hold.
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        self._entries: OrderedDict[bytes, bytearray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _fingerprint(self, key: bytes, password: str, salt: bytes, iterations: int, length: int) -> bytes:
+        mac = hmac.new(self._secret, digestmod=hashlib.sha256)
+        for part in (key, password.encode(), salt):
+            mac.update(len(part).to_bytes(4, 'big') + part)
+        mac.update(iterations.to_bytes(8, 'big') + length.to_bytes(4, 'big'))
+        return mac.digest()
+
+    def derive(self, key: bytes, password: str, salt: bytes, iterations: int = CIPHER_ITERATION_COUNT,
+               length: int = KEY_BYTES) -> bytes:
+        """Derive a paste's AES key, reusing the result of an earlier identical derivation if there is one.
+
+        Takes the same arguments as derive_key.
+
+        :return: The derived key.
+        """
+        derived = self.lookup(key, password, salt, iterations, length)
+        if derived is not None:
+            return derived
+        with self._lock:
+            self.misses += 1
+        derived = hashlib.pbkdf2_hmac('sha256', key + password.encode(), salt, iterations, length)
+        self.store(key, password, salt, iterations, length, derived)
+        return derived
+
+    def lookup(self, key: bytes, password: str, salt: bytes, iterations: int = CIPHER_ITERATION_COUNT,
+               length: int = KEY_BYTES) -> Optional[bytes]:
+        """Find the result of an earlier identical derivation without deriving the key if there is none.
+
+        Takes the same arguments as derive_key.
+
+        :return: The derived key, or None if it is not cached.
+        """
+        fingerprint = self._fingerprint(key, password, salt, iterations, length)
+        with self._lock:
+            derived = self._entries.get(fingerprint)
+            if derived is None:
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return bytes(derived)
+
+    def store(self, key: bytes, password: str, salt: bytes, iterations: int, length: int, derived: bytes):
+        """Cache a key that was derived elsewhere, such as in another process.
+
+        :param derived: The key derived from the other arguments, which are the same as derive_key's.
+        """
+        fingerprint = self._fingerprint(key, password, salt, iterations, length)
+        with self._lock:
+            self._entries[fingerprint] = bytearray(derived)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                _wipe(self._entries.popitem(last=False)[1])
+
+    def clear(self):
+        """Overwrite every cached key with zeros and empty the cache."""
+        with self._lock:
+            while self._entries:
+                _wipe(self._entries.popitem()[1])
+
+
+def _wipe(buffer: bytearray):
+    buffer[:] = bytes(len(buffer))
+
+
+_key_cache: Optional[KeyCache] = None
+
+
+def enable_key_cache(maxsize: int = DEFAULT_KEY_CACHE_SIZE) -> KeyCache:
+    """Start caching the keys derived when decrypting pastes, for the rest of the process.
+
+    Deriving a key takes 100000 rounds of PBKDF2, which dominates the cost of decrypting a paste. Enabling the cache
+    lets pastes that share a key, password and salt skip it. Any existing cache is wiped and replaced.
+
+    :param maxsize: The maximum number of derived keys to hold.
+    :return: The new cache.
+    """
+    global _key_cache  # pylint: disable=global-statement
+    cache = KeyCache(maxsize)
+    if _key_cache is not None:
+        _key_cache.clear()
+    _key_cache = cache
+    return cache
+
+
+def disable_key_cache():
+    """Wipe the process-wide key cache and stop caching."""
+    global _key_cache  # pylint: disable=global-statement
+    if _key_cache is not None:
+        _key_cache.clear()
+    _key_cache = None
+
+
+def clear_key_cache():
+    """Wipe every key held by the process-wide key cache, leaving it enabled."""
+    if _key_cache is not None:
+        _key_cache.clear()
+
+
+def get_key_cache() -> Optional[KeyCache]:
+    """Get the process-wide key cache.
+
+    :return: The cache, or None if it has not been enabled.
+    """
+    return _key_cache
+
+
+def derive_key(key: bytes, password: str, salt: bytes, iterations: int = CIPHER_ITERATION_COUNT,
+               length: int = KEY_BYTES, cache: KeyCache = None) -> bytes:
+    """Derive the AES key of a paste with PBKDF2-HMAC-SHA256.
+
+    :param key: The paste key.
+    :param password: The paste's password, or an empty string.
+    :param salt: The salt stored in the paste's adata.
+    :param iterations: The PBKDF2 iteration count stored in the paste's adata.
+    :param length: The length of the derived key in bytes.
+    :param cache: A KeyCache to look the key up in. If None, the key is always derived.
+    :return: The derived key.
+    """
+    if cache is not None:
+        return cache.derive(key, password, salt, iterations, length)
+    return hashlib.pbkdf2_hmac('sha256', key + password.encode(), salt, iterations, length)
+
+
+class Paste(pbincli_format.Paste):
+    """A pbincli Paste which derives its key with hashlib, optionally through a KeyCache, and compresses version 2
+    pastes with configurable deflate settings.
+
+    hashlib's PBKDF2 runs in C, where pbincli's runs its HMAC rounds in Python. Once the paste is encrypted,
+    compression_sizes holds the size of its message before and after compression.
+    """
+
+    def __init__(self, key_cache: KeyCache = None, deflate: Deflate = None):
+        """
+        :param key_cache: A KeyCache to derive the key through. If None, the key is always derived.
+        :param deflate: The deflate settings used for 'zlib' compression. If None, zlib's defaults are used.
+        """
+        super().__init__()
+        self.key_cache = key_cache
+        self.deflate = deflate or Deflate()
+        self.compression_sizes: Optional[Tuple[int, int]] = None
+
+    @property
+    def data(self) -> dict:
+        """The paste's JSON data, before serialization."""
+        return self._data
+
+    def setAttachmentContent(self, content, name: str, mimetype: str):  # pylint: disable=invalid-name
+        """Attach a file from a bytes-like object, where pbincli's setAttachment only reads paths.
+
+        :param content: The content of the file.
+        :param name: The name of the file.
+        :param mimetype: The MIME type of the file.
+        """
+        self._attachment = 'data:' + mimetype + ';base64,' + base64.b64encode(content).decode('ascii')
+        self._attachment_name = name
+
+    def _Paste__compress(self, s: bytes) -> bytes:  # pylint: disable=invalid-name
+        if self._version == 2 and self._compression == 'zlib':
+            compressed = self.deflate.compress(s)
+        else:
+            compressed = super()._Paste__compress(s)
+        self.compression_sizes = (len(s), len(compressed))
+        return compressed
+
+    def _Paste__deriveKey(self, salt: bytes) -> bytes:  # pylint: disable=invalid-name
+        return derive_key(self._key, self._password, salt, self._iteration_count, self._block_bits // 8,
+                          cache=self.key_cache)
+
+    def encryptComment(self, comment: str, nickname: str = None) -> dict:  # pylint: disable=invalid-name
+        """Encrypt a comment on the paste the way PrivateBin's own client does.
+
+        The version, hash and password of the paste must be set first. Each version 2 comment gets an IV and salt of
+        its own, and its adata is the bare cipher parameters rather than the paste's full adata.
+
+        :param comment: The text of the comment.
+        :param nickname: The name to post it under, or None.
+        :return: The encrypted fields of the comment, without the paste and parent IDs.
+        """
+        if self._version == 2:
+            iv = get_random_bytes(TAG_BYTES)
+            salt = get_random_bytes(self._salt_bytes)
+            spec = make_spec(iv, salt, self._compression)
+            message = {'comment': comment}
+            if nickname:
+                message['nickname'] = nickname
+            cipher = self._Paste__initializeCipher(self._Paste__deriveKey(salt), iv, spec, TAG_BYTES)
+            ciphertext, tag = cipher.encrypt_and_digest(self._Paste__compress(json_encode(message)))
+            return {'v': 2, 'adata': spec, 'ct': base64.b64encode(ciphertext + tag).decode(), 'meta': {}}
+
+        password = self._Paste__preparePassKey()
+        fields = {'data': self._encrypt_sjcl(comment, password)}
+        if nickname:
+            fields['nickname'] = self._encrypt_sjcl(nickname, password)
+        return fields
+
+    def decryptComment(self, data: dict) -> Tuple[str, Optional[str]]:  # pylint: disable=invalid-name
+        """Decrypt a comment on the paste. The version, hash and password of the paste must be set first.
+
+        :param data: The comment, as the host sent it.
+        :return: The text of the comment and the nickname it was posted under, or None if it has none.
+        """
+        if self._version == 2:
+            spec = data['adata'][0] if isinstance(data['adata'][0], list) else data['adata']
+            self._iteration_count, self._block_bits, self._tag_bits = int(spec[2]), int(spec[3]), int(spec[4])
+            self._compression = spec[7]
+            tag_bytes = self._tag_bits // 8
+            key = self._Paste__deriveKey(base64.b64decode(spec[1]))
+            cipher = self._Paste__initializeCipher(key, base64.b64decode(spec[0]), data['adata'], tag_bytes)
+            ciphertext = base64.b64decode(data['ct'])
+            message = json.loads(self._Paste__decompress(
+                cipher.decrypt_and_verify(ciphertext[:-tag_bytes], ciphertext[-tag_bytes:])
+            ))
+            return message['comment'], message.get('nickname') or None
+
+        password = self._Paste__preparePassKey()
+        nickname = data.get('nickname') or (data.get('meta') or {}).get('nickname')
+        text = self._decrypt_sjcl(data['data'], password)
+        return text, self._decrypt_sjcl(nickname, password) if nickname else None
+
+    def _encrypt_sjcl(self, text: str, password: bytes) -> str:
+        cipher = SJCL().encrypt(self._Paste__compress(text.encode('utf-8')), password, mode='gcm')
+        return json_encode({key: value.decode() if isinstance(value, bytes) else value
+                            for key, value in cipher.items()}).decode()
+
+    def _decrypt_sjcl(self, text: str, password: bytes) -> str:
+        return self._Paste__decompress(SJCL().decrypt(json.loads(text), password).decode()).decode('utf-8')
+
+
+def make_spec(iv: bytes, salt: bytes, compression: str) -> list:
+    """Build the cipher parameters of version 2 pastes and comments.
+
+    :param iv: The AES-GCM nonce.
+    :param salt: The PBKDF2 salt.
+    :param compression: 'zlib' or 'none'.
+    :return: The cipher parameters, as they are sent to the host.
+    """
+    return [
+        base64.b64encode(iv).decode(), base64.b64encode(salt).decode(), CIPHER_ITERATION_COUNT, CIPHER_BLOCK_BITS,
+        CIPHER_TAG_BITS, 'aes', 'gcm', compression
+    ]
+
+
+def make_adata(iv: bytes, salt: bytes, compression: str, formatting: str, discussion: bool,
+               burn_after_reading: bool) -> list:
+    """Build the authenticated data of a version 2 paste.
+
+    :param iv: The AES-GCM nonce.
+    :param salt: The PBKDF2 salt.
+    :param compression: 'zlib' or 'none'.
+    :param formatting: What format the paste should be declared as.
+    :param discussion: Whether or not to enable discussion on the paste.
+    :param burn_after_reading: Whether or not the paste should delete itself immediately after being read.
+    :return: The adata list, as it is sent to the host.
+    """
+    return [make_spec(iv, salt, compression), formatting, int(discussion), int(burn_after_reading)]
+
+
+class Base64Encoder:
+    """Base64 encodes a byte stream which arrives in chunks of any length."""
+
+    def __init__(self):
+        self._remainder = b''
+
+    def encode(self, data: bytes) -> bytes:
+        """Encode as much of the stream as can be encoded so far.
+
+        :param data: The next chunk of the stream.
+        :return: The base64 encoding of every complete 3 byte group received.
+        """
+        data = self._remainder + data
+        cut = len(data) - len(data) % 3
+        self._remainder = data[cut:]
+        return base64.b64encode(data[:cut])
+
+    def flush(self) -> bytes:
+        """Finish the stream.
+
+        :return: The encoding of the remaining bytes, including padding.
+        """
+        data, self._remainder = self._remainder, b''
+        return base64.b64encode(data)
+
+
+class Base64Decoder:
+    """Base64 decodes a text stream which arrives in chunks of any length."""
+
+    def __init__(self):
+        self._remainder = ''
+
+    def decode(self, text: str) -> bytes:
+        """Decode as much of the stream as can be decoded so far.
+
+        :param text: The next chunk of the stream.
+        :return: The bytes encoded by every complete 4 character group received.
+        """
+        text = self._remainder + text
+        cut = len(text) - len(text) % 4
+        self._remainder = text[cut:]
+        return base64.b64decode(text[:cut])
+
+    def flush(self) -> bytes:
+        """Finish the stream.
+
+        :return: The bytes encoded by the remaining characters.
+        """
+        text, self._remainder = self._remainder, ''
+        return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class StreamDecryptor:
+    """Decrypts and decompresses the base64 encoded ciphertext of a version 2 paste one chunk at a time.
+
+    Nothing returned by update() may be trusted until finish() has checked the authentication tag.
+    """
+
+    def __init__(self, key: bytes, password: str, adata: List, key_cache: KeyCache = None):
+        """
+        :param key: The paste key.
+        :param password: The paste's password, or an empty string.
+        :param adata: The paste's authenticated data.
+        :param key_cache: A KeyCache to derive the key through. If None, the process-wide cache is used if enabled.
+        """
+        spec = adata[0]
+        self._tag_bytes = spec[4] // 8
+        derived = derive_key(key, password, base64.b64decode(spec[1]), spec[2], spec[3] // 8,
+                             cache=key_cache if key_cache is not None else _key_cache)
+        self._cipher = AES.new(derived, AES.MODE_GCM, nonce=base64.b64decode(spec[0]), mac_len=self._tag_bytes)
+        self._cipher.update(json_encode(adata))
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if spec[7] == 'zlib' else None
+        self._decoder = Base64Decoder()
+        self._tail = b''
+
+    def _inflate(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data) if self._decompressor is not None else data
+
+    def update(self, text: str) -> bytes:
+        """Decrypt the next chunk of the ciphertext.
+
+        The last bytes received are held back, since they may turn out to be the authentication tag.
+
+        :param text: The next chunk of the base64 encoded ciphertext.
+        :return: The plaintext decrypted so far.
+        """
+        data = self._tail + self._decoder.decode(text)
+        cut = len(data) - self._tag_bytes
+        if cut <= 0:
+            self._tail = data
+            return b''
+        self._tail = data[cut:]
+        return self._inflate(self._cipher.decrypt(data[:cut]))
+
+    def finish(self) -> bytes:
+        """Decrypt the rest of the ciphertext and verify the authentication tag.
+
+        :return: The remaining plaintext.
+        :raises ValueError: The ciphertext or authenticated data has been tampered with, or the key is wrong.
+        """
+        data = self._tail + self._decoder.flush()
+        cut = len(data) - self._tag_bytes
+        plaintext = self._inflate(self._cipher.decrypt(data[:cut]))
+        self._cipher.verify(data[cut:])
+        if self._decompressor is not None:
+            plaintext += self._decompressor.flush()
+        return plaintext
+
+
+def encrypt_stream(chunks: Iterable[bytes], *, key: bytes, password: str, iv: bytes, salt: bytes, adata: List,
+                   deflate: Deflate = None) -> Iterator[bytes]:
+    """Compress and encrypt a paste's plaintext message one chunk at a time.
+
+    Only one chunk is held in memory at once. The compression type is taken from the adata.
+
+    :param chunks: The serialized JSON plaintext message, in chunks.
+    :param key: The paste key.
+    :param password: The paste's password, or an empty string.
+    :param iv: The AES-GCM nonce stored in the adata.
+    :param salt: The PBKDF2 salt stored in the adata.
+    :param adata: The paste's authenticated data, from make_adata.
+    :param deflate: The deflate settings used for 'zlib' compression. If None, zlib's defaults are used.
+    :return: An iterator over the base64 encoded ciphertext followed by the authentication tag.
+    """
+    cipher = AES.new(derive_key(key, password, salt), AES.MODE_GCM, nonce=iv, mac_len=TAG_BYTES)
+    cipher.update(json_encode(adata))
+    compressor = (deflate or Deflate()).compressobj() if adata[0][7] == 'zlib' else None
+    encoder = Base64Encoder()
+
+    for chunk in chunks:
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield encoder.encode(cipher.encrypt(chunk))
+    if compressor is not None:
+        yield encoder.encode(cipher.encrypt(compressor.flush()))
+    yield encoder.encode(cipher.digest()) + encoder.flush()
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""Avoids uploading the same paste twice, by remembering what was uploaded under a keyed hash of its content.
+
+The index holds the full URL of every paste it remembers, passphrase included, so it must be kept as private as the
+pastes themselves.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple, Union
+
+from privatebinapi.attachments import FileSource, attachment_name, guess_mimetype, is_file_object, is_path
+from privatebinapi.common import host_key
+from privatebinapi.results import UploadResult
+
+__all__ = ('Deduplicator', 'MemoryIndex', 'SQLiteIndex')
+
+DEFAULT_MAXSIZE = 4096
+DEFAULT_MARGIN = 60.0
+CHUNK_SIZE = 2 ** 20
+# How long PrivateBin keeps a paste for each expiration option
+EXPIRATION_SECONDS = {
+    '5min': 300, '10min': 600, '1hour': 3600, '1day': 86400, '1week': 604800, '1month': 2592000, '1year': 31536000,
+    'never': None
+}
+
+
+def _record(result: UploadResult) -> dict:
+    data = {key: value for key, value in result.items() if key not in ('full_url', 'passcode')}
+    return {'data': data, 'server': result.server, 'passcode': result.passcode}
+
+
+class MemoryIndex:
+    """Remembers the most recent uploads in memory, for as long as the process lives."""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE):
+        """
+        :param maxsize: The maximum number of uploads to remember.
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, Tuple[dict, Optional[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, fingerprint: bytes) -> Optional[Tuple[dict, Optional[float]]]:
+        """Look up an upload.
+
+        :param fingerprint: The fingerprint of the paste's content.
+        :return: The record of the upload and when the paste expires, or None if there is none.
+        """
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                self._entries.move_to_end(fingerprint)
+            return entry
+
+    def put(self, fingerprint: bytes, record: dict, expires: Optional[float]):
+        """Remember an upload, replacing any earlier one with the same fingerprint.
+
+        :param fingerprint: The fingerprint of the paste's content.
+        :param record: What is needed to rebuild the UploadResult.
+        :param expires: When the paste expires, as a time.time() timestamp, or None if it never does.
+        """
+        with self._lock:
+            self._entries[fingerprint] = (record, expires)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def remove(self, fingerprint: bytes):
+        """Forget an upload, if it is remembered.
+
+        :param fingerprint: The fingerprint of the paste's content.
+        """
+        with self._lock:
+            self._entries.pop(fingerprint, None)
+
+    def clear(self):
+        """Forget every upload."""
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteIndex:
+    """Remembers uploads in an SQLite database, so that they are shared between processes and runs.
+
+    Pass the same key to every Deduplicator using the database, or their fingerprints will not match.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        """
+        :param path: The path of the database file. It is created if it does not exist.
+        """
+        self.path = os.fspath(path)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS uploads (fingerprint BLOB PRIMARY KEY, record TEXT NOT NULL, expires REAL)'
+            )
+
+    def get(self, fingerprint: bytes) -> Optional[Tuple[dict, Optional[float]]]:
+        """Look up an upload. Takes the same arguments as MemoryIndex.get."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT record, expires FROM uploads WHERE fingerprint = ?', (fingerprint,)
+            ).fetchone()
+        return None if row is None else (json.loads(row[0]), row[1])
+
+    def put(self, fingerprint: bytes, record: dict, expires: Optional[float]):
+        """Remember an upload. Takes the same arguments as MemoryIndex.put."""
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO uploads (fingerprint, record, expires) VALUES (?, ?, ?)',
+                (fingerprint, json.dumps(record), expires)
+            )
+
+    def remove(self, fingerprint: bytes):
+        """Forget an upload. Takes the same arguments as MemoryIndex.remove."""
+        with self._lock:
+            self._connection.execute('DELETE FROM uploads WHERE fingerprint = ?', (fingerprint,))
+
+    def clear(self):
+        """Forget every upload."""
+        with self._lock:
+            self._connection.execute('DELETE FROM uploads')
+
+    def prune(self) -> int:
+        """Forget the uploads of every expired paste.
+
+        :return: The number of uploads forgotten.
+        """
+        with self._lock:
+            return self._connection.execute(
+                'DELETE FROM uploads WHERE expires IS NOT NULL AND expires <= ?', (time.time(),)
+            ).rowcount
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+
+class Deduplicator:
+    """Returns the earlier upload of an identical paste instead of uploading it again, while that paste lives.
+
+    Pastes are identified by an HMAC of their host, text, attachment, password, expiration, formatting and discussion
+    setting, so changing any of them makes a new paste. Pastes which burn after reading are never deduplicated.
+    """
+
+    def __init__(self, index: Union[MemoryIndex, SQLiteIndex] = None, *, key: bytes = None,
+                 margin: float = DEFAULT_MARGIN):
+        """
+        :param index: Where to remember uploads. If None, a new MemoryIndex is used.
+        :param key: The HMAC key of the fingerprints. If None, a random one is used, so only this Deduplicator can
+            match them.
+        :param margin: How many seconds before a paste expires to stop handing it out.
+        """
+        self.index = index if index is not None else MemoryIndex()
+        self.margin = margin
+        self.hits = 0
+        self.misses = 0
+        self._key = key if key is not None else os.urandom(32)
+
+    def fingerprint(self, server: Union[str, Iterable[str]], *, text: str = None, file: FileSource = None,
+                    password: str = None, expiration: str = '1day', formatting: str = 'plaintext',
+                    discussion: bool = False, burn_after_reading: bool = False, filename: str = None,
+                    mimetype: str = None, **options) -> Optional[bytes]:
+        """Fingerprint a paste.
+
+        Options which do not change what the paste holds, such as compression, are accepted and ignored, so a dict of
+        options for send can be passed as it is.
+
+        :param server: The home URL of the PrivateBin host, or the URLs of every host it may be uploaded to.
+        :param text: The text content of the paste.
+        :param file: The file to attach to the paste: its path, or its content as a bytes-like object.
+        :param password: A password to secure the paste.
+        :param expiration: After how long the paste should expire.
+        :param formatting: What format the paste should be declared as.
+        :param discussion: Whether or not to enable discussion on the paste.
+        :param burn_after_reading: Whether or not the paste should delete itself immediately after being read.
+        :param filename: The name of the attachment.
+        :param mimetype: The MIME type of the attachment.
+        :return: The fingerprint, or None if the paste must not be deduplicated. File objects cannot be read without
+            using them up, so pastes attaching one are not deduplicated.
+        """
+        if burn_after_reading or (file is not None and is_file_object(file)):
+            return None
+        servers = [server] if isinstance(server, str) else sorted(server)
+        mac = hmac.new(self._key, digestmod=hashlib.sha256)
+        name = attachment_name(file, filename) if file else ''
+        fields = (
+            ' '.join(host_key(url) for url in servers), text or '', password or '', expiration, formatting,
+            str(bool(discussion)), name, guess_mimetype(name, mimetype) if file else ''
+        )
+        for field in fields:
+            encoded = field.encode('utf-8')
+            mac.update(len(encoded).to_bytes(8, 'big') + encoded)
+        if file and is_path(file):
+            mac.update(os.path.getsize(file).to_bytes(8, 'big'))
+            with open(file, 'rb') as attachment:
+                for chunk in iter(lambda: attachment.read(CHUNK_SIZE), b''):
+                    mac.update(chunk)
+        elif file:
+            with memoryview(file) as content:
+                mac.update(content.nbytes.to_bytes(8, 'big'))
+                mac.update(content)
+        return mac.digest()
+
+    def lookup(self, fingerprint: bytes) -> Optional[UploadResult]:
+        """Find the earlier upload of a paste, if it is far enough from expiring to be handed out.
+
+        :param fingerprint: The fingerprint returned by fingerprint.
+        :return: The result of the earlier upload, or None if there is none.
+        """
+        entry = self.index.get(fingerprint)
+        if entry is not None:
+            record, expires = entry
+            if expires is None or time.time() < expires - self.margin:
+                self.hits += 1
+                return UploadResult(record['data'], record['server'], record['passcode'])
+            self.index.remove(fingerprint)
+        self.misses += 1
+        return None
+
+    def record(self, fingerprint: bytes, result: UploadResult, expiration: str = '1day'):
+        """Remember an upload.
+
+        :param fingerprint: The fingerprint returned by fingerprint.
+        :param result: The result of the upload.
+        :param expiration: The expiration option the paste was uploaded with.
+        """
+        lifetime = EXPIRATION_SECONDS.get(expiration)
+        self.index.put(fingerprint, _record(result), None if lifetime is None else time.time() + lifetime)
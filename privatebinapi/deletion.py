@@ -2,16 +2,23 @@
 
 """Provides functions to delete pastes from PrivateBin instances."""
 
-import json
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, List, Tuple, Union
 
-import httpx
-import requests
-
-from privatebinapi.common import DEFAULT_HEADERS, verify_response
+from privatebinapi.capabilities import CAPABILITY_CACHE
+from privatebinapi.common import DEFAULT_HEADERS, AsyncClientContext, BulkResult, RetryPolicy, call_with_retry, \
+    call_with_retry_async, run_bounded, run_bounded_async, session_context, verify_response, with_timeout
 from privatebinapi.exceptions import PrivateBinAPIError, UnsupportedFeatureError
+from privatebinapi.results import DeleteResult
+from privatebinapi.serialization import dumps
+
+if TYPE_CHECKING:  # The HTTP libraries are only imported once a request is made
+    import httpx
+    import requests
 
-__all__ = ('delete', 'delete_async')
+__all__ = ('delete', 'delete_async', 'delete_many', 'delete_many_async')
+
+DEFAULT_CONCURRENCY = 10
 
 
 def process_url(url: str) -> Tuple[str, str]:
@@ -28,49 +35,169 @@ def process_url(url: str) -> Tuple[str, str]:
     return server, paste_id
 
 
-def delete(url: str, token: str, *, proxies: dict = None):
+def check_deletion_support(server: str):
+    """Fail fast if a host is already known not to support deleting pastes.
+
+    :param server: The home URL of the PrivateBin host.
+    :raises UnsupportedFeatureError: The host does not support deleting pastes.
+    """
+    capabilities = CAPABILITY_CACHE.get(server)
+    if capabilities is not None and capabilities.supports_deletion is False:
+        raise UnsupportedFeatureError('%s does not support manually deleting pastes' % server)
+
+
+def group_deletions(items: Iterable[Tuple[str, str]]):
+    """Sort deletions by host and pick one deletion from each host to probe it with.
+
+    :param items: Tuples of the full URL and delete token of each paste.
+    :return: A tuple of the probes, the remaining deletions and BulkResults for URLs that could not be parsed. Probes
+        and deletions are (index, url, token) tuples.
+    """
+    probes, rest, invalid = [], [], []
+    probed = set()
+    for index, (url, token) in enumerate(items):
+        try:
+            server, _ = process_url(url)
+        except ValueError as error:
+            invalid.append(BulkResult(index, None, error))
+            continue
+        if server in probed:
+            rest.append((server, index, url, token))
+        else:
+            probed.add(server)
+            probes.append((index, url, token))
+    rest.sort(key=lambda item: item[0])
+    return probes, [item[1:] for item in rest], invalid
+
+
+def process_delete_response(response: 'Union[requests.Response, httpx.Response]', server: str) -> DeleteResult:
+    """Verify the response to a deletion and record whether the host supports deleting pastes.
+
+    Only a successful response that is not JSON, which is what PrivateBin 1.0 answers with, is remembered as the host
+    not supporting deletion. Other responses that cannot be parsed, such as an error page from a proxy, only fail
+    this deletion.
+
+    :param response: The response from the PrivateBin host.
+    :param server: The home URL of the PrivateBin host.
+    :return: The JSON component of the response.
+    """
+    try:
+        data = verify_response(response, operation='delete')
+    except PrivateBinAPIError as error:
+        if error.args[0].startswith('Unable to parse response from '):
+            if 200 <= response.status_code < 300:
+                CAPABILITY_CACHE.update(server, supports_deletion=False)
+            raise UnsupportedFeatureError('%s does not support manually deleting pastes' % server) from error
+        raise
+    CAPABILITY_CACHE.update(server, supports_deletion=True)
+    return DeleteResult(data)
+
+
+def delete(url: str, token: str, *, proxies: dict = None, retry_policy: RetryPolicy = None,
+           session: 'requests.Session' = None):
     """Delete a paste from PrivateBin.
 
     :param url: The full URL of a paste, including passphrase.
     :param token: The delete token associated with a paste.
     :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param retry_policy: How to retry the request if it fails and limit the rate it is made at. If None, it is not.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
     :return:The JSON component of a response from the a PrivateBin server.
     """
     server, paste_id = process_url(url)
+    check_deletion_support(server)
 
-    with requests.Session() as session:
-        response = session.post(
-            server,
-            headers=DEFAULT_HEADERS,
-            proxies=proxies,
-            data=json.dumps({'pasteid': paste_id, 'deletetoken': token})
-        )
+    with session_context(session) as session:
+        def request() -> dict:
+            response = session.post(
+                server,
+                headers=DEFAULT_HEADERS,
+                proxies=proxies,
+                data=dumps({'pasteid': paste_id, 'deletetoken': token})
+            )
+            return process_delete_response(response, server)
 
-    try:
-        return verify_response(response)
-    except PrivateBinAPIError as error:
-        if error.args[0].startswith('Unable to parse response from '):
-            raise UnsupportedFeatureError('%s does not support manually deleting pastes' % server) from error
+        return call_with_retry(request, server, retry_policy, idempotent=False, operation='delete')
 
 
-async def delete_async(url: str, token: str, *, proxies: dict = None):
+@with_timeout
+async def delete_async(url: str, token: str, *, proxies: dict = None, retry_policy: RetryPolicy = None,
+                       client: 'httpx.AsyncClient' = None):
     """Asynchronously delete a paste from PrivateBin.
 
     :param url: The full URL of a paste, including passphrase.
     :param token: The delete token associated with a paste.
     :param proxies: A dict of proxies to pass to an httpx.AsyncClient object.
+    :param retry_policy: How to retry the request if it fails and limit the rate it is made at. If None, it is not.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :param timeout: A deadline in seconds for the whole deletion. If it passes, asyncio.TimeoutError is raised.
     :return: The JSON component of a response from the a PrivateBin server.
     """
     server, paste_id = process_url(url)
+    check_deletion_support(server)
 
-    async with httpx.AsyncClient(proxies=proxies, headers=DEFAULT_HEADERS) as client:
-        response = await client.post(
-            server,
-            data=json.dumps({'pasteid': paste_id, 'deletetoken': token})
-        )
+    async with AsyncClientContext(client, proxies=proxies) as client:
+        async def request() -> dict:
+            response = await client.post(
+                server,
+                headers=DEFAULT_HEADERS,
+                content=dumps({'pasteid': paste_id, 'deletetoken': token})
+            )
+            return process_delete_response(response, server)
 
-    try:
-        return verify_response(response)
-    except PrivateBinAPIError as error:
-        if error.args[0].startswith('Unable to parse response from '):
-            raise UnsupportedFeatureError('%s does not support manually deleting pastes' % server) from error
+        return await call_with_retry_async(request, server, retry_policy, idempotent=False, operation='delete')
+
+
+def delete_many(items: Iterable[Tuple[str, str]], *, concurrency: int = DEFAULT_CONCURRENCY, proxies: dict = None,
+                retry_policy: RetryPolicy = None, session: 'requests.Session' = None) -> List[BulkResult]:
+    """Delete many pastes, possibly from several hosts, using a pool of threads.
+
+    Deletions are grouped by host and share one session. Each host is probed with a single deletion first, so that
+    the rest of a host's deletions fail fast with UnsupportedFeatureError if it does not support deleting pastes.
+
+    :param items: Tuples of the full URL and delete token of each paste.
+    :param concurrency: The maximum number of deletions in flight at once.
+    :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param retry_policy: How to retry deletions that fail and limit the rate they are made at. If None, they are not.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
+    :return: A BulkResult for every item, in the same order as the items.
+    """
+    probes, rest, report = group_deletions(items)
+    with session_context(session, pool_maxsize=concurrency) as session:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for phase in (probes, rest):
+                deletions = run_bounded(
+                    executor,
+                    lambda item: delete(item[1], item[2], proxies=proxies, retry_policy=retry_policy, session=session),
+                    phase, concurrency
+                )
+                for index, result, error in deletions:
+                    report.append(BulkResult(phase[index][0], result, error))
+    return sorted(report, key=lambda item: item.index)
+
+
+async def delete_many_async(items: Iterable[Tuple[str, str]], *, concurrency: int = DEFAULT_CONCURRENCY,
+                            proxies: dict = None, retry_policy: RetryPolicy = None,
+                            client: 'httpx.AsyncClient' = None) -> List[BulkResult]:
+    """Asynchronously delete many pastes, possibly from several hosts.
+
+    Deletions are grouped by host and share one client. Each host is probed with a single deletion first, so that
+    the rest of a host's deletions fail fast with UnsupportedFeatureError if it does not support deleting pastes.
+
+    :param items: Tuples of the full URL and delete token of each paste.
+    :param concurrency: The maximum number of deletions in flight at once.
+    :param proxies: A dict of proxies to pass to an httpx.AsyncClient object.
+    :param retry_policy: How to retry deletions that fail and limit the rate they are made at. If None, they are not.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :return: A BulkResult for every item, in the same order as the items.
+    """
+    probes, rest, report = group_deletions(items)
+    async with AsyncClientContext(client, proxies=proxies) as client:
+        for phase in (probes, rest):
+            deletions = run_bounded_async(
+                lambda item: delete_async(item[1], item[2], retry_policy=retry_policy, client=client), phase,
+                concurrency
+            )
+            async for index, result, error in deletions:
+                report.append(BulkResult(phase[index][0], result, error))
+    return sorted(report, key=lambda item: item.index)
@@ -2,27 +2,51 @@
 
 """Provides functions to download pastes from PrivateBin hosts."""
 
+import asyncio
+import base64
+import concurrent.futures
 import functools
-from concurrent.futures import Executor
+from concurrent.futures import Executor, ThreadPoolExecutor
+import os
+from typing import TYPE_CHECKING, AsyncIterator, BinaryIO, Callable, Iterable, Iterator, List, Optional, Sequence, \
+    Tuple, Union
 
-import httpx
-import requests
-from pbincli.format import Paste
+from base58 import b58decode
 
-from privatebinapi.common import DEFAULT_HEADERS, get_loop, verify_response
+from privatebinapi import hooks
+from privatebinapi.cache import CacheEntry, PasteCache, paste_key
+from privatebinapi.comments import decrypt_discussion, decrypt_discussion_async
+from privatebinapi.common import DEFAULT_HEADERS, AsyncClientContext, BulkResult, RetryPolicy, call_with_retry, \
+    call_with_retry_async, check_availability, get_loop, run_bounded, run_bounded_async, session_context, \
+    verify_response, with_timeout
+from privatebinapi.crypto import KeyCache, Paste, derive_key, get_key_cache
+from privatebinapi.exceptions import BadServerResponseError, PrivateBinAPIError, ServerUnavailableError
+from privatebinapi.results import Attachment, PasteResult
+from privatebinapi.streaming import PasteReader, StreamFormatError, open_sink
 
-__all__ = ('get', 'get_async')
+if TYPE_CHECKING:  # The HTTP libraries are only imported once a request is made
+    import httpx
+    import requests
 
+__all__ = ('get', 'get_async', 'get_many', 'get_many_async', 'get_stream', 'get_stream_async')
 
-def decrypt_paste(data: dict, passphrase: str, password: str = None) -> dict:
+DEFAULT_CONCURRENCY = 10
+DEFAULT_CHUNK_SIZE = 16
+INLINE_DECRYPT_SIZE = 2 ** 16
+STREAM_CHUNK_SIZE = 2 ** 16
+
+
+def decrypt_paste(data: dict, passphrase: str, password: str = None, *, key_cache: KeyCache = None) -> PasteResult:
     """Decrypt a paste.
 
     :param data: The JSON component of a response from a PrivateBin host.
     :param passphrase: The part of the URL trailing the '#'.
     :param password: Password for decrypting the paste.
+    :param key_cache: A KeyCache to derive the key through. If None, the process-wide cache is used if enabled.
     :return: The decrypted text content of the paste.
     """
-    paste = Paste()
+    started = hooks.start()
+    paste = Paste(key_cache=key_cache if key_cache is not None else get_key_cache())
     if password:
         paste.setPassword(password)
     paste.setVersion(data['v'] if 'v' in data else 1)
@@ -33,22 +57,99 @@ def decrypt_paste(data: dict, passphrase: str, password: str = None) -> dict:
 
     attachment_bytes, attachment_name = paste.getAttachment()
 
-    output = {
-        'attachment': {
-            'content': attachment_bytes or None,
-            'filename': attachment_name or None
-        },
-        'id': data['id'],
-        'meta': data['meta'],
-        'status': data['status'],
-        'text': paste.getText().decode('utf-8'),
-        'url': data['url'],
-        'v': data.get('v', 1)
-    }
+    output = PasteResult(data, paste.getText(), Attachment(attachment_bytes or None, attachment_name or None))
+    if started is not None:
+        hooks.finish(started, 'get', 'decrypt', None, version=output.v, size=len(data.get('ct', data.get('data'))))
+
+    return output
+
+
+def decrypt_pastes(batch: Sequence[Tuple[dict, str, Optional[str]]]) \
+        -> List[Tuple[Optional[dict], Optional[Exception]]]:
+    """Decrypt several pastes in one call, so that a whole chunk can be handed to a process pool at once.
 
+    Pastes in the batch which share a key, password and salt only have their key derived once, even if the
+    process-wide key cache is disabled.
+
+    :param batch: Tuples of the arguments to decrypt_paste: the JSON data, the passphrase and the password.
+    :return: A (result, error) tuple for each paste, in the same order as the batch.
+    """
+    key_cache = get_key_cache()
+    batch_cache = KeyCache(len(batch)) if key_cache is None and len(batch) > 1 else None
+    output = []
+    try:
+        for data, passphrase, password in batch:
+            try:
+                output.append((decrypt_paste(data, passphrase, password=password, key_cache=batch_cache), None))
+            except Exception as error:  # pylint: disable=broad-except
+                output.append((None, error))
+    finally:
+        if batch_cache is not None:
+            batch_cache.clear()
     return output
 
 
+def key_arguments(data: dict, passphrase: str, password: Optional[str]) -> Optional[tuple]:
+    """Work out the arguments to derive_key for a version 2 paste, without decrypting it.
+
+    :param data: The JSON component of a response from a PrivateBin host.
+    :param passphrase: The part of the URL trailing the '#'.
+    :param password: Password for decrypting the paste.
+    :return: The arguments, or None if the paste is not a well formed version 2 paste.
+    """
+    try:
+        spec = data['adata'][0]
+        return b58decode(passphrase), password or '', base64.b64decode(spec[1]), int(spec[2]), int(spec[3]) // 8
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+async def decrypt_paste_async(data: dict, passphrase: str, password: str = None, *, executor: Executor = None,
+                              inline_size: int = INLINE_DECRYPT_SIZE) -> dict:
+    """Decrypt a paste without blocking the event loop for longer than decrypting a small paste takes.
+
+    Pastes larger than inline_size, and version 1 pastes, are decrypted whole in the executor. Smaller version 2
+    pastes only have their key derived there, since PBKDF2 is what makes decrypting them slow, and are then decrypted
+    on the event loop, which takes less time than handing them to another thread would. If the process-wide key
+    cache already holds the key, the executor is not used at all.
+
+    :param data: The JSON component of a response from a PrivateBin host.
+    :param passphrase: The part of the URL trailing the '#'.
+    :param password: Password for decrypting the paste.
+    :param executor: A concurrent.futures.Executor instance used for decryption and key derivation.
+    :param inline_size: The largest ciphertext, in characters, which is decrypted on the event loop.
+    :return: The decrypted paste, as returned by decrypt_paste.
+    """
+    arguments = key_arguments(data, passphrase, password) if data.get('v') == 2 else None
+    if arguments is None or len(data.get('ct') or '') > inline_size:
+        func = functools.partial(decrypt_paste, data, passphrase, password=password)
+        return await get_loop().run_in_executor(executor, func)
+
+    key_cache = get_key_cache()
+    derived = key_cache.lookup(*arguments) if key_cache is not None else None
+    if derived is None:
+        derived = await get_loop().run_in_executor(executor, derive_key, *arguments)
+        if key_cache is not None:
+            key_cache.store(*arguments, derived)
+    derived_key = KeyCache(1)
+    derived_key.store(*arguments, derived)
+    try:
+        return decrypt_paste(data, passphrase, password=password, key_cache=derived_key)
+    finally:
+        derived_key.clear()
+
+
+def split_results(fetched: Sequence[BulkResult], decrypted: List[Tuple[Optional[dict], Optional[Exception]]]):
+    """Pair the output of decrypt_pastes with the indexes of the downloads it was made from.
+
+    :param fetched: The BulkResults of the downloads that were decrypted.
+    :param decrypted: The output of decrypt_pastes for those downloads.
+    :return: An iterator of BulkResults.
+    """
+    for download, (result, error) in zip(fetched, decrypted):
+        yield BulkResult(download.index, result, error)
+
+
 def extract_passphrase(url: str) -> str:
     """Extract the passphrase from a PrivateBin URL.
 
@@ -63,34 +164,457 @@ def extract_passphrase(url: str) -> str:
     return passphrase
 
 
-def get(url: str, *, proxies: dict = None, password: str = None) -> dict:
+def read_response(response: 'Union[requests.Response, httpx.Response]', url: str, cache: Optional[PasteCache],
+                  entry: Optional[CacheEntry]) -> dict:
+    """Verify the response to a download, keeping the cache in step with it.
+
+    Blocking cache backends are used directly, so the async functions call this from an executor when they have one.
+
+    :param response: The response from the PrivateBin host.
+    :param url: The URL of the paste.
+    :param cache: The PasteCache to update, or None.
+    :param entry: The stale entry the request was made to check, or None.
+    :return: The JSON component of the response, or of the cached copy if the host answered 304 Not Modified.
+    """
+    if entry is not None and response.status_code == 304:
+        hooks.record_response('get', response)
+        return cache.refresh(url, entry).data
+    try:
+        data = verify_response(response, operation='get')
+    except (BadServerResponseError, ServerUnavailableError):
+        raise
+    except PrivateBinAPIError:
+        # The host says the paste is gone
+        if entry is not None:
+            cache.discard(paste_key(url))
+        raise
+    if cache is not None:
+        cache.store(url, data, response.headers)
+    return data
+
+
+def request_headers(entry: Optional[CacheEntry]) -> dict:
+    """Build the headers of a download, making it conditional if a stale cached copy can be checked.
+
+    :param entry: The stale cache entry, or None.
+    :return: The headers.
+    """
+    if entry is None:
+        return DEFAULT_HEADERS
+    return {**DEFAULT_HEADERS, **entry.conditional_headers()}
+
+
+def decrypt_with_comments(data: dict, passphrase: str, password: Optional[str], include_comments: bool,
+                          executor: Optional[Executor]) -> PasteResult:
+    """Decrypt a paste and, if they were asked for, its comments.
+
+    :param data: The JSON component of a response from a PrivateBin host.
+    :param passphrase: The part of the URL trailing the '#'.
+    :param password: Password for decrypting the paste.
+    :param include_comments: Whether or not to decrypt the paste's comments.
+    :param executor: A concurrent.futures.Executor to decrypt chunks of comments in, or None.
+    :return: The decrypted paste.
+    """
+    result = decrypt_paste(data, passphrase, password=password)
+    if include_comments:
+        return result.with_comments(decrypt_discussion(data, passphrase, password, executor=executor))
+    return result
+
+
+def get(url: str, *, proxies: dict = None, password: str = None, retry_policy: RetryPolicy = None,
+        cache: PasteCache = None, include_comments: bool = False, decrypt_executor: Executor = None,
+        session: 'requests.Session' = None) -> PasteResult:
     """Download a paste from a PrivateBin host.
 
     :param url: The full URL of a paste, including passphrase.
     :param proxies: A dict of proxies to pass to a requests.Session object.
     :param password: Password for decrypting the paste.
+    :param retry_policy: How to retry the request if it fails and limit the rate it is made at. If None, it is not.
+    :param cache: A PasteCache to read the encrypted paste through. If None, it is always downloaded.
+    :param include_comments: Whether or not to decrypt the comments the paste is sent with, under its comments key.
+        Comments can be posted at any time, so a cached copy is then always checked with the host.
+    :param decrypt_executor: A concurrent.futures.Executor to decrypt chunks of comments in side by side. If None,
+        they are decrypted in the calling thread.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
     :return: The decrypted text content of the paste.
     """
-    with requests.Session() as session:
-        response = session.get(
-            url,
-            headers=DEFAULT_HEADERS,
-            proxies=proxies
-        )
-    return decrypt_paste(verify_response(response), extract_passphrase(url), password=password)
+    passphrase = extract_passphrase(url)
+    entry = cache.lookup(url) if cache is not None else None
+    if entry is not None and not entry.stale() and not include_comments:
+        return decrypt_with_comments(entry.data, passphrase, password, include_comments, decrypt_executor)
+
+    with session_context(session) as session:
+        def request() -> dict:
+            response = session.get(url, headers=request_headers(entry), proxies=proxies)
+            return read_response(response, url, cache, entry)
+
+        data = call_with_retry(request, url, retry_policy, operation='get')
+    return decrypt_with_comments(data, passphrase, password, include_comments, decrypt_executor)
+
 
+async def call_cache(cache: PasteCache, func: Callable, *args):
+    """Call a method of a cache, from the default executor if its backend blocks.
 
-async def get_async(url: str, *, proxies: dict = None, password: str = None, executor: Executor = None, ):
+    :param cache: The PasteCache.
+    :param func: The method to call.
+    :param args: The arguments to pass to it.
+    :return: The return value of the method.
+    """
+    if cache.blocking:
+        return await get_loop().run_in_executor(None, functools.partial(func, *args))
+    return func(*args)
+
+
+@with_timeout
+async def get_async(url: str, *, proxies: dict = None, password: str = None, retry_policy: RetryPolicy = None,
+                    executor: Executor = None, inline_size: int = INLINE_DECRYPT_SIZE, cache: PasteCache = None,
+                    include_comments: bool = False, client: 'httpx.AsyncClient' = None) -> PasteResult:
     """Asynchronously download a paste from a PrivateBin host.
 
     :param url: The full URL of a paste, including passphrase.
     :param proxies: A dict of proxies to pass to an httpx.AsyncClient object.
     :param password: Password for decrypting the paste.
-    :param executor: A concurrent.futures.Executor instance used for decryption.
+    :param retry_policy: How to retry the request if it fails and limit the rate it is made at. If None, it is not.
+    :param executor: A concurrent.futures.Executor instance used for decryption. Comments are decrypted in it in
+        chunks, side by side.
+    :param inline_size: The largest ciphertext, in characters, which is decrypted on the event loop once its key is
+        derived. Larger pastes are decrypted in the executor.
+    :param cache: A PasteCache to read the encrypted paste through. If None, it is always downloaded.
+    :param include_comments: Whether or not to decrypt the comments the paste is sent with, under its comments key.
+        Comments can be posted at any time, so a cached copy is then always checked with the host.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :param timeout: A deadline in seconds for the whole download. If it passes, asyncio.TimeoutError is raised.
     :return: The decrypted text content of the paste.
     """
-    async with httpx.AsyncClient(proxies=proxies, headers=DEFAULT_HEADERS) as client:
-        response = await client.get(url)
-    func = functools.partial(decrypt_paste, verify_response(response), extract_passphrase(url), password=password)
-    result = await get_loop().run_in_executor(executor, func)
-    return result
+    passphrase = extract_passphrase(url)
+    entry = await call_cache(cache, cache.lookup, url) if cache is not None else None
+    if entry is not None and not entry.stale() and not include_comments:
+        data = entry.data
+    else:
+        async with AsyncClientContext(client, proxies=proxies) as client:
+            async def request() -> dict:
+                response = await client.get(url, headers=request_headers(entry))
+                if cache is None:
+                    return read_response(response, url, None, None)
+                return await call_cache(cache, read_response, response, url, cache, entry)
+
+            data = await call_with_retry_async(request, url, retry_policy, operation='get')
+
+    paste = decrypt_paste_async(data, passphrase, password, executor=executor, inline_size=inline_size)
+    if not include_comments:
+        return await paste
+    result, comments = await asyncio.gather(
+        paste, decrypt_discussion_async(data, passphrase, password, executor=executor)
+    )
+    return result.with_comments(comments)
+
+
+def feed_reader(reader: PasteReader, chunk: bytes, url: str):
+    """Pass a chunk of a response to a PasteReader, reporting malformed responses like verify_response does.
+
+    :param reader: The PasteReader decrypting the response.
+    :param chunk: The next chunk of the response body.
+    :param url: The URL the response came from.
+    """
+    try:
+        reader.feed(chunk)
+    except StreamFormatError as error:
+        raise BadServerResponseError('Unable to parse response from %s' % url) from error
+
+
+def finish_stream(reader: PasteReader, sink: BinaryIO, url: str, passphrase: str,
+                  password: Optional[str]) -> PasteResult:
+    """Finish decrypting a streamed paste and build the same output as decrypt_paste.
+
+    Version 1 pastes cannot be decrypted incrementally, so they are decrypted whole once the response is complete.
+
+    :param reader: The PasteReader which was fed the response.
+    :param sink: The binary file-like object the attachment is written to.
+    :param url: The URL the response came from.
+    :param passphrase: The part of the URL trailing the '#'.
+    :param password: Password for decrypting the paste.
+    :return: The decrypted paste. The attachment content is replaced by the number of bytes written to the sink.
+    """
+    try:
+        data = reader.close()
+    except StreamFormatError as error:
+        raise BadServerResponseError('Unable to parse response from %s' % url) from error
+    if data.get('status') != 0:
+        raise PrivateBinAPIError(data.get('message'))
+
+    if 'ct' in reader.response.streamed:
+        text = reader.message.values.get('paste', '')
+        filename = reader.message.values.get('attachment_name')
+        size = reader.attachment.size
+    else:
+        paste = decrypt_paste(data, passphrase, password=password)
+        text, filename = paste.text, paste.attachment.filename
+        content = paste.attachment.content
+        if filename is not None:
+            sink.write(content if content is not None else b'')
+        size = paste.attachment.size or 0
+
+    return PasteResult(data, text, Attachment(None, filename or None, size))
+
+
+def stream_retry_policy(sink: Union[str, os.PathLike, BinaryIO],
+                        policy: Optional[RetryPolicy]) -> Optional[RetryPolicy]:
+    """Adjust a retry policy for a streamed download.
+
+    A failed attempt may already have written part of the attachment, which can only be thrown away when the sink is
+    a path. Downloads to file-like objects are therefore never retried, although they are still rate limited.
+
+    :param sink: The path or binary file-like object the attachment is written to.
+    :param policy: The RetryPolicy given by the caller.
+    :return: The RetryPolicy to use.
+    """
+    if policy is None or isinstance(sink, (str, os.PathLike)):
+        return policy
+    return policy._replace(attempts=1)
+
+
+def get_stream(url: str, sink: Union[str, os.PathLike, BinaryIO], *, proxies: dict = None, password: str = None,
+               chunk_size: int = STREAM_CHUNK_SIZE, retry_policy: RetryPolicy = None,
+               session: 'requests.Session' = None) -> dict:
+    """Download a paste, decrypting it as it arrives and writing its attachment to a file.
+
+    Memory use depends on chunk_size rather than on the size of the attachment.
+
+    :param url: The full URL of a paste, including passphrase.
+    :param sink: A path or a binary file-like object to write the attachment to. A path is only created or replaced
+        once the paste has been verified, and only if it has an attachment; anything written to a file-like object is
+        only trustworthy if no exception is raised.
+    :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param password: Password for decrypting the paste.
+    :param chunk_size: How many bytes of the response to process at once.
+    :param retry_policy: How to retry the download if it fails and limit the rate it is made at. If None, it is not.
+        Only downloads to a path are retried.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
+    :return: The decrypted paste. Its attachment has a size instead of content.
+    """
+    passphrase = extract_passphrase(url)
+    with session_context(session) as session:
+        def download() -> dict:
+            with open_sink(sink) as file:
+                reader = PasteReader(passphrase, password, file)
+                with session.get(url, headers=DEFAULT_HEADERS, proxies=proxies, stream=True) as response:
+                    check_availability(response)
+                    for chunk in response.iter_content(chunk_size):
+                        feed_reader(reader, chunk, url)
+                hooks.record_response('get', response)
+                return finish_stream(reader, file, url, passphrase, password)
+
+        return call_with_retry(download, url, stream_retry_policy(sink, retry_policy), operation='get')
+
+
+@with_timeout
+async def get_stream_async(url: str, sink: Union[str, os.PathLike, BinaryIO], *, proxies: dict = None,
+                           password: str = None, retry_policy: RetryPolicy = None,
+                           client: 'httpx.AsyncClient' = None) -> dict:
+    """Asynchronously download a paste, decrypting it as it arrives and writing its attachment to a file.
+
+    Memory use depends on the size of the chunks the response arrives in rather than on the size of the attachment.
+
+    :param url: The full URL of a paste, including passphrase.
+    :param sink: A path or a binary file-like object to write the attachment to. A path is only created or replaced
+        once the paste has been verified, and only if it has an attachment; anything written to a file-like object is
+        only trustworthy if no exception is raised.
+    :param proxies: A dict of proxies to pass to an httpx.AsyncClient object.
+    :param password: Password for decrypting the paste.
+    :param retry_policy: How to retry the download if it fails and limit the rate it is made at. If None, it is not.
+        Only downloads to a path are retried.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :param timeout: A deadline in seconds for the whole download. If it passes, asyncio.TimeoutError is raised and a
+        path sink is left untouched.
+    :return: The decrypted paste. Its attachment has a size instead of content.
+    """
+    passphrase = extract_passphrase(url)
+    async with AsyncClientContext(client, proxies=proxies) as client:
+        async def download() -> dict:
+            with open_sink(sink) as file:
+                reader = PasteReader(passphrase, password, file)
+                async with client.stream('GET', url, headers=DEFAULT_HEADERS) as response:
+                    check_availability(response)
+                    async for chunk in response.aiter_bytes():
+                        feed_reader(reader, chunk, url)
+                hooks.record_response('get', response)
+                return finish_stream(reader, file, url, passphrase, password)
+
+        return await call_with_retry_async(download, url, stream_retry_policy(sink, retry_policy), operation='get')
+
+
+def submit_chunk(executor: Executor, chunk: List[BulkResult]) -> concurrent.futures.Future:
+    """Hand a chunk of downloaded pastes to an executor to be decrypted.
+
+    :param executor: The executor to decrypt in.
+    :param chunk: The BulkResults of the downloads.
+    :return: The future of the output of decrypt_pastes. If the executor refuses the chunk, for example because its
+        process pool is broken, the future holds that exception.
+    """
+    try:
+        return executor.submit(decrypt_pastes, [item.result for item in chunk])
+    except Exception as error:  # pylint: disable=broad-except
+        future = concurrent.futures.Future()
+        future.set_exception(error)
+        return future
+
+
+def chunk_results(chunk: List[BulkResult], future: concurrent.futures.Future) -> Iterator[BulkResult]:
+    """Pair the decrypted pastes of a chunk with their downloads.
+
+    :param chunk: The BulkResults of the downloads.
+    :param future: The finished future returned by submit_chunk.
+    :return: An iterator of BulkResults. If the executor failed, every paste in the chunk is reported with its error.
+    """
+    try:
+        decrypted = future.result()
+    except Exception as error:  # pylint: disable=broad-except
+        decrypted = [(None, error)] * len(chunk)
+    return split_results(chunk, decrypted)
+
+
+async def decrypt_chunk_async(chunk: List[BulkResult], executor: Optional[Executor],
+                              put: Callable[[BulkResult], None]):
+    """Decrypt a chunk of downloaded pastes in an executor.
+
+    :param chunk: The BulkResults of the downloads.
+    :param executor: The executor to decrypt in. If None, the loop's default executor is used.
+    :param put: Called with the BulkResult of each paste. If the executor fails, every paste in the chunk is reported
+        with its error.
+    """
+    try:
+        decrypted = await get_loop().run_in_executor(executor, decrypt_pastes, [item.result for item in chunk])
+    except Exception as error:  # pylint: disable=broad-except
+        decrypted = [(None, error)] * len(chunk)
+    for result in split_results(chunk, decrypted):
+        put(result)
+
+
+async def decrypt_downloads_async(downloads: AsyncIterator[BulkResult], executor: Optional[Executor],
+                                  chunk_size: int, put: Callable[[BulkResult], None]):
+    """Decrypt pastes in chunks as they finish downloading, while later pastes are still downloading.
+
+    :param downloads: The BulkResults of the downloads, as returned by run_bounded_async.
+    :param executor: The executor to decrypt in. If None, the loop's default executor is used.
+    :param chunk_size: How many pastes to send to the executor at once.
+    :param put: Called with the BulkResult of each paste, including those that failed to download.
+    """
+    chunk, decrypting = [], []
+    try:
+        async for download in downloads:
+            if download.error:
+                put(download)
+                continue
+            chunk.append(download)
+            if len(chunk) >= chunk_size:
+                decrypting.append(asyncio.ensure_future(decrypt_chunk_async(chunk, executor, put)))
+                chunk = []
+        if chunk:
+            decrypting.append(asyncio.ensure_future(decrypt_chunk_async(chunk, executor, put)))
+        await asyncio.gather(*decrypting)
+    finally:
+        for future in decrypting:
+            future.cancel()
+
+
+def get_many(urls: Iterable[str], *, concurrency: int = DEFAULT_CONCURRENCY, password: str = None,
+             proxies: dict = None, decrypt_executor: Executor = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+             retry_policy: RetryPolicy = None, session: 'requests.Session' = None) -> Iterator[BulkResult]:
+    """Download and decrypt many pastes using a pool of threads.
+
+    One session is shared by the whole batch. An item that fails does not stop the others; its exception is reported
+    in its result instead.
+
+    :param urls: The full URLs of the pastes, including passphrases.
+    :param concurrency: The maximum number of downloads in flight at once.
+    :param password: Password for decrypting the pastes.
+    :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param decrypt_executor: An executor to decrypt in, such as a ProcessPoolExecutor. If None, pastes are
+        decrypted by the threads that downloaded them.
+    :param chunk_size: How many pastes to send to the decrypt_executor at once.
+    :param retry_policy: How to retry downloads that fail and limit the rate they are made at. If None, they are not.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
+    :return: An iterator of BulkResults in the order they complete. Their index is the position of the URL.
+    """
+    with session_context(session, pool_maxsize=concurrency) as session:
+
+        def fetch_one(url: str) -> Tuple[dict, str, Optional[str]]:
+            passphrase = extract_passphrase(url)
+            data = call_with_retry(
+                lambda: verify_response(session.get(url, headers=DEFAULT_HEADERS, proxies=proxies), operation='get'),
+                url, retry_policy, operation='get'
+            )
+            return data, passphrase, password
+
+        with ThreadPoolExecutor(max_workers=concurrency) as fetcher:
+            if decrypt_executor is None:
+                yield from run_bounded(fetcher, lambda url: decrypt_paste(*fetch_one(url)), urls, concurrency)
+                return
+
+            chunk, decrypting = [], {}
+            for download in run_bounded(fetcher, fetch_one, urls, concurrency):
+                if download.error:
+                    yield download
+                    continue
+                chunk.append(download)
+                if len(chunk) >= chunk_size:
+                    decrypting[submit_chunk(decrypt_executor, chunk)] = chunk
+                    chunk = []
+                for future in [future for future in decrypting if future.done()]:
+                    yield from chunk_results(decrypting.pop(future), future)
+            if chunk:
+                decrypting[submit_chunk(decrypt_executor, chunk)] = chunk
+            for future in concurrent.futures.as_completed(decrypting):
+                yield from chunk_results(decrypting[future], future)
+
+
+async def get_many_async(urls: Iterable[str], *, concurrency: int = DEFAULT_CONCURRENCY, password: str = None,
+                         proxies: dict = None, decrypt_executor: Executor = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE, retry_policy: RetryPolicy = None,
+                         client: 'httpx.AsyncClient' = None) -> AsyncIterator[BulkResult]:
+    """Asynchronously download and decrypt many pastes.
+
+    Downloads share one client. Downloaded pastes are decrypted in chunks in the decrypt_executor while other pastes
+    are still downloading; pass a ProcessPoolExecutor to spread decryption across every core. An item that fails does
+    not stop the others; its exception is reported in its result instead.
+
+    :param urls: The full URLs of the pastes, including passphrases.
+    :param concurrency: The maximum number of downloads in flight at once.
+    :param password: Password for decrypting the pastes.
+    :param proxies: A dict of proxies to pass to an httpx.AsyncClient object.
+    :param decrypt_executor: A concurrent.futures.Executor instance used for decryption.
+    :param chunk_size: How many pastes to send to the decrypt_executor at once.
+    :param retry_policy: How to retry downloads that fail and limit the rate they are made at. If None, they are not.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :return: An async iterator of BulkResults in the order they complete. Their index is the position of the URL.
+    """
+    queue = asyncio.Queue()
+    finished = object()
+
+    async def fetch_one(url: str) -> Tuple[dict, str, Optional[str]]:
+        passphrase = extract_passphrase(url)
+
+        async def request() -> dict:
+            return verify_response(await client.get(url, headers=DEFAULT_HEADERS), operation='get')
+
+        return await call_with_retry_async(request, url, retry_policy, operation='get'), passphrase, password
+
+    async def produce():
+        try:
+            await decrypt_downloads_async(
+                run_bounded_async(fetch_one, urls, concurrency), decrypt_executor, chunk_size, queue.put_nowait
+            )
+        finally:
+            queue.put_nowait(finished)
+
+    async with AsyncClientContext(client, proxies=proxies) as client:
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                result = await queue.get()
+                if result is finished:
+                    break
+                yield result
+            await producer
+        finally:
+            producer.cancel()
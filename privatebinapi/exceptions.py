@@ -27,5 +27,18 @@ class BadServerResponseError(PrivateBinAPIError):
     """
 
 
+class ServerUnavailableError(PrivateBinAPIError):
+    """Indicates that a PrivateBin host is rate limiting requests, overloaded or temporarily down.
+
+    status_code is the HTTP status it responded with, and retry_after is how many seconds it asked clients to wait
+    for, or None if it did not say.
+    """
+
+    def __init__(self, message: str, status_code: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
 class UnsupportedFeatureError(PrivateBinAPIError):
     """Indicates that a PrivateBin host does not support the operation attempted"""
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+"""Reports how long each phase of an upload, download or deletion takes to callbacks installed by the user."""
+
+import threading
+import time
+import warnings
+import weakref
+from typing import Any, Callable, NamedTuple, Optional
+
+__all__ = ('Event', 'add_hook', 'clear_hooks', 'opentelemetry_hook', 'prometheus_hook', 'remove_hook')
+
+PHASES = ('capabilities', 'encrypt', 'request', 'verify', 'decrypt', 'retry')
+
+
+class Event(NamedTuple):
+    """Something that happened while talking to a PrivateBin host.
+
+    operation is 'send', 'get', 'delete' or 'comment'. phase is one of:
+
+    * 'capabilities': looking up the host's API version, when it is not cached.
+    * 'encrypt': compressing, encrypting and serializing a paste.
+    * 'request': an HTTP request, timed as the HTTP library reports it.
+    * 'verify': checking and parsing the host's response.
+    * 'decrypt': decrypting a downloaded paste.
+    * 'retry': waiting before a request is retried. The duration is the planned wait.
+
+    server is None for phases which do no network I/O.
+    """
+    operation: Optional[str]
+    phase: str
+    server: Optional[str]
+    duration: float
+    attributes: dict
+
+
+_hooks = ()  # Replaced rather than mutated, so reading it needs no lock
+_lock = threading.Lock()
+_seen_connections = weakref.WeakSet()
+_pool_connections = weakref.WeakKeyDictionary()
+
+
+def add_hook(hook: Callable[[Event], Any]) -> Callable[[Event], Any]:
+    """Install a callback which is called with an Event every time a phase finishes.
+
+    Hooks are called synchronously on whichever thread or event loop did the work, so they should be quick. An
+    exception raised by a hook is turned into a warning rather than interrupting the request.
+
+    :param hook: The callback.
+    :return: The callback, so that this can be used as a decorator.
+    """
+    global _hooks  # pylint: disable=global-statement
+    with _lock:
+        _hooks = _hooks + (hook,)
+    return hook
+
+
+def remove_hook(hook: Callable[[Event], Any]):
+    """Uninstall a callback installed by add_hook.
+
+    :param hook: The callback.
+    :raises ValueError: The callback is not installed.
+    """
+    global _hooks  # pylint: disable=global-statement
+    with _lock:
+        if hook not in _hooks:
+            raise ValueError('%r is not an installed hook' % hook)
+        hooks = list(_hooks)
+        hooks.remove(hook)
+        _hooks = tuple(hooks)
+
+
+def clear_hooks():
+    """Uninstall every callback."""
+    global _hooks  # pylint: disable=global-statement
+    with _lock:
+        _hooks = ()
+
+
+def enabled() -> bool:
+    """Check whether any callback is installed, so that callers can skip gathering details nobody will read.
+
+    :return: True if at least one hook is installed.
+    """
+    return bool(_hooks)
+
+
+def emit(operation: Optional[str], phase: str, server: Optional[str], duration: float, **attributes):
+    """Pass an Event to every installed callback.
+
+    :param operation: 'send', 'get', 'delete' or 'comment'.
+    :param phase: One of PHASES.
+    :param server: The URL the phase talked to, if any.
+    :param duration: How long the phase took in seconds.
+    :param attributes: Details specific to the phase.
+    """
+    hooks = _hooks
+    if not hooks:
+        return
+    event = Event(operation, phase, server, duration, attributes)
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception as error:  # pylint: disable=broad-except
+            warnings.warn('hook %r raised %r' % (hook, error), RuntimeWarning)
+
+
+def start() -> Optional[float]:
+    """Start timing a phase.
+
+    :return: The current time, or None if no hook is installed.
+    """
+    return time.perf_counter() if _hooks else None
+
+
+def finish(started: Optional[float], operation: Optional[str], phase: str, server: Optional[str], **attributes):
+    """Finish timing a phase and report it.
+
+    :param started: The time returned by start. If None, nothing is reported.
+    :param operation: 'send', 'get', 'delete' or 'comment'.
+    :param phase: One of PHASES.
+    :param server: The URL the phase talked to, if any.
+    :param attributes: Details specific to the phase.
+    """
+    if started is not None:
+        emit(operation, phase, server, time.perf_counter() - started, **attributes)
+
+
+def _content_length(headers) -> Optional[int]:
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def connection_reused(response) -> Optional[bool]:
+    """Work out whether a response came over a connection which had already been used.
+
+    httpx responses carry their connection, so the answer is exact. requests responses only lead to their connection
+    pool, so the answer comes from whether the pool opened a connection since the last response, which can be wrong
+    when requests to the same host overlap.
+
+    :param response: A requests or httpx response.
+    :return: Whether the connection was reused, or None if it cannot be told.
+    """
+    connection = getattr(getattr(response, 'stream', None), 'connection', None)
+    if connection is not None:
+        with _lock:
+            reused = connection in _seen_connections
+            _seen_connections.add(connection)
+        return reused
+    adapter = getattr(response, 'connection', None)
+    if adapter is None or not hasattr(adapter, 'get_connection'):
+        return None
+    try:
+        pool = adapter.get_connection(response.url)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    with _lock:
+        reused = _pool_connections.get(pool) == pool.num_connections
+        _pool_connections[pool] = pool.num_connections
+    return reused
+
+
+def record_response(operation: str, response, server: str = None):
+    """Report the HTTP request behind a response.
+
+    :param operation: 'send', 'get', 'delete' or 'comment'.
+    :param response: A requests or httpx response.
+    :param server: The URL the request was made to. If None, the response's URL is used.
+    """
+    if not _hooks:
+        return
+    request = getattr(response, 'request', None)
+    elapsed = getattr(response, 'elapsed', None)
+    content = getattr(response, '_content', None)
+    emit(
+        operation, 'request', server or str(response.url), elapsed.total_seconds() if elapsed is not None else 0.0,
+        method=getattr(request, 'method', None), status_code=response.status_code,
+        bytes_sent=_content_length(getattr(request, 'headers', None)),
+        bytes_received=len(content) if isinstance(content, bytes) else _content_length(response.headers),
+        reused=connection_reused(response)
+    )
+
+
+def prometheus_hook(registry=None, namespace: str = 'privatebin') -> Callable[[Event], None]:
+    """Create a hook which exports events as Prometheus metrics. Requires the prometheus_client package.
+
+    Phase durations go to the <namespace>_phase_seconds histogram, payload sizes around encryption to
+    <namespace>_payload_bytes, retries to <namespace>_retries_total and requests to <namespace>_requests_total,
+    labelled with whether their connection was reused.
+
+    :param registry: The CollectorRegistry to register the metrics with. If None, the default registry is used.
+    :param namespace: The prefix of the metric names.
+    :return: The hook, ready to pass to add_hook.
+    """
+    import prometheus_client  # pylint: disable=import-outside-toplevel
+
+    registry = prometheus_client.REGISTRY if registry is None else registry
+    durations = prometheus_client.Histogram(
+        'phase_seconds', 'Time spent in each phase of a PrivateBin operation', ('operation', 'phase'),
+        namespace=namespace, registry=registry
+    )
+    sizes = prometheus_client.Histogram(
+        'payload_bytes', 'Size of pastes before compression, after compression and once encrypted', ('stage',),
+        namespace=namespace, registry=registry,
+        buckets=tuple(2 ** power for power in range(8, 28, 2)) + (float('inf'),)
+    )
+    retries = prometheus_client.Counter(
+        'retries', 'Requests retried', ('operation',), namespace=namespace, registry=registry
+    )
+    requests = prometheus_client.Counter(
+        'requests', 'HTTP requests made', ('operation', 'reused'), namespace=namespace, registry=registry
+    )
+
+    def hook(event: Event):
+        operation = event.operation or ''
+        durations.labels(operation, event.phase).observe(event.duration)
+        if event.phase == 'encrypt':
+            for stage in ('plaintext', 'compressed', 'payload'):
+                if event.attributes.get(stage + '_size') is not None:
+                    sizes.labels(stage).observe(event.attributes[stage + '_size'])
+        elif event.phase == 'retry':
+            retries.labels(operation).inc()
+        elif event.phase == 'request':
+            requests.labels(operation, str(event.attributes.get('reused')).lower()).inc()
+
+    return hook
+
+
+def opentelemetry_hook(meter=None) -> Callable[[Event], None]:
+    """Create a hook which records events as OpenTelemetry metrics. Requires the opentelemetry-api package.
+
+    Phase durations are recorded by the privatebin.phase.duration histogram, payload sizes by privatebin.payload.size,
+    retries by the privatebin.retries counter and requests by the privatebin.requests counter.
+
+    :param meter: The Meter to create the instruments with. If None, one is taken from the global MeterProvider.
+    :return: The hook, ready to pass to add_hook.
+    """
+    from opentelemetry import metrics  # pylint: disable=import-outside-toplevel
+
+    meter = metrics.get_meter('privatebinapi') if meter is None else meter
+    durations = meter.create_histogram(
+        'privatebin.phase.duration', unit='s', description='Time spent in each phase of a PrivateBin operation'
+    )
+    sizes = meter.create_histogram(
+        'privatebin.payload.size', unit='By', description='Size of pastes around compression and encryption'
+    )
+    retries = meter.create_counter('privatebin.retries', description='Requests retried')
+    requests = meter.create_counter('privatebin.requests', description='HTTP requests made')
+
+    def hook(event: Event):
+        operation = event.operation or ''
+        durations.record(event.duration, {'operation': operation, 'phase': event.phase})
+        if event.phase == 'encrypt':
+            for stage in ('plaintext', 'compressed', 'payload'):
+                if event.attributes.get(stage + '_size') is not None:
+                    sizes.record(event.attributes[stage + '_size'], {'stage': stage})
+        elif event.phase == 'retry':
+            retries.add(1, {'operation': operation})
+        elif event.phase == 'request':
+            requests.add(1, {'operation': operation, 'reused': str(event.attributes.get('reused')).lower()})
+
+    return hook
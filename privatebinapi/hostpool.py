@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""Spreads uploads across several PrivateBin hosts, steering away from slow or failing ones."""
+
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from privatebinapi.common import host_key
+
+__all__ = ('HostPool', 'HostStatus')
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_ERROR_THRESHOLD = 0.5
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_SMOOTHING = 0.3
+
+
+class HostStatus(NamedTuple):
+    """A snapshot of what a HostPool knows about one of its hosts.
+
+    latency is the moving average of successful request times in seconds, or None before the first success.
+    error_rate is the moving average of failures, between 0 and 1.
+    """
+    server: str
+    latency: Optional[float]
+    error_rate: float
+    in_flight: int
+    available: bool
+
+
+class _Host:
+    __slots__ = ('server', 'latency', 'error_rate', 'in_flight', 'consecutive_failures', 'open_until', 'probing')
+
+    def __init__(self, server: str):
+        self.server = server
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+
+class HostPool:
+    """A set of PrivateBin hosts which can be passed to send in place of a single URL.
+
+    Each upload goes to the host with the lowest exponentially weighted moving average latency, scaled by how many
+    requests it already has in flight, so concurrent uploads spread out, and divided by its success rate. Hosts that
+    have not been measured yet are tried first, and hosts whose error rate reaches error_threshold last. A host that
+    fails failure_threshold times in a row is ejected for reset_timeout seconds, after which a single trial upload
+    decides whether it rejoins; other uploads skip it until the trial ends. If an upload fails, it moves on to the
+    next host.
+    """
+
+    def __init__(self, servers: Iterable[str], *, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT, smoothing: float = DEFAULT_SMOOTHING,
+                 error_threshold: float = DEFAULT_ERROR_THRESHOLD):
+        """
+        :param servers: The home URLs of the PrivateBin hosts.
+        :param failure_threshold: How many failures in a row eject a host.
+        :param reset_timeout: How many seconds an ejected host is left alone for.
+        :param smoothing: The weight of the newest measurement in the moving averages, between 0 and 1.
+        :param error_threshold: The error rate, between 0 and 1, at which a host is ranked after every healthier one.
+        """
+        self._hosts: Dict[str, _Host] = {}
+        for server in servers:
+            self._hosts.setdefault(host_key(server), _Host(server))
+        if not self._hosts:
+            raise ValueError("a HostPool needs at least one server")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.smoothing = smoothing
+        self.error_threshold = error_threshold
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._hosts)
+
+    def __repr__(self) -> str:
+        return 'HostPool(%r)' % [host.server for host in self._hosts.values()]
+
+    def candidates(self) -> List[str]:
+        """Rank the hosts for the next upload.
+
+        :return: The URLs of the available hosts, best first. If every host is ejected, the one due back soonest is
+            returned on its own, so that there is always something to try, unless each one is already being tried.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [host for host in self._hosts.values() if host.open_until <= now and not host.probing]
+            if not available:
+                waiting = [host for host in self._hosts.values() if not host.probing]
+                return [min(waiting, key=lambda host: host.open_until).server] if waiting else []
+            available.sort(key=self._rank)
+            return [host.server for host in available]
+
+    def _rank(self, host: _Host) -> tuple:
+        cost = (host.latency or 0.0) * (host.in_flight + 1)
+        if host.error_rate >= self.error_threshold:
+            return True, cost, host.error_rate
+        return False, cost / (1.0 - host.error_rate), host.error_rate
+
+    def start(self, server: str) -> Optional[float]:
+        """Record that a request to a host has begun.
+
+        A request to an ejected host is its trial upload. While it is in flight, no other request may start on the
+        host.
+
+        :param server: The URL of the host, as returned by candidates.
+        :return: The start time, to pass to succeeded, or None if another request is already trying the host, in
+            which case it should be skipped.
+        """
+        with self._lock:
+            host = self._hosts[host_key(server)]
+            if host.open_until:
+                if host.probing:
+                    return None
+                host.probing = True
+            host.in_flight += 1
+        return time.monotonic()
+
+    def succeeded(self, server: str, started: float):
+        """Record that a request to a host has succeeded.
+
+        :param server: The URL of the host, as returned by candidates.
+        :param started: The time returned by start.
+        """
+        elapsed = time.monotonic() - started
+        with self._lock:
+            host = self._hosts[host_key(server)]
+            host.in_flight -= 1
+            host.latency = elapsed if host.latency is None else self._average(host.latency, elapsed)
+            host.error_rate = self._average(host.error_rate, 0.0)
+            host.consecutive_failures = 0
+            host.open_until = 0.0
+            host.probing = False
+
+    def failed(self, server: str):
+        """Record that a request to a host has failed, ejecting the host if it keeps failing.
+
+        :param server: The URL of the host, as returned by candidates.
+        """
+        with self._lock:
+            host = self._hosts[host_key(server)]
+            host.in_flight -= 1
+            host.error_rate = self._average(host.error_rate, 1.0)
+            host.consecutive_failures += 1
+            host.probing = False
+            if host.consecutive_failures >= self.failure_threshold:
+                host.open_until = time.monotonic() + self.reset_timeout
+
+    def abandon(self, server: str):
+        """Record that a request to a host ended in a way that says nothing about the host, such as being cancelled.
+
+        :param server: The URL of the host, as returned by candidates.
+        """
+        with self._lock:
+            host = self._hosts[host_key(server)]
+            host.in_flight -= 1
+            host.probing = False
+
+    def _average(self, average: float, sample: float) -> float:
+        return (1 - self.smoothing) * average + self.smoothing * sample
+
+    def status(self) -> List[HostStatus]:
+        """Take a snapshot of every host's health.
+
+        :return: A HostStatus for each host, in the order they were given.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                HostStatus(
+                    host.server, host.latency, host.error_rate, host.in_flight,
+                    host.open_until <= now and not host.probing
+                )
+                for host in self._hosts.values()
+            ]
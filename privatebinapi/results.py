@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+"""Compact, read-only results of uploading, downloading and deleting pastes.
+
+Each result is a Mapping, so code written for the dicts these functions used to return keeps working: results can be
+indexed, iterated, compared with dicts and unpacked with ** or dict(). Their fields are held in __slots__ rather than
+in a dict per result, which matters to batch jobs that keep many of them.
+"""
+
+from collections.abc import Mapping
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+__all__ = ('Attachment', 'Comment', 'DeleteResult', 'PasteResult', 'UploadResult')
+
+
+def _extra_fields(data: dict, known: Tuple[str, ...]) -> Optional[dict]:
+    extra = {key: value for key, value in data.items() if key not in known}
+    return extra or None
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, _Result):
+        return value.to_dict()
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+class _Result(Mapping):
+    """The Mapping interface shared by every result.
+
+    _keys lists the fields in the order they are iterated. Fields a host sends that a result has no slot for are kept
+    in _extra, which is None when there are none.
+    """
+
+    __slots__ = ('_extra',)
+    _keys: Tuple[str, ...] = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._keys:
+            return getattr(self, key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._keys
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return len(self._keys) + (len(self._extra) if self._extra is not None else 0)
+
+    def __repr__(self) -> str:
+        return '%s(%r)' % (type(self).__name__, self.to_dict())
+
+    def to_dict(self) -> dict:
+        """Copy the result into plain dicts and bytes, for example to serialize it as JSON.
+
+        :return: The result as it would have been returned before results were Mappings.
+        """
+        return {key: _plain(value) for key, value in self.items()}
+
+
+class Attachment(_Result):
+    """The attachment of a downloaded paste.
+
+    content is a memoryview of the decrypted file, which can be sliced without copying it, or None if the paste has
+    no attachment or it was streamed to a file. size is its length in bytes, or None if there is none.
+    """
+
+    __slots__ = ('content', 'filename', 'size')
+    _keys = ('content', 'filename', 'size')
+
+    def __init__(self, content: Union[bytes, memoryview, None], filename: Optional[str], size: int = None):
+        """
+        :param content: The decrypted file, or None.
+        :param filename: The name of the file, or None.
+        :param size: The length of the file. If None, it is the length of content.
+        """
+        self._extra = None
+        self.content = memoryview(content) if content else None
+        self.filename = filename
+        self.size = size if size is not None or self.content is None else self.content.nbytes
+
+    def __reduce__(self):
+        content = self.content.tobytes() if self.content is not None else None
+        return type(self), (content, self.filename, self.size)
+
+
+class Comment(_Result):
+    """A decrypted comment on a paste.
+
+    comment and nickname are None if the comment could not be decrypted, for example because it was posted with a
+    different key. nickname is also None if the comment was posted without one.
+    """
+
+    __slots__ = ('comment', 'id', 'meta', 'nickname', 'parentid')
+    _keys = ('comment', 'id', 'meta', 'nickname', 'parentid')
+
+    def __init__(self, data: dict, comment: Optional[str], nickname: Optional[str]):
+        """
+        :param data: The comment, as the host sent it.
+        :param comment: The decrypted text of the comment, or None.
+        :param nickname: The decrypted nickname, or None.
+        """
+        self._extra = None
+        self.comment = comment
+        self.id = data['id']  # pylint: disable=invalid-name
+        self.meta = data.get('meta') or {}
+        self.nickname = nickname
+        self.parentid = data.get('parentid')
+
+    def __reduce__(self):
+        return type(self), ({'id': self.id, 'meta': self.meta, 'parentid': self.parentid}, self.comment, self.nickname)
+
+
+class PasteResult(_Result):
+    """A downloaded and decrypted paste.
+
+    Its text is kept as the UTF-8 bytes it was decrypted to and only decoded the first time it is read. If its
+    comments were asked for, they are under the comments key, in the order the host sent them.
+    """
+
+    __slots__ = ('attachment', 'id', 'meta', 'status', 'url', 'v', '_text')
+    _keys = ('attachment', 'id', 'meta', 'status', 'text', 'url', 'v')
+
+    def __init__(self, data: dict, text: Union[bytes, str], attachment: Attachment, comments: List[Comment] = None):
+        """
+        :param data: The JSON component of the host's response.
+        :param text: The decrypted text, as UTF-8 bytes or already decoded.
+        :param attachment: The decrypted attachment.
+        :param comments: The decrypted comments, or None if they were not asked for.
+        """
+        self._extra = {'comments': comments} if comments is not None else None
+        self.attachment = attachment
+        self.id = data['id']  # pylint: disable=invalid-name
+        self.meta = data['meta']
+        self.status = data['status']
+        self.url = data['url']
+        self.v = data.get('v', 1)  # pylint: disable=invalid-name
+        self._text = text
+
+    @property
+    def text(self) -> str:
+        """The decrypted text of the paste."""
+        if isinstance(self._text, bytes):
+            self._text = self._text.decode('utf-8')
+        return self._text
+
+    @property
+    def comments(self) -> Optional[List[Comment]]:
+        """The decrypted comments, or None if they were not asked for."""
+        return self._extra['comments'] if self._extra is not None else None
+
+    def with_comments(self, comments: List[Comment]) -> 'PasteResult':
+        """Copy the paste with its decrypted comments.
+
+        :param comments: The decrypted comments.
+        :return: The copy.
+        """
+        data = {'id': self.id, 'meta': self.meta, 'status': self.status, 'url': self.url, 'v': self.v}
+        return type(self)(data, self._text, self.attachment, comments)
+
+    def __reduce__(self):
+        data = {'id': self.id, 'meta': self.meta, 'status': self.status, 'url': self.url, 'v': self.v}
+        return type(self), (data, self._text, self.attachment, self.comments)
+
+
+class UploadResult(_Result):
+    """The response to uploading a paste, with the link to it and the key needed to read it."""
+
+    __slots__ = ('deletetoken', 'id', 'passcode', 'status', 'url', '_server')
+    _keys = ('deletetoken', 'full_url', 'id', 'passcode', 'status', 'url')
+
+    def __init__(self, data: dict, server: str, passcode: str):
+        """
+        :param data: The JSON component of the host's response.
+        :param server: The URL the paste was uploaded to.
+        :param passcode: The paste's passcode, which goes after the '#' of its link.
+        """
+        self._extra = _extra_fields(data, self._keys)
+        self.deletetoken = data.get('deletetoken')
+        self.id = data['id']  # pylint: disable=invalid-name
+        self.passcode = passcode
+        self.status = data['status']
+        self.url = data.get('url')
+        self._server = server
+
+    @property
+    def full_url(self) -> str:
+        """The link to the paste, including its passcode."""
+        return self._server + '?' + self.id + '#' + self.passcode
+
+    @property
+    def server(self) -> str:
+        """The URL the paste was uploaded to."""
+        return self._server
+
+    def __reduce__(self):
+        data = {key: self[key] for key in self if key not in ('full_url', 'passcode')}
+        return type(self), (data, self._server, self.passcode)
+
+
+class DeleteResult(_Result):
+    """The response to deleting a paste."""
+
+    __slots__ = ('id', 'status', 'url')
+    _keys = ('id', 'status', 'url')
+
+    def __init__(self, data: dict):
+        """
+        :param data: The JSON component of the host's response.
+        """
+        self._extra = _extra_fields(data, self._keys)
+        self.id = data.get('id')  # pylint: disable=invalid-name
+        self.status = data['status']
+        self.url = data.get('url')
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""Parses and serializes JSON with the fastest library available: orjson, then ujson, then the standard library."""
+
+import importlib
+import json
+from typing import Any, Callable, NamedTuple, Optional, Union
+
+__all__ = ('JSONBackend', 'dumps', 'get_json_backend', 'loads', 'set_json_backend')
+
+BACKEND_NAMES = ('orjson', 'ujson', 'json')
+
+
+class JSONBackend(NamedTuple):
+    """A JSON library.
+
+    dumps must produce compact UTF-8 encoded bytes. Both functions must raise a ValueError subclass on bad input.
+    """
+    name: str
+    loads: Callable[[Union[bytes, str]], Any]
+    dumps: Callable[[Any], bytes]
+
+
+def _load_backend(name: str) -> JSONBackend:
+    if name == 'json':
+        return JSONBackend('json', json.loads, lambda obj: json.dumps(obj, separators=(',', ':')).encode())
+    module = importlib.import_module(name)
+    if name == 'orjson':
+        return JSONBackend('orjson', module.loads, module.dumps)
+    if name == 'ujson':
+        return JSONBackend('ujson', module.loads, lambda obj: module.dumps(obj, escape_forward_slashes=False).encode())
+    raise ValueError('JSON backend %s must be in %s' % (repr(name), BACKEND_NAMES))
+
+
+def _best_backend() -> JSONBackend:
+    for name in BACKEND_NAMES:
+        try:
+            return _load_backend(name)
+        except ImportError:
+            continue
+    raise AssertionError('the json module is always available')
+
+
+_backend = _best_backend()
+
+
+def set_json_backend(backend: Optional[Union[str, JSONBackend]] = None) -> JSONBackend:
+    """Choose the JSON library used for responses and request bodies.
+
+    The authenticated data of a paste is always serialized by the standard library, since it has to match what
+    PrivateBin's own JavaScript produces byte for byte.
+
+    :param backend: 'orjson', 'ujson', 'json', a custom JSONBackend, or None to pick the fastest one installed.
+    :return: The backend now in use.
+    :raises ImportError: The named library is not installed.
+    """
+    global _backend  # pylint: disable=global-statement
+    if backend is None:
+        _backend = _best_backend()
+    elif isinstance(backend, JSONBackend):
+        _backend = backend
+    else:
+        _backend = _load_backend(backend)
+    return _backend
+
+
+def get_json_backend() -> JSONBackend:
+    """Get the JSON library in use.
+
+    :return: The current backend.
+    """
+    return _backend
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON with the current backend.
+
+    :param data: The JSON document, preferably as undecoded bytes.
+    :return: The parsed object.
+    :raises ValueError: The document is not valid JSON.
+    """
+    return _backend.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize an object to compact JSON with the current backend.
+
+    :param obj: The object to serialize.
+    :return: The UTF-8 encoded JSON document.
+    """
+    return _backend.dumps(obj)
@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+
+"""Provides incremental parsing of PrivateBin responses, so large pastes never have to be held in memory at once."""
+
+import codecs
+import contextlib
+import json
+import os
+import re
+import tempfile
+import zlib
+from typing import BinaryIO, Callable, Iterable, Optional, Union
+
+from base58 import b58decode
+
+from privatebinapi.crypto import Base64Decoder, StreamDecryptor
+
+__all__ = ('ObjectParser', 'PasteReader', 'StreamFormatError', 'open_sink')
+
+SPOOL_SIZE = 2 ** 20
+
+ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+ESCAPE_PATTERN = re.compile(r'\\(u[dD][89abAB][0-9a-fA-F]{2}\\u[dD][c-fC-F][0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|.)')
+HIGH_SURROGATE_PATTERN = re.compile(r'\\u[dD][89abAB][0-9a-fA-F]{2}')
+STRUCTURE_PATTERN = re.compile(r'["{}\[\],]')
+WHITESPACE_PATTERN = re.compile(r'[ \t\n\r]*')
+
+
+class StreamFormatError(ValueError):
+    """Indicates that a stream does not contain the JSON it was expected to."""
+
+
+def unescape(match) -> str:
+    """Replace a matched JSON escape sequence with the character it stands for."""
+    escape = match.group(1)
+    if len(escape) == 11:
+        high, low = int(escape[1:5], 16), int(escape[7:], 16)
+        return chr(0x10000 + ((high - 0xD800) << 10) + low - 0xDC00)
+    if escape[0] == 'u':
+        return chr(int(escape[1:], 16))
+    try:
+        return ESCAPES[escape]
+    except KeyError as error:
+        raise StreamFormatError('Invalid escape sequence %r' % match.group()) from error
+
+
+def is_escaped(text: str, index: int, position: int) -> bool:
+    """Check whether the character at index is escaped by the backslashes before it.
+
+    :param text: The text to check.
+    :param index: The index of the character.
+    :param position: Where in the text the string being scanned starts. Backslashes before this are not counted.
+    :return: Whether or not the character is escaped.
+    """
+    start = index
+    while start > position and text[start - 1] == '\\':
+        start -= 1
+    return (index - start) % 2 == 1
+
+
+def find_quote(text: str, position: int) -> int:
+    """Find the first quote in text which is not escaped by a backslash.
+
+    :param text: The text to search.
+    :param position: Where in the text to start. Backslashes before this position are not counted.
+    :return: The index of the quote, or -1 if there is none.
+    """
+    quote = text.find('"', position)
+    while quote != -1 and is_escaped(text, quote, position):
+        quote = text.find('"', quote + 1)
+    return quote
+
+
+def incomplete_escape(text: str, position: int) -> int:
+    """Find an escape sequence cut off by the end of text.
+
+    A complete escape of the first half of a surrogate pair counts as incomplete, since it has to be decoded together
+    with the second half.
+
+    :param text: The text to search.
+    :param position: Where in the text the string being scanned starts.
+    :return: The index where the incomplete escape starts, or len(text) if there is none.
+    """
+    cut = len(text)
+    backslash = text.rfind('\\', max(position, cut - 5), cut)
+    if backslash != -1 and not is_escaped(text, backslash, position):
+        tail = text[backslash + 1:]
+        if not tail or (tail[0] == 'u' and len(tail) < 5):
+            cut = backslash
+    high = cut - 6
+    if high >= position and HIGH_SURROGATE_PATTERN.fullmatch(text, high, cut) and not is_escaped(text, high, position):
+        cut = high
+    return cut
+
+
+class ObjectParser:
+    """Incrementally parses a single JSON object which is fed to it in pieces of text.
+
+    String values of the streamed keys are passed to on_chunk piece by piece as they arrive, rather than being held
+    in memory. Every other value is stored in values once it is complete.
+    """
+
+    def __init__(self, streamed: Iterable[str] = (), on_chunk: Callable[[str, str], None] = None):
+        """
+        :param streamed: The keys whose string values should be streamed.
+        :param on_chunk: Called with the key and the next piece of the unescaped string of each streamed value.
+        """
+        self.values = {}
+        self.streamed = set()
+        self.done = False
+        self._streamed_keys = frozenset(streamed)
+        self._on_chunk = on_chunk
+        self._state = self._start
+        self._buffer = ''
+        self._raw = []
+        self._key = None
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, text: str):
+        """Parse the next piece of the object.
+
+        :param text: The next piece of the serialized object.
+        :raises StreamFormatError: The text is not a valid JSON object.
+        """
+        text, self._buffer = self._buffer + text, ''
+        position = 0
+        while position < len(text):
+            position = self._state(text, position)
+
+    def close(self):
+        """Check that the whole object has been received.
+
+        :raises StreamFormatError: The object is incomplete.
+        """
+        if not self.done or self._buffer:
+            raise StreamFormatError('The JSON object ended unexpectedly')
+
+    @staticmethod
+    def _skip(text: str, position: int) -> int:
+        return WHITESPACE_PATTERN.match(text, position).end()
+
+    @staticmethod
+    def _expect(text: str, position: int, expected: str) -> str:
+        if text[position] not in expected:
+            raise StreamFormatError('Expected one of %r but found %r' % (expected, text[position]))
+        return text[position]
+
+    def _start(self, text: str, position: int) -> int:
+        position = self._skip(text, position)
+        if position < len(text):
+            self._expect(text, position, '{')
+            self._state = self._key_or_end
+            position += 1
+        return position
+
+    def _key_or_end(self, text: str, position: int) -> int:
+        position = self._skip(text, position)
+        if position < len(text):
+            if self._expect(text, position, '"}') == '}':
+                self.done = True
+                self._state = self._trailing
+            else:
+                self._raw = []
+                self._state = self._key_string
+            position += 1
+        return position
+
+    def _key_string(self, text: str, position: int) -> int:
+        quote = find_quote(text, position)
+        if quote == -1:
+            cut = incomplete_escape(text, position)
+            self._raw.append(text[position:cut])
+            self._buffer = text[cut:]
+            return len(text)
+        self._raw.append(text[position:quote])
+        self._key = ESCAPE_PATTERN.sub(unescape, ''.join(self._raw))
+        self._state = self._colon
+        return quote + 1
+
+    def _colon(self, text: str, position: int) -> int:
+        position = self._skip(text, position)
+        if position < len(text):
+            self._expect(text, position, ':')
+            self._state = self._value_start
+            position += 1
+        return position
+
+    def _value_start(self, text: str, position: int) -> int:
+        position = self._skip(text, position)
+        if position < len(text):
+            if text[position] == '"' and self._key in self._streamed_keys:
+                self.streamed.add(self._key)
+                self._state = self._streamed_string
+                return position + 1
+            self._raw = []
+            self._depth = 0
+            self._in_string = False
+            self._state = self._raw_value
+        return position
+
+    def _raw_value(self, text: str, position: int) -> int:
+        if self._in_string:
+            return self._raw_string(text, position)
+        return self._raw_structure(text, position)
+
+    def _raw_string(self, text: str, position: int) -> int:
+        quote = find_quote(text, position)
+        if quote == -1:
+            cut = incomplete_escape(text, position)
+            self._raw.append(text[position:cut])
+            self._buffer = text[cut:]
+            return len(text)
+        self._raw.append(text[position:quote + 1])
+        self._in_string = False
+        if self._depth == 0:
+            return self._finish_value(quote + 1)
+        return quote + 1
+
+    def _raw_structure(self, text: str, position: int) -> int:
+        match = STRUCTURE_PATTERN.search(text, position)
+        if match is None:
+            self._raw.append(text[position:])
+            return len(text)
+        character = match.group()
+        if character in ',}]' and self._depth == 0:
+            self._raw.append(text[position:match.start()])
+            return self._finish_value(match.start())
+        self._raw.append(text[position:match.end()])
+        if character == '"':
+            self._in_string = True
+        elif character in '{[':
+            self._depth += 1
+        elif character in '}]':
+            self._depth -= 1
+            if self._depth == 0:
+                return self._finish_value(match.end())
+        return match.end()
+
+    def _finish_value(self, position: int) -> int:
+        try:
+            self.values[self._key] = json.loads(''.join(self._raw))
+        except ValueError as error:
+            raise StreamFormatError('Invalid value for %r' % self._key) from error
+        self._raw = []
+        self._state = self._after_value
+        return position
+
+    def _streamed_string(self, text: str, position: int) -> int:
+        quote = find_quote(text, position)
+        end = quote if quote != -1 else incomplete_escape(text, position)
+        piece = text[position:end]
+        if '\\' in piece:
+            piece = ESCAPE_PATTERN.sub(unescape, piece)
+        if piece:
+            self._on_chunk(self._key, piece)
+        if quote == -1:
+            self._buffer = text[end:]
+            return len(text)
+        self._state = self._after_value
+        return quote + 1
+
+    def _after_value(self, text: str, position: int) -> int:
+        position = self._skip(text, position)
+        if position < len(text):
+            if self._expect(text, position, ',}') == '}':
+                self.done = True
+                self._state = self._trailing
+            else:
+                self._state = self._key_or_end
+            position += 1
+        return position
+
+    def _trailing(self, text: str, position: int) -> int:
+        position = self._skip(text, position)
+        if position < len(text):
+            raise StreamFormatError('Unexpected data after the JSON object')
+        return position
+
+
+class AttachmentWriter:
+    """Decodes the base64 data URI of an attachment as it arrives and writes the content to a sink."""
+
+    def __init__(self, sink: BinaryIO):
+        self.sink = sink
+        self.size = 0
+        self.mime = None
+        self._prefix = ''
+        self._decoder = None
+
+    def write(self, text: str):
+        """Decode the next piece of the data URI.
+
+        :param text: The next piece of the data URI.
+        """
+        if self._decoder is None:
+            self._prefix += text
+            if ',' not in self._prefix:
+                return
+            header, text = self._prefix.split(',', 1)
+            self._prefix = ''
+            self.mime = header[len('data:'):].split(';', 1)[0] or None
+            self._decoder = Base64Decoder()
+            # Touch the sink, so that an empty attachment still creates its file
+            self.sink.write(b'')
+        self._emit(self._decoder.decode(text))
+
+    def close(self):
+        """Write whatever is left of the attachment."""
+        if self._decoder is not None:
+            self._emit(self._decoder.flush())
+
+    def _emit(self, data: bytes):
+        if data:
+            self.sink.write(data)
+            self.size += len(data)
+
+
+class PasteReader:
+    """Decrypts a version 2 paste from the raw bytes of a host's response as they arrive.
+
+    The attachment is written to a sink as it is decrypted. Apart from the text of the paste, memory use depends only
+    on the size of the chunks fed in. If the ciphertext arrives before the adata it can be decrypted with, it is
+    spooled to a temporary file until the adata arrives.
+    """
+
+    def __init__(self, passphrase: str, password: Optional[str], sink: BinaryIO):
+        """
+        :param passphrase: The part of the URL trailing the '#'.
+        :param password: Password for decrypting the paste.
+        :param sink: A binary file-like object to write the attachment to.
+        """
+        self.response = ObjectParser(streamed=('ct',), on_chunk=self._on_ciphertext)
+        self.message = ObjectParser(streamed=('attachment',), on_chunk=self._on_attachment)
+        self.attachment = AttachmentWriter(sink)
+        self._passphrase = passphrase
+        self._password = password or ''
+        self._response_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._message_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._decryptor = None
+        self._spool = None
+
+    def feed(self, data: bytes):
+        """Process the next chunk of the response body.
+
+        :param data: The next chunk of the response body.
+        """
+        self.response.feed(self._response_decoder.decode(data))
+
+    def close(self) -> dict:
+        """Finish decrypting the paste and verify it.
+
+        :return: Every value of the response apart from the ciphertext.
+        :raises StreamFormatError: The response or the decrypted message is not valid JSON.
+        :raises ValueError: The paste could not be authenticated.
+        """
+        self.response.feed(self._response_decoder.decode(b'', final=True))
+        self.response.close()
+        if self._spool is not None:
+            self._spool.seek(0)
+            for chunk in iter(lambda: self._spool.read(SPOOL_SIZE), ''):
+                self._on_ciphertext('ct', chunk)
+            self._spool.close()
+        if 'ct' in self.response.streamed:
+            with self._decrypting():
+                self._on_plaintext(self._get_decryptor().finish(), final=True)
+                self.message.close()
+            self.attachment.close()
+        return self.response.values
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _decrypting():
+        # Until the tag is verified, garbage from a wrong key shows up as inflate or parsing errors instead
+        try:
+            yield
+        except (ValueError, zlib.error) as error:
+            raise ValueError('Unable to decrypt the paste. The passphrase or password may be wrong.') from error
+
+    def _get_decryptor(self) -> StreamDecryptor:
+        if self._decryptor is None:
+            adata = self.response.values['adata']
+            self._decryptor = StreamDecryptor(b58decode(self._passphrase), self._password, adata)
+        return self._decryptor
+
+    def _on_ciphertext(self, _, text: str):
+        if self._decryptor is None and 'adata' not in self.response.values:
+            if self._spool is None:
+                self._spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, mode='w+')
+            self._spool.write(text)
+            return
+        with self._decrypting():
+            self._on_plaintext(self._get_decryptor().update(text))
+
+    def _on_plaintext(self, data: bytes, final: bool = False):
+        self.message.feed(self._message_decoder.decode(data, final=final))
+
+    def _on_attachment(self, _, text: str):
+        self.attachment.write(text)
+
+
+class TemporaryFile:
+    """A file in a given directory which is only created when it is first written to."""
+
+    def __init__(self, directory: str):
+        """
+        :param directory: The directory to create the file in.
+        """
+        self.directory = directory
+        self.name: Optional[str] = None
+        self._file = None
+
+    def write(self, data: bytes) -> int:
+        """Write to the file, creating it first if this is the first write.
+
+        :param data: The bytes to write.
+        :return: The number of bytes written.
+        """
+        if self._file is None:
+            descriptor, self.name = tempfile.mkstemp(dir=self.directory, prefix='.privatebinapi-')
+            self._file = os.fdopen(descriptor, 'wb')
+        return self._file.write(data)
+
+    def close(self):
+        """Close the file, if it was created."""
+        if self._file is not None:
+            self._file.close()
+
+
+@contextlib.contextmanager
+def open_sink(sink: Union[str, os.PathLike, BinaryIO]):
+    """Open the destination of a streamed attachment.
+
+    A path is written to through a temporary file in the same directory, which only replaces the path once the
+    with block exits without an error. The temporary file is created by the first write, so a paste without an
+    attachment leaves the path untouched. File-like objects are used as they are.
+
+    :param sink: A path or a binary file-like object.
+    :return: A context manager yielding a binary file-like object.
+    """
+    if hasattr(sink, 'write'):
+        yield sink
+        return
+    file = TemporaryFile(os.path.dirname(os.path.abspath(sink)))
+    try:
+        yield file
+        file.close()
+        if file.name is not None:
+            os.replace(file.name, sink)
+    except BaseException:
+        file.close()
+        if file.name is not None:
+            with contextlib.suppress(OSError):
+                os.unlink(file.name)
+        raise
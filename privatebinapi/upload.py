@@ -2,42 +2,71 @@
 
 """This module provides functions to upload pastes to PrivateBin hosts."""
 
+import base64
+import contextlib
 import functools
-import json
-from concurrent.futures import Executor
-from typing import Optional, Tuple, Union
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple, \
+    Union
 
-import httpx
-import requests
-from pbincli.api import PrivateBin
-from pbincli.format import Paste
+from base58 import b58encode
+from pbincli.format import CIPHER_SALT_BYTES, get_random_bytes
+from pbincli.utils import json_encode
 
-from privatebinapi.common import DEFAULT_HEADERS, get_loop, verify_response
+from privatebinapi import hooks
+from privatebinapi.attachments import FileSource, is_path, open_attachment, read_file_object
+from privatebinapi.capabilities import get_capabilities, get_capabilities_async
+from privatebinapi.common import DEFAULT_HEADERS, AsyncClientContext, BulkResult, RetryPolicy, call_with_retry, \
+    call_with_retry_async, get_loop, iterate_in_executor, loaded_classes, run_bounded, run_bounded_async, \
+    session_context, verify_response, with_timeout
+from privatebinapi.compression import COMPRESSION_LEVELS, COMPRESSION_TYPES, DEFAULT_LEVEL, choose_deflate
+from privatebinapi.crypto import TAG_BYTES, Paste, encrypt_stream, make_adata, new_key
+from privatebinapi.dedup import Deduplicator
 from privatebinapi.exceptions import BadCompressionTypeError, BadExpirationTimeError, BadFormatError, \
-    BadServerResponseError, PrivateBinAPIError
+    BadServerResponseError, PrivateBinAPIError, ServerUnavailableError, UnsupportedFeatureError
+from privatebinapi.hostpool import HostPool
+from privatebinapi.results import UploadResult
+from privatebinapi.serialization import dumps
 
-__all__ = ('send', 'send_async')
+if TYPE_CHECKING:  # The HTTP libraries are only imported once a request is made
+    import httpx
+    import requests
 
-COMPRESSION_TYPES = ('zlib', None)
+__all__ = (
+    'encrypt_paste', 'encrypt_paste_stream', 'send', 'send_async', 'send_many', 'send_many_async', 'submit_payload',
+    'submit_payload_async'
+)
+
+DEFAULT_CONCURRENCY = 10
+STREAM_CHUNK_SIZE = 3 * 2 ** 16  # A multiple of 3, so that base64 encoded chunks can be concatenated
 EXPIRATION_TIMES = ("5min", "10min", "1hour", "1day", "1week", "1month", "1year", "never")
 FORMAT_TYPES = ('plaintext', 'syntaxhighlighting', 'markdown')
+VALIDATED_OPTIONS = ('text', 'file', 'expiration', 'compression', 'formatting', 'compression_level')
 
+# Errors which say more about the host than the paste, so another host of a HostPool may succeed
+HOST_ERRORS = (BadServerResponseError, ServerUnavailableError, UnsupportedFeatureError)
+HOST_TRANSPORT_ERRORS = ('requests.exceptions.RequestException', 'httpx.TransportError')
 
-def prepare_upload(server: str, *, text: str = None, file: str = None, password: str = None, expiration: str = '1day',
-                   compression: str = 'zlib', formatting: str = 'plaintext', burn_after_reading: bool = False,
-                   discussion: bool = False) -> Tuple[dict, str]:
-    """Creates the JSON data needed to upload a paste to a PrivateBin host.
 
-    :param server: The home URL of the PrivateBin host.
+def failover_errors() -> Tuple[type, ...]:
+    """List the errors after which an upload to a HostPool moves on to the next host.
+
+    :return: A tuple of exception classes.
+    """
+    return HOST_ERRORS + loaded_classes(*HOST_TRANSPORT_ERRORS)
+
+
+def validate_options(*, text: str = None, file: FileSource = None, expiration: str = '1day', compression: str = 'zlib',
+                     formatting: str = 'plaintext', compression_level: int = DEFAULT_LEVEL):
+    """Check the options of a paste before any work is done on it.
+
     :param text: The text content of the paste.
-    :param file: The path of a file to attach to the paste.
-    :param password: A password to secure the paste.
+    :param file: The file to attach to the paste.
     :param expiration: After how long the paste should expire.
-    :param compression:What type of compression to use when uploading.
+    :param compression: What type of compression to use when uploading.
     :param formatting: What format the paste should be declared as.
-    :param burn_after_reading: Whether or not the paste should delete itself immediately after being read.
-    :param discussion: Whether or not to enable discussion on the paste.
-    :return: A tuple of the JSON data to POST to the PrivateBin host and the paste's hash
+    :param compression_level: The zlib compression level, from 0 (store) to 9, or -1 for zlib's default.
     """
     if not any((text, file)):
         raise ValueError("text and file many not both be None")
@@ -47,70 +76,426 @@ def prepare_upload(server: str, *, text: str = None, file: str = None, password:
         raise BadExpirationTimeError('expiration %s must be in %s' % (repr(expiration), EXPIRATION_TIMES))
     if compression not in COMPRESSION_TYPES:
         raise BadCompressionTypeError('compression %s must be in %s' % (repr(compression), COMPRESSION_TYPES))
+    if compression_level not in COMPRESSION_LEVELS:
+        raise BadCompressionTypeError('compression_level %s must be between -1 and 9' % repr(compression_level))
 
-    paste = Paste()
-    settings = {
-        'server': server,
-        'proxy': None,
-        'short_api': None,
-        'short_url': None,
-        'short_user': None,
-        'short_pass': None,
-        'short_token': None,
-        'no_check_certificate': False,
-        'no_insecure_warning': False
-    }
-    api_client = PrivateBin(settings)
-    try:
-        version = api_client.getVersion()
-    except json.JSONDecodeError as error:
-        raise BadServerResponseError("The host failed to respond with PrivateBin version information.") from error
-    paste.setVersion(version)
-    if version == 2 and compression:
-        paste.setCompression(compression)
-    else:
-        paste.setCompression('none')
-
-    paste.setText(text or '')
-    if password:
-        paste.setPassword(password)
-    if file:
-        paste.setAttachment(file)
+
+def encrypt_paste(*, version: int, text: str = None, file: FileSource = None, password: str = None,
+                  expiration: str = '1day', compression: str = 'zlib', formatting: str = 'plaintext',
+                  burn_after_reading: bool = False, discussion: bool = False, compression_level: int = DEFAULT_LEVEL,
+                  filename: str = None, mimetype: str = None) -> Tuple[Union[bytes, dict], str]:
+    """Encrypt a paste without doing any network I/O.
+
+    :param version: The API version of the PrivateBin host the paste is meant for.
+    :param text: The text content of the paste.
+    :param file: The file to attach to the paste: its path, its content as bytes, a memoryview or an mmap, or a
+        binary file object.
+    :param password: A password to secure the paste.
+    :param expiration: After how long the paste should expire.
+    :param compression: What type of compression to use when uploading.
+    :param formatting: What format the paste should be declared as.
+    :param burn_after_reading: Whether or not the paste should delete itself immediately after being read.
+    :param discussion: Whether or not to enable discussion on the paste.
+    :param compression_level: The zlib compression level, from 0 (store) to 9, or -1 for zlib's default.
+    :param filename: The name of the attachment. Required unless file is a path or a named file object.
+    :param mimetype: The MIME type of the attachment. If None, it is guessed from the name.
+    :return: A tuple of the data to POST to the PrivateBin host and the paste's hash. Version 2 pastes are
+        already serialized to JSON bytes; version 1 pastes are a dict of form fields.
+    """
+    validate_options(
+        text=text, file=file, expiration=expiration, compression=compression, formatting=formatting,
+        compression_level=compression_level
+    )
+
+    started = hooks.start()
+    with contextlib.ExitStack() as stack:
+        source = stack.enter_context(open_attachment(file, filename, mimetype)) if file else None
+        deflate = None
+        if version == 2:
+            deflate = choose_deflate(
+                compression, compression_level, text=text, file=source.content if source else None
+            )
+        paste = Paste(deflate=deflate)
+        paste.setVersion(version)
+        paste.setCompression('zlib' if deflate else 'none')
+
+        paste.setText(text or '')
+        if password:
+            paste.setPassword(password)
+        if source is not None:
+            paste.setAttachmentContent(source.content, source.name, source.mimetype)
     paste.encrypt(formatting, burn_after_reading, discussion, expiration)
-    data = paste.getJSON()
-    return data, paste.getHash()
+    payload = encode_payload(paste.data) if version == 2 else paste.getJSON()
+    if started is not None:
+        plaintext_size, compressed_size = paste.compression_sizes or (None, None)
+        hooks.finish(
+            started, 'send', 'encrypt', None, version=version, plaintext_size=plaintext_size,
+            compressed_size=compressed_size, payload_size=len(payload) if isinstance(payload, bytes) else None
+        )
+    return payload, paste.getHash()
+
+
+def encode_payload(data: dict) -> bytes:
+    """Serialize a version 2 paste for upload.
+
+    The ciphertext is already base64, which never needs escaping, so it is spliced in rather than run through the
+    JSON encoder. That keeps it to one copy however large the attachment is.
+
+    :param data: The paste's JSON data, with the ciphertext under 'ct'.
+    :return: The request body.
+    """
+    head = dumps({key: value for key, value in data.items() if key != 'ct'})
+    return b''.join((head[:-1], b',"ct":"', data['ct'].encode('ascii'), b'"}'))
+
+
+def iter_message(text: str, file: FileSource, chunk_size: int, filename: str = None,
+                 mimetype: str = None) -> Iterator[bytes]:
+    """Serialize the plaintext JSON message of a paste in chunks, reading the attachment as it goes.
+
+    :param text: The text content of the paste.
+    :param file: The file to attach to the paste.
+    :param chunk_size: How many bytes of the attachment to read at once. Must be a multiple of 3.
+    :param filename: The name of the attachment. If None, it is taken from file.
+    :param mimetype: The MIME type of the attachment. If None, it is guessed from the name.
+    :return: An iterator over the serialized message.
+    """
+    yield b'{"paste":' + json_encode(text or '')
+    if file:
+        with open_attachment(file, filename, mimetype) as source:
+            yield b',"attachment":"data:' + source.mimetype.encode() + b';base64,'
+            for offset in range(0, source.content.nbytes, chunk_size):
+                yield base64.b64encode(source.content[offset:offset + chunk_size])
+        yield b'","attachment_name":' + json_encode(source.name)
+    yield b'}'
+
+
+def encrypt_paste_stream(*, text: str = None, file: FileSource = None, password: str = None,
+                         expiration: str = '1day', compression: str = 'zlib', formatting: str = 'plaintext',
+                         burn_after_reading: bool = False, discussion: bool = False,
+                         compression_level: int = DEFAULT_LEVEL, chunk_size: int = STREAM_CHUNK_SIZE,
+                         filename: str = None, mimetype: str = None) -> Tuple[Iterator[bytes], str]:
+    """Encrypt a version 2 paste lazily, so that memory use does not grow with the size of the attachment.
 
+    The attachment is read, compressed and encrypted one chunk at a time as the returned iterator is consumed. Files
+    on disk are memory-mapped, so they are never held in memory at once. A file object is read in full first.
 
-def process_result(response: Union[requests.Response, httpx.Response], passcode: str):
+    :param text: The text content of the paste.
+    :param file: The file to attach to the paste: its path, its content as bytes, a memoryview or an mmap, or a
+        binary file object.
+    :param password: A password to secure the paste.
+    :param expiration: After how long the paste should expire.
+    :param compression: What type of compression to use when uploading.
+    :param formatting: What format the paste should be declared as.
+    :param burn_after_reading: Whether or not the paste should delete itself immediately after being read.
+    :param discussion: Whether or not to enable discussion on the paste.
+    :param compression_level: The zlib compression level, from 0 (store) to 9, or -1 for zlib's default.
+    :param chunk_size: How many bytes of the attachment to read at once. Must be a multiple of 3.
+    :param filename: The name of the attachment. Required unless file is a path or a named file object.
+    :param mimetype: The MIME type of the attachment. If None, it is guessed from the name.
+    :return: A tuple of an iterator over the JSON data to POST to the PrivateBin host and the paste's hash
+    """
+    validate_options(
+        text=text, file=file, expiration=expiration, compression=compression, formatting=formatting,
+        compression_level=compression_level
+    )
+    if chunk_size % 3:
+        raise ValueError("chunk_size must be a multiple of 3")
+    file, filename = read_file_object(file, filename)
+    if file is not None and is_path(file):
+        os.stat(file)
+
+    key = new_key()
+    iv = get_random_bytes(TAG_BYTES)
+    salt = get_random_bytes(CIPHER_SALT_BYTES)
+    deflate = choose_deflate(compression, compression_level, text=text, file=file)
+    adata = make_adata(iv, salt, 'zlib' if deflate else 'none', formatting, discussion, burn_after_reading)
+
+    def body() -> Iterator[bytes]:
+        yield b'{"v":2,"adata":' + json_encode(adata) + b',"meta":' + json_encode({'expire': expiration}) + b',"ct":"'
+        yield from encrypt_stream(
+            iter_message(text, file, chunk_size, filename, mimetype), key=key, password=password or '', iv=iv,
+            salt=salt, adata=adata, deflate=deflate
+        )
+        yield b'"}'
+
+    return body(), b58encode(key).decode()
+
+
+def check_streaming_support(server: str, version: int):
+    """Make sure that a host can receive streamed uploads.
+
+    :param server: The home URL of the PrivateBin host.
+    :param version: The API version of the host.
+    :raises UnsupportedFeatureError: The host only supports version 1 pastes.
+    """
+    if version != 2:
+        raise UnsupportedFeatureError('%s does not support version 2 pastes, which streaming requires' % server)
+
+
+def prepare_upload(server: str, *, text: str = None, file: FileSource = None, password: str = None,
+                   expiration: str = '1day', compression: str = 'zlib', formatting: str = 'plaintext',
+                   burn_after_reading: bool = False, discussion: bool = False, compression_level: int = DEFAULT_LEVEL,
+                   filename: str = None, mimetype: str = None, version: int = None,
+                   session: 'requests.Session' = None, proxies: dict = None,
+                   retry_policy: RetryPolicy = None) -> Tuple[Union[bytes, dict], str]:
+    """Creates the JSON data needed to upload a paste to a PrivateBin host.
+
+    :param server: The home URL of the PrivateBin host.
+    :param text: The text content of the paste.
+    :param file: The file to attach to the paste: its path, its content as bytes, a memoryview or an mmap, or a
+        binary file object.
+    :param password: A password to secure the paste.
+    :param expiration: After how long the paste should expire.
+    :param compression:What type of compression to use when uploading.
+    :param formatting: What format the paste should be declared as.
+    :param burn_after_reading: Whether or not the paste should delete itself immediately after being read.
+    :param discussion: Whether or not to enable discussion on the paste.
+    :param compression_level: The zlib compression level, from 0 (store) to 9, or -1 for zlib's default.
+    :param filename: The name of the attachment. Required unless file is a path or a named file object.
+    :param mimetype: The MIME type of the attachment. If None, it is guessed from the name.
+    :param version: The API version of the host. If None, it is looked up in the capability cache.
+    :param session: A requests.Session used if the version has to be requested from the host.
+    :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param retry_policy: How to retry the version lookup if it fails. If None, it is not retried.
+    :return: A tuple of the JSON data to POST to the PrivateBin host and the paste's hash
+    """
+    validate_options(
+        text=text, file=file, expiration=expiration, compression=compression, formatting=formatting,
+        compression_level=compression_level
+    )
+    if version is None:
+        version = get_capabilities(server, session=session, proxies=proxies, retry_policy=retry_policy).version
+    return encrypt_paste(
+        version=version, text=text, file=file, password=password, expiration=expiration, compression=compression,
+        formatting=formatting, burn_after_reading=burn_after_reading, discussion=discussion,
+        compression_level=compression_level, filename=filename, mimetype=mimetype
+    )
+
+
+def process_result(response: 'Union[requests.Response, httpx.Response]', passcode: str) -> UploadResult:
     """Convert a response and passcode into a link and extract the delete token.
 
     :param response: The response from the PrivateBin host.
     :param passcode: The passcode of the paste.
-    :return: A tuple containing the paste's URL and delete token.
+    :return: The host's response, with the paste's full URL and passcode.
     """
-    data = verify_response(response)
+    data = verify_response(response, operation='send')
 
     if data['status'] == 0:
-        url = str(response.url)
-
-        output = {
-            **data,
-            'full_url': url + '?' + data['id'] + '#' + passcode,
-            'passcode': passcode
-        }
-        return output
-        # return str(response.url) + '?' + data['id'] + '#' + passcode, data['deletetoken']
+        return UploadResult(data, str(response.url), passcode)
     raise PrivateBinAPIError("Error uploading paste: %s" % data['message'])
 
 
-def send(server: str, *, text: str = None, file: str = None, password: str = None, expiration: str = '1day',
-         compression: Optional[str] = 'zlib', formatting: str = 'plaintext', burn_after_reading: bool = False,
-         proxies: dict = None, discussion: bool = False):
-    """Upload a paste to a PrivateBin host.
+def submit_payload(server: str, payload: Union[bytes, dict, Iterator[bytes]], passcode: str, *, proxies: dict = None,
+                   session: 'requests.Session' = None) -> UploadResult:
+    """Upload a paste that has already been encrypted by encrypt_paste.
 
     :param server: The home URL of the PrivateBin host.
+    :param payload: The JSON data returned by encrypt_paste or encrypt_paste_stream.
+    :param passcode: The paste's hash returned by encrypt_paste.
+    :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
+    :return: The link to the paste and the delete token.
+    """
+    with session_context(session) as session:
+        response = session.post(
+            server,
+            headers=DEFAULT_HEADERS,
+            proxies=proxies,
+            data=payload
+        )
+    return process_result(response, passcode)
+
+
+async def submit_payload_async(server: str, payload: Union[bytes, dict, AsyncIterator[bytes]], passcode: str, *,
+                               proxies: dict = None, client: 'httpx.AsyncClient' = None) -> UploadResult:
+    """Asynchronously upload a paste that has already been encrypted by encrypt_paste.
+
+    :param server: The home URL of the PrivateBin host.
+    :param payload: The JSON data returned by encrypt_paste, or an async iterator of bytes.
+    :param passcode: The paste's hash returned by encrypt_paste.
+    :param proxies: A dict of proxies to pass to an httpx.AsyncClient object.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :return: The link to the paste and the delete token.
+    """
+    async with AsyncClientContext(client, proxies=proxies) as client:
+        if isinstance(payload, dict):
+            response = await client.post(server, headers=DEFAULT_HEADERS, data=payload)
+        else:
+            response = await client.post(server, headers=DEFAULT_HEADERS, content=payload)
+    return process_result(response, passcode)
+
+
+def no_host_error(pool: HostPool, error: Optional[BaseException]) -> BaseException:
+    """Build the exception raised when every host of a pool has failed.
+
+    :param pool: The HostPool.
+    :param error: The exception raised by the last host tried.
+    :return: That exception, or a PrivateBinAPIError if no host was tried.
+    """
+    return error if error is not None else PrivateBinAPIError('No host in %r is available' % pool)
+
+
+def send_to_pool(pool: HostPool, *, stream: bool, retry_policy: Optional[RetryPolicy], proxies: Optional[dict],
+                 session: 'requests.Session', **options) -> UploadResult:
+    """Upload a paste to the best host of a pool, failing over to the next host if it fails.
+
+    The paste is encrypted at most once for each API version among the hosts tried, unless it is streamed.
+
+    :param pool: The HostPool to choose a host from.
+    :param stream: Whether or not to read, encrypt and upload the attachment in chunks.
+    :param retry_policy: How to retry requests to each host. If None, each host is tried once.
+    :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param session: The requests.Session to use.
+    :param options: The options of the paste, as passed to encrypt_paste.
+    :return: The link to the paste, on the host that stored it, and the delete token.
+    """
+    payloads = {}
+    error = None
+    for server in pool.candidates():
+        started = pool.start(server)
+        if started is None:
+            continue
+        try:
+            if stream:
+                result = send(server, stream=True, retry_policy=retry_policy, proxies=proxies, session=session,
+                              **options)
+            else:
+                version = get_capabilities(server, session=session, proxies=proxies, retry_policy=retry_policy).version
+                if version not in payloads:
+                    payloads[version] = encrypt_paste(version=version, **options)
+                data, passcode = payloads[version]
+                result = call_with_retry(
+                    lambda: submit_payload(server, data, passcode, proxies=proxies, session=session), server,
+                    retry_policy, idempotent=False, operation='send'
+                )
+        except failover_errors() as failure:
+            pool.failed(server)
+            error = failure
+            continue
+        except BaseException:
+            pool.abandon(server)
+            raise
+        pool.succeeded(server, started)
+        return result
+    raise no_host_error(pool, error)
+
+
+async def send_to_pool_async(pool: HostPool, *, stream: bool, retry_policy: Optional[RetryPolicy],
+                             executor: Optional[Executor], client: 'httpx.AsyncClient', **options) -> UploadResult:
+    """Asynchronously upload a paste to the best host of a pool, failing over to the next host if it fails.
+
+    The paste is encrypted at most once for each API version among the hosts tried, unless it is streamed.
+
+    :param pool: The HostPool to choose a host from.
+    :param stream: Whether or not to read, encrypt and upload the attachment in chunks.
+    :param retry_policy: How to retry requests to each host. If None, each host is tried once.
+    :param executor: A concurrent.futures.Executor instance used for encryption.
+    :param client: The httpx.AsyncClient to use.
+    :param options: The options of the paste, as passed to encrypt_paste.
+    :return: The link to the paste, on the host that stored it, and the delete token.
+    """
+    payloads = {}
+    error = None
+    for server in pool.candidates():
+        started = pool.start(server)
+        if started is None:
+            continue
+        try:
+            if stream:
+                result = await send_async(server, stream=True, retry_policy=retry_policy, executor=executor,
+                                          client=client, **options)
+            else:
+                version = (await get_capabilities_async(server, client=client, retry_policy=retry_policy)).version
+                if version not in payloads:
+                    func = functools.partial(encrypt_paste, version=version, **options)
+                    payloads[version] = await get_loop().run_in_executor(executor, func)
+                data, passcode = payloads[version]
+                result = await call_with_retry_async(
+                    lambda: submit_payload_async(server, data, passcode, client=client), server, retry_policy,
+                    idempotent=False, operation='send'
+                )
+        except failover_errors() as failure:
+            pool.failed(server)
+            error = failure
+            continue
+        except BaseException:
+            pool.abandon(server)
+            raise
+        pool.succeeded(server, started)
+        return result
+    raise no_host_error(pool, error)
+
+
+def dedup_servers(server: Union[str, HostPool]) -> Union[str, List[str]]:
+    """List the hosts a paste may end up on, for fingerprinting it.
+
+    :param server: The home URL of the PrivateBin host, or a HostPool.
+    :return: The URL, or the URLs of every host in the pool.
+    """
+    if isinstance(server, HostPool):
+        return [status.server for status in server.status()]
+    return server
+
+
+def send_deduplicated(dedup: Deduplicator, server: Union[str, HostPool], upload: Callable[[], UploadResult],
+                      options: dict) -> UploadResult:
+    """Upload a paste unless an identical one was uploaded before and has not expired.
+
+    :param dedup: The Deduplicator which remembers earlier uploads.
+    :param server: The home URL of the PrivateBin host, or a HostPool.
+    :param upload: A function which uploads the paste.
+    :param options: The options of the paste, as passed to encrypt_paste.
+    :return: The result of the earlier upload, or of upload.
+    """
+    validate_options(**{key: value for key, value in options.items() if key in VALIDATED_OPTIONS})
+    fingerprint = dedup.fingerprint(dedup_servers(server), **options)
+    previous = dedup.lookup(fingerprint) if fingerprint is not None else None
+    if previous is not None:
+        return previous
+    result = upload()
+    if fingerprint is not None:
+        dedup.record(fingerprint, result, options.get('expiration', '1day'))
+    return result
+
+
+async def send_deduplicated_async(dedup: Deduplicator, server: Union[str, HostPool],
+                                  upload: Callable[[], Awaitable[UploadResult]], options: dict) -> UploadResult:
+    """Asynchronously upload a paste unless an identical one was uploaded before and has not expired.
+
+    Fingerprinting reads the attachment and the index may be a database, so both are done in the default executor.
+
+    :param dedup: The Deduplicator which remembers earlier uploads.
+    :param server: The home URL of the PrivateBin host, or a HostPool.
+    :param upload: A coroutine function which uploads the paste.
+    :param options: The options of the paste, as passed to encrypt_paste.
+    :return: The result of the earlier upload, or of upload.
+    """
+    validate_options(**{key: value for key, value in options.items() if key in VALIDATED_OPTIONS})
+    loop = get_loop()
+    fingerprint = await loop.run_in_executor(
+        None, functools.partial(dedup.fingerprint, dedup_servers(server), **options)
+    )
+    previous = await loop.run_in_executor(None, dedup.lookup, fingerprint) if fingerprint is not None else None
+    if previous is not None:
+        return previous
+    result = await upload()
+    if fingerprint is not None:
+        await loop.run_in_executor(None, dedup.record, fingerprint, result, options.get('expiration', '1day'))
+    return result
+
+
+def send(server: Union[str, HostPool], *, text: str = None, file: FileSource = None, password: str = None,
+         expiration: str = '1day', compression: Optional[str] = 'zlib', formatting: str = 'plaintext',
+         burn_after_reading: bool = False, proxies: dict = None, discussion: bool = False,
+         compression_level: int = DEFAULT_LEVEL, stream: bool = False, retry_policy: RetryPolicy = None,
+         filename: str = None, mimetype: str = None, dedup: Deduplicator = None, session: 'requests.Session' = None):
+    """Upload a paste to a PrivateBin host.
+
+    :param server: The home URL of the PrivateBin host, or a HostPool to pick a host from.
     :param text: The text content of the paste.
-    :param file: The path of a file to attach to the paste.
+    :param file: The file to attach to the paste: its path, its content as bytes, a memoryview or an mmap, or a
+        binary file object. Files of 1 MiB or more are memory-mapped, and file objects are read once, up front.
     :param password: A password to secure the paste.
     :param expiration: After how long the paste should expire.
     :param compression: What type of compression to use when uploading.
@@ -118,30 +503,81 @@ def send(server: str, *, text: str = None, file: str = None, password: str = Non
     :param burn_after_reading: Whether or not the paste should delete itself immediately after being read.
     :param proxies: A dict of proxies to pass to a requests.Session object.
     :param discussion: Whether or not to enable discussion on the paste.
+    :param compression_level: The zlib compression level, from 0 (store) to 9, or -1 for zlib's default.
+    :param stream: Whether or not to read, encrypt and upload the attachment in chunks, keeping memory use low.
+    :param retry_policy: How to retry requests that fail and limit the rate they are made at. If None, they are not.
+    :param filename: The name of the attachment. Required unless file is a path or a named file object.
+    :param mimetype: The MIME type of the attachment. If None, it is guessed from the name.
+    :param dedup: A Deduplicator to return an earlier upload of the same paste from instead of uploading it again.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
     :return: The link to the paste and the delete token.
     """
-    data, passcode = prepare_upload(
-        server, text=text, file=file, password=password, expiration=expiration, compression=compression,
-        formatting=formatting, burn_after_reading=burn_after_reading, discussion=discussion
-    )
-    with requests.Session() as session:
-        response = session.post(
-            server,
-            headers=DEFAULT_HEADERS,
-            proxies=proxies,
-            data=data
+    file, filename = read_file_object(file, filename)
+    if dedup is not None:
+        options = dict(
+            text=text, file=file, password=password, expiration=expiration, formatting=formatting,
+            burn_after_reading=burn_after_reading, discussion=discussion, filename=filename, mimetype=mimetype
         )
-    return process_result(response, passcode)
+        return send_deduplicated(dedup, server, lambda: send(
+            server, compression=compression, proxies=proxies, compression_level=compression_level, stream=stream,
+            retry_policy=retry_policy, session=session, **options
+        ), options)
 
+    with session_context(session) as session:
+        if isinstance(server, HostPool):
+            validate_options(
+                text=text, file=file, expiration=expiration, compression=compression, formatting=formatting,
+                compression_level=compression_level
+            )
+            return send_to_pool(
+                server, stream=stream, retry_policy=retry_policy, proxies=proxies, session=session, text=text,
+                file=file, password=password, expiration=expiration, compression=compression, formatting=formatting,
+                burn_after_reading=burn_after_reading, discussion=discussion, compression_level=compression_level,
+                filename=filename, mimetype=mimetype
+            )
+        if stream:
+            validate_options(
+                text=text, file=file, expiration=expiration, compression=compression, formatting=formatting,
+                compression_level=compression_level
+            )
+            capabilities = get_capabilities(server, session=session, proxies=proxies, retry_policy=retry_policy)
+            check_streaming_support(server, capabilities.version)
 
-async def send_async(server: str, *, text: str = None, file: str = None, password: str = None, expiration: str = '1day',
-                     compression: str = 'zlib', formatting: str = 'plaintext', burn_after_reading: bool = False,
-                     proxies: dict = None, discussion: bool = False, executor: Executor = None):
+            def upload() -> UploadResult:
+                # A streamed body can only be sent once, so each attempt encrypts the paste again
+                data, passcode = encrypt_paste_stream(
+                    text=text, file=file, password=password, expiration=expiration, compression=compression,
+                    formatting=formatting, burn_after_reading=burn_after_reading, discussion=discussion,
+                    compression_level=compression_level, filename=filename, mimetype=mimetype
+                )
+                return submit_payload(server, data, passcode, proxies=proxies, session=session)
+        else:
+            data, passcode = prepare_upload(
+                server, text=text, file=file, password=password, expiration=expiration, compression=compression,
+                formatting=formatting, burn_after_reading=burn_after_reading, discussion=discussion,
+                compression_level=compression_level, filename=filename, mimetype=mimetype, session=session,
+                proxies=proxies, retry_policy=retry_policy
+            )
+
+            def upload() -> UploadResult:
+                return submit_payload(server, data, passcode, proxies=proxies, session=session)
+
+        return call_with_retry(upload, server, retry_policy, idempotent=False, operation='send')
+
+
+@with_timeout
+async def send_async(server: Union[str, HostPool], *, text: str = None, file: FileSource = None,
+                     password: str = None, expiration: str = '1day', compression: str = 'zlib',
+                     formatting: str = 'plaintext', burn_after_reading: bool = False, proxies: dict = None,
+                     discussion: bool = False, compression_level: int = DEFAULT_LEVEL, stream: bool = False,
+                     retry_policy: RetryPolicy = None, executor: Executor = None, filename: str = None,
+                     mimetype: str = None, dedup: Deduplicator = None, client: 'httpx.AsyncClient' = None):
     """Asynchronously upload a paste to a PrivateBin host.
 
-    :param server: The home URL of the PrivateBin host.
+    :param server: The home URL of the PrivateBin host, or a HostPool to pick a host from.
     :param text: The text content of the paste.
-    :param file: The path of a file to attach to the paste.
+    :param file: The file to attach to the paste: its path, its content as bytes, a memoryview or an mmap, or a
+        binary file object. Files of 1 MiB or more are memory-mapped, and file objects are read once, up front.
     :param password: A password to secure the paste.
     :param expiration: After how long the paste should expire.
     :param compression: What type of compression to use when uploading.
@@ -149,14 +585,167 @@ async def send_async(server: str, *, text: str = None, file: str = None, passwor
     :param burn_after_reading: Whether or not the paste should delete itself immediately after being read.
     :param proxies: A dict of proxies to pass to a requests.Session object.
     :param discussion: Whether or not to enable discussion on the paste.
-    :param executor: A concurrent.futures.Executor instance used for decryption.
+    :param compression_level: The zlib compression level, from 0 (store) to 9, or -1 for zlib's default.
+    :param stream: Whether or not to read, encrypt and upload the attachment in chunks, keeping memory use low.
+    :param retry_policy: How to retry requests that fail and limit the rate they are made at. If None, they are not.
+    :param executor: A concurrent.futures.Executor instance used for encryption. Attachments given as buffers other
+        than bytes cannot be sent to another process, so they are encrypted in the default executor instead of a
+        ProcessPoolExecutor.
+    :param filename: The name of the attachment. Required unless file is a path or a named file object.
+    :param mimetype: The MIME type of the attachment. If None, it is guessed from the name.
+    :param dedup: A Deduplicator to return an earlier upload of the same paste from instead of uploading it again.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :param timeout: A deadline in seconds for the whole upload. If it passes, asyncio.TimeoutError is raised.
     :return: The link to the paste and the delete token.
     """
-    func = functools.partial(
-        prepare_upload, server, text=text, file=file, password=password, expiration=expiration, compression=compression,
-        formatting=formatting, burn_after_reading=burn_after_reading, discussion=discussion
+    file, filename = read_file_object(file, filename)
+    if dedup is not None:
+        options = dict(
+            text=text, file=file, password=password, expiration=expiration, formatting=formatting,
+            burn_after_reading=burn_after_reading, discussion=discussion, filename=filename, mimetype=mimetype
+        )
+        return await send_deduplicated_async(dedup, server, lambda: send_async(
+            server, compression=compression, proxies=proxies, compression_level=compression_level, stream=stream,
+            retry_policy=retry_policy, executor=executor, client=client, **options
+        ), options)
+
+    validate_options(
+        text=text, file=file, expiration=expiration, compression=compression, formatting=formatting,
+        compression_level=compression_level
     )
-    data, passcode = await get_loop().run_in_executor(executor, func)
-    async with httpx.AsyncClient(proxies=proxies, headers=DEFAULT_HEADERS) as client:
-        response = await client.post(server, data=data)
-    return process_result(response, passcode)
+    if isinstance(executor, ProcessPoolExecutor) and file is not None and not isinstance(file, bytes) \
+            and not is_path(file):
+        executor = None
+    async with AsyncClientContext(client, proxies=proxies) as client:
+        if isinstance(server, HostPool):
+            return await send_to_pool_async(
+                server, stream=stream, retry_policy=retry_policy, executor=executor, client=client, text=text,
+                file=file, password=password, expiration=expiration, compression=compression, formatting=formatting,
+                burn_after_reading=burn_after_reading, discussion=discussion, compression_level=compression_level,
+                filename=filename, mimetype=mimetype
+            )
+        capabilities = await get_capabilities_async(server, client=client, retry_policy=retry_policy)
+        if stream:
+            check_streaming_support(server, capabilities.version)
+            # The body is a generator, which cannot be sent to another process
+            if isinstance(executor, ProcessPoolExecutor):
+                executor = None
+
+            async def upload() -> UploadResult:
+                # A streamed body can only be sent once, so each attempt encrypts the paste again
+                data, passcode = encrypt_paste_stream(
+                    text=text, file=file, password=password, expiration=expiration, compression=compression,
+                    formatting=formatting, burn_after_reading=burn_after_reading, discussion=discussion,
+                    compression_level=compression_level, filename=filename, mimetype=mimetype
+                )
+                return await submit_payload_async(
+                    server, iterate_in_executor(data, executor), passcode, client=client
+                )
+        else:
+            func = functools.partial(
+                encrypt_paste, version=capabilities.version, text=text, file=file, password=password,
+                expiration=expiration, compression=compression, formatting=formatting,
+                burn_after_reading=burn_after_reading, discussion=discussion, compression_level=compression_level,
+                filename=filename, mimetype=mimetype
+            )
+            data, passcode = await get_loop().run_in_executor(executor, func)
+
+            async def upload() -> UploadResult:
+                return await submit_payload_async(server, data, passcode, client=client)
+
+        return await call_with_retry_async(upload, server, retry_policy, idempotent=False, operation='send')
+
+
+def send_many(server: Union[str, HostPool], items: Iterable[dict], *, concurrency: int = DEFAULT_CONCURRENCY,
+              proxies: dict = None, retry_policy: RetryPolicy = None, dedup: Deduplicator = None,
+              session: 'requests.Session' = None) -> Iterator[BulkResult]:
+    """Upload many pastes to a PrivateBin host using a pool of threads.
+
+    The host's version is looked up once and one session is shared by the whole batch. An item that fails does not
+    stop the others; its exception is reported in its result instead.
+
+    :param server: The home URL of the PrivateBin host, or a HostPool to spread the pastes across.
+    :param items: Dicts of keyword arguments for encrypt_paste, one per paste.
+    :param concurrency: The maximum number of pastes being encrypted or uploaded at once.
+    :param proxies: A dict of proxies to pass to a requests.Session object.
+    :param retry_policy: How to retry requests that fail and limit the rate they are made at. If None, they are not.
+        Give it a RateLimiter to keep a large batch at a pace the host accepts.
+    :param dedup: A Deduplicator to return earlier uploads of the same pastes from instead of uploading them again.
+    :param session: A requests.Session to reuse. If None, a temporary session is used.
+    :return: An iterator of BulkResults in the order the uploads complete. Their index is the position of the item.
+    """
+    with session_context(session, pool_maxsize=concurrency) as session:
+        if isinstance(server, HostPool):
+            def send_one(options: dict) -> UploadResult:
+                validate_options(**{key: value for key, value in options.items() if key in VALIDATED_OPTIONS})
+                return send_to_pool(
+                    server, stream=False, retry_policy=retry_policy, proxies=proxies, session=session, **options
+                )
+        else:
+            version = get_capabilities(server, session=session, proxies=proxies, retry_policy=retry_policy).version
+
+            def send_one(options: dict) -> UploadResult:
+                data, passcode = encrypt_paste(version=version, **options)
+                return call_with_retry(
+                    lambda: submit_payload(server, data, passcode, proxies=proxies, session=session), server,
+                    retry_policy, idempotent=False, operation='send'
+                )
+
+        if dedup is not None:
+            upload_one = send_one
+
+            def send_one(options: dict) -> UploadResult:  # pylint: disable=function-redefined
+                return send_deduplicated(dedup, server, lambda: upload_one(options), options)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            yield from run_bounded(executor, send_one, items, concurrency)
+
+
+async def send_many_async(server: Union[str, HostPool], items: Iterable[dict], *,
+                          concurrency: int = DEFAULT_CONCURRENCY, proxies: dict = None,
+                          retry_policy: RetryPolicy = None, executor: Executor = None, dedup: Deduplicator = None,
+                          client: 'httpx.AsyncClient' = None) -> AsyncIterator[BulkResult]:
+    """Asynchronously upload many pastes to a PrivateBin host.
+
+    The host's version is looked up once and one client is shared by the whole batch. Encryption runs in the executor
+    while other pastes are being uploaded. An item that fails does not stop the others; its exception is reported in
+    its result instead.
+
+    :param server: The home URL of the PrivateBin host, or a HostPool to spread the pastes across.
+    :param items: Dicts of keyword arguments for encrypt_paste, one per paste.
+    :param concurrency: The maximum number of pastes being encrypted or uploaded at once.
+    :param proxies: A dict of proxies to pass to an httpx.AsyncClient object.
+    :param retry_policy: How to retry requests that fail and limit the rate they are made at. If None, they are not.
+        Give it a RateLimiter to keep a large batch at a pace the host accepts.
+    :param executor: A concurrent.futures.Executor instance used for encryption.
+    :param dedup: A Deduplicator to return earlier uploads of the same pastes from instead of uploading them again.
+    :param client: An httpx.AsyncClient to reuse. If None, a temporary client is used.
+    :return: An async iterator of BulkResults in the order the uploads complete. Their index is the position of the
+        item.
+    """
+    async with AsyncClientContext(client, proxies=proxies) as client:
+        if isinstance(server, HostPool):
+            async def send_one(options: dict) -> UploadResult:
+                validate_options(**{key: value for key, value in options.items() if key in VALIDATED_OPTIONS})
+                return await send_to_pool_async(
+                    server, stream=False, retry_policy=retry_policy, executor=executor, client=client, **options
+                )
+        else:
+            capabilities = await get_capabilities_async(server, client=client, retry_policy=retry_policy)
+
+            async def send_one(options: dict) -> UploadResult:
+                func = functools.partial(encrypt_paste, version=capabilities.version, **options)
+                data, passcode = await get_loop().run_in_executor(executor, func)
+                return await call_with_retry_async(
+                    lambda: submit_payload_async(server, data, passcode, client=client), server, retry_policy,
+                    idempotent=False, operation='send'
+                )
+
+        if dedup is not None:
+            upload_one = send_one
+
+            async def send_one(options: dict) -> UploadResult:  # pylint: disable=function-redefined
+                return await send_deduplicated_async(dedup, server, lambda: upload_one(options), options)
+
+        async for result in run_bounded_async(send_one, items, concurrency):
+            yield result
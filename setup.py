@@ -13,6 +13,13 @@ setuptools.setup(
     url='https://github.com/Pioverpie/privatebin-api/',
     packages=['privatebinapi'],
     install_requires=['PBinCLI', 'requests', 'httpx'],
+    entry_points={
+        'console_scripts': ['privatebinapi=privatebinapi.cli:main'],
+    },
+    extras_require={
+        'opentelemetry': ['opentelemetry-api>=1.12'],
+        'prometheus': ['prometheus_client'],
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
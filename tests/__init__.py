@@ -8,4 +8,4 @@ SERVERS_AND_FILES = (
     # ('https://paste.nikul.in/', None),  # PrivateBin 1.0 (Host offline)
 )
 
-__all__ = ('MESSAGE', 'RESPONSE_DATA', 'SERVERS_AND_FILES')
+__all__ = ('FILE', 'MESSAGE', 'RESPONSE_DATA', 'SERVERS_AND_FILES')
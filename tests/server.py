@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+"""A stand-in PrivateBin host which keeps pastes in memory, for tests and benchmarks that must not touch the network.
+
+It speaks enough of the PrivateBin JSON API for this package: version detection through ?jsonld=paste, creating,
+reading, burning, commenting on and deleting version 1 and version 2 pastes. Nothing is decrypted or validated beyond
+what is needed to store and return a paste.
+"""
+
+import json
+import secrets
+import socketserver
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+__all__ = ('StandInServer', 'serve')
+
+MISSING_MESSAGE = 'Paste does not exist, has expired or has been deleted.'
+WRONG_TOKEN_MESSAGE = 'Wrong deletion token. Paste was not deleted.'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Handles one connection to a StandInServer, which may carry several requests."""
+
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one write with Nagle's algorithm off, or delayed ACKs add 40 ms to every request
+    disable_nagle_algorithm = True
+    wbufsize = 2 ** 16
+    server: 'StandInServer'
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def send_json(self, data: dict, status: int = 200, headers: dict = None):
+        """Send a JSON response, escaping slashes like PHP's json_encode does."""
+        body = json.dumps(data).replace('/', '\\/').encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self) -> bytes:
+        """Read the request body, whether it was sent with a length or in chunks."""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            parts = []
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b''.join(parts)
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.server.wait()
+        query = urllib.parse.urlsplit(self.path).query
+        if query == 'jsonld=paste':
+            if self.server.version == 2:
+                return self.send_json({'@context': {'v': {'@value': 2}}})
+            return self.send_json({'@context': {}})
+        with self.server.lock:
+            self.server.downloads += 1
+            paste = self.server.pastes.get(query)
+            if paste is not None and paste['burn']:
+                del self.server.pastes[query]
+        if paste is None:
+            return self.send_json({'status': 1, 'message': MISSING_MESSAGE})
+        headers = {}
+        if self.server.etags:
+            headers['ETag'] = '"%s-%d"' % (query, len(paste['comments']))
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                self.send_response(304)
+                self.send_header('ETag', headers['ETag'])
+                self.end_headers()
+                return None
+        self.send_json({
+            'status': 0, 'id': query, 'url': '/?' + query, **paste['data'], 'comments': list(paste['comments']),
+            'comment_count': len(paste['comments']), 'comment_offset': 0
+        }, headers=headers)
+        return None
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.read_body()
+        self.server.wait()
+        with self.server.lock:
+            self.server.bodies.append(len(body))
+            if self.server.retry_after:
+                self.server.retry_after -= 1
+                return self.send_json(
+                    {'status': 1, 'message': 'Please wait 0 seconds between each post.'}, status=429,
+                    headers={'Retry-After': '0'}
+                )
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = {key: values[0] for key, values in urllib.parse.parse_qs(body.decode()).items()}
+        if 'deletetoken' in data:
+            return self.delete(data)
+        if 'pasteid' in data:
+            return self.comment(data)
+        return self.create(data)
+
+    def create(self, data: dict):
+        """Store a new paste."""
+        paste_id = secrets.token_hex(8)
+        token = secrets.token_hex(32)
+        if 'v' in data:
+            burn = bool(data['adata'][3])
+            meta = {'created': int(time.time()), 'time_to_live': 86400}
+            stored = {'v': 2, 'adata': data['adata'], 'ct': data['ct'], 'meta': meta}
+        else:
+            burn = data.get('burnafterreading') in ('1', 1, True)
+            meta = {'postdate': int(time.time()), 'formatter': data.get('formatter'), 'remaining_time': 86400}
+            if burn:
+                meta['burnafterreading'] = True
+            stored = {'data': data['data'], 'meta': meta}
+            if 'attachment' in data:
+                stored.update(attachment=data['attachment'], attachmentname=data['attachmentname'])
+        with self.server.lock:
+            self.server.pastes[paste_id] = {'data': stored, 'token': token, 'burn': burn, 'comments': []}
+        self.send_json({'status': 0, 'id': paste_id, 'url': '/?' + paste_id, 'deletetoken': token})
+
+    def comment(self, data: dict):
+        """Add a comment to a paste."""
+        comment_id = secrets.token_hex(8)
+        with self.server.lock:
+            paste = self.server.pastes.get(data['pasteid'])
+            if paste is not None:
+                paste['comments'].append({**data, 'id': comment_id, 'meta': {'created': int(time.time())}})
+        if paste is None:
+            return self.send_json({'status': 1, 'message': 'Invalid data.'})
+        return self.send_json({'status': 0, 'id': comment_id, 'url': '/?' + data['pasteid'] + '#' + comment_id})
+
+    def delete(self, data: dict):
+        """Delete a paste, or answer with an empty page like PrivateBin 1.0 does if deletion is switched off."""
+        if not self.server.deletion:
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        with self.server.lock:
+            paste = self.server.pastes.get(data['pasteid'])
+            deleted = paste is not None and secrets.compare_digest(paste['token'], data['deletetoken'])
+            if deleted:
+                del self.server.pastes[data['pasteid']]
+        if not deleted:
+            return self.send_json({'status': 1, 'message': WRONG_TOKEN_MESSAGE})
+        return self.send_json({'status': 0, 'id': data['pasteid'], 'url': '/?' + data['pasteid']})
+
+
+class StandInServer(socketserver.ThreadingMixIn, HTTPServer):
+    """A stand-in PrivateBin host listening on a free port of 127.0.0.1.
+
+    version is the API version it reports. If deletion is False, deletion requests get the empty page PrivateBin 1.0
+    answers with. latency is slept before answering each request, to imitate a distant host. retry_after is how many
+    of the next POST requests are turned away with HTTP 429. If etags is True, pastes are sent with an ETag and
+    conditional requests for an unchanged paste are answered with 304. pastes, bodies (the sizes of the POST bodies
+    received), downloads (the number of pastes requested) and connections (the number of connections accepted) can
+    be inspected.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, version: int = 2, *, deletion: bool = True, latency: float = 0.0):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.version = version
+        self.deletion = deletion
+        self.latency = latency
+        self.retry_after = 0
+        self.etags = False
+        self.downloads = 0
+        self.pastes = {}
+        self.bodies = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.url = 'http://127.0.0.1:%d/' % self.server_address[1]
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+
+    def start(self):
+        """Start answering requests in a background thread."""
+        self._thread.start()
+
+    def __enter__(self) -> 'StandInServer':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
+
+    def wait(self):
+        """Sleep for the configured latency."""
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def serve(version: int = 2, *, deletion: bool = True, latency: float = 0.0) -> StandInServer:
+    """Start a stand-in PrivateBin host in a background thread.
+
+    Use the returned server as a context manager to stop it, or let it stop when the process exits.
+
+    :param version: The API version the host reports, 1 or 2.
+    :param deletion: Whether or not the host supports deleting pastes.
+    :param latency: How many seconds to wait before answering each request.
+    :return: The running server. Its url attribute is the home URL of the host.
+    """
+    server = StandInServer(version, deletion=deletion, latency=latency)
+    server.start()
+    return server
@@ -1,11 +1,22 @@
 import asyncio
+import base64
+import io
 import json
+import os
+import pickle
+import subprocess
+import sys
+import zlib
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 import pytest
 
 import privatebinapi
-from privatebinapi import common, deletion, download, upload
-from tests import MESSAGE, RESPONSE_DATA, SERVERS_AND_FILES
+from privatebinapi import capabilities, cli, comments, common, compression, crypto, deletion, download, hooks, \
+    serialization, streaming, upload
+from tests import FILE, MESSAGE, RESPONSE_DATA, SERVERS_AND_FILES
+from tests.server import serve
 
 
 @pytest.mark.parametrize("server, file", SERVERS_AND_FILES)
@@ -24,6 +35,18 @@ def test_full(server, file):
         pass
 
 
+@pytest.mark.parametrize("server, file", SERVERS_AND_FILES)
+def test_client_full(server, file):
+    with privatebinapi.PrivateBinClient() as client:
+        send_data = client.send(server, text=MESSAGE, file=file, password='foobar')
+        get_data = client.get(send_data['full_url'], password='foobar')
+        assert get_data['text'] == MESSAGE
+        try:
+            client.delete(send_data['full_url'], send_data['deletetoken'])
+        except privatebinapi.UnsupportedFeatureError:
+            pass
+
+
 def test_bad_compression():
     try:
         privatebinapi.send('', text=MESSAGE, compression='clearly-fake-compression')
@@ -65,6 +88,20 @@ async def test_async_full(server, _):
     await asyncio.sleep(0.5)
 
 
+@pytest.mark.parametrize("server, _", SERVERS_AND_FILES)
+@pytest.mark.asyncio
+async def test_async_client_full(server, _):
+    async with privatebinapi.AsyncPrivateBinClient() as client:
+        send_data = await client.send(server, text=MESSAGE)
+        get_data = await client.get(send_data['full_url'])
+        assert get_data['text'] == MESSAGE
+        try:
+            await client.delete(send_data['full_url'], send_data['deletetoken'])
+        except privatebinapi.UnsupportedFeatureError:
+            pass
+    await asyncio.sleep(0.5)
+
+
 def test_bad_server():
     try:
         privatebinapi.send('https://example.com', text=MESSAGE)
@@ -74,15 +111,18 @@ def test_bad_server():
 
 class FakeResponse:
     url = ''
+    status_code = 200
+    headers = {}
 
     def __init__(self, error=False):
         self.error = error
 
-    def json(self):
+    @property
+    def content(self):
         if self.error:
-            raise json.JSONDecodeError('', '', 0)
+            return b'<html></html>'
         else:
-            return RESPONSE_DATA
+            return json.dumps(RESPONSE_DATA).encode()
 
 
 def test_bad_response_verification():
@@ -118,3 +158,986 @@ def test_bad_extract_passphrase():
         download.extract_passphrase('https://www.example.com')
     except ValueError:
         pass
+
+
+def test_capability_cache():
+    cache = capabilities.CapabilityCache(ttl=60)
+    assert cache.get('https://example.com/') is None
+    cache.update('https://EXAMPLE.com/', version=2)
+    assert cache.get('https://example.com').supports_zlib
+    cache.update('https://example.com', supports_deletion=False)
+    assert cache.get('https://example.com').version == 2
+    cache.invalidate('https://example.com/')
+    assert cache.get('https://example.com') is None
+
+
+def test_capability_cache_expiry():
+    cache = capabilities.CapabilityCache(ttl=0)
+    cache.update('https://example.com', version=1)
+    assert cache.get('https://example.com') is None
+
+
+def test_bad_parse_version():
+    try:
+        capabilities.parse_version(FakeResponse(error=True))  # noqa
+    except privatebinapi.BadServerResponseError:
+        pass
+
+
+@pytest.mark.parametrize("version", (1, 2))
+def test_encrypt_paste_offline(version):
+    payload, passcode = upload.encrypt_paste(version=version, text=MESSAGE, file=FILE, password='foobar')
+    data = json.loads(payload) if version == 2 else dict(payload)
+    data.update(id='', meta={}, status=0, url='')
+    paste = download.decrypt_paste(data, passcode, password='foobar')
+    assert paste['text'] == MESSAGE
+    with open(FILE, 'rb') as file:
+        assert paste['attachment']['content'] == file.read()
+
+
+def _halve(number):
+    if number % 2:
+        raise ValueError(number)
+    return number // 2
+
+
+def test_run_bounded():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = sorted(common.run_bounded(executor, _halve, range(10), 3))
+    assert [result.index for result in results] == list(range(10))
+    assert [result.result for result in results if not result.error] == [0, 1, 2, 3, 4]
+    assert all(isinstance(result.error, ValueError) for result in results if result.index % 2)
+
+
+@pytest.mark.asyncio
+async def test_run_bounded_async():
+    running = []
+
+    async def halve(number):
+        running.append(number)
+        assert len(running) <= 3
+        await asyncio.sleep(0)
+        running.remove(number)
+        return _halve(number)
+
+    results = sorted([result async for result in common.run_bounded_async(halve, range(10), 3)])
+    assert [result.result for result in results if not result.error] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("server, _", SERVERS_AND_FILES)
+def test_send_many(server, _):
+    items = [{'text': MESSAGE}, {'text': MESSAGE, 'expiration': 'clearly-incorrect-expiration'}]
+    results = sorted(privatebinapi.send_many(server, items))
+    assert results[0].result['status'] == 0
+    assert isinstance(results[1].error, privatebinapi.BadExpirationTimeError)
+
+
+def test_decrypt_pastes():
+    payload, passcode = upload.encrypt_paste(version=2, text=MESSAGE)
+    data = {**json.loads(payload), 'id': '', 'meta': {}, 'status': 0, 'url': ''}
+    (result, error), (bad_result, bad_error) = download.decrypt_pastes([(data, passcode, None), (data, passcode, 'x')])
+    assert result['text'] == MESSAGE and error is None
+    assert bad_result is None and isinstance(bad_error, Exception)
+
+
+@pytest.mark.parametrize("server, _", SERVERS_AND_FILES)
+@pytest.mark.asyncio
+async def test_get_many_async(server, _):
+    send_data = await privatebinapi.send_async(server, text=MESSAGE)
+    urls = [send_data['full_url']] * 2 + ['https://example.com']
+    results = sorted([result async for result in privatebinapi.get_many_async(urls, chunk_size=2)])
+    assert [result.result['text'] for result in results[:2]] == [MESSAGE, MESSAGE]
+    assert isinstance(results[2].error, ValueError)
+
+
+def test_group_deletions():
+    items = [('https://a.example/?1#k', 't1'), ('https://b.example/?2#k', 't2'), ('https://a.example/?3#k', 't3'),
+             ('https://example.com', 't4')]
+    probes, rest, invalid = deletion.group_deletions(items)
+    assert [probe[0] for probe in probes] == [0, 1]
+    assert rest == [(2, 'https://a.example/?3#k', 't3')]
+    assert invalid[0].index == 3 and isinstance(invalid[0].error, ValueError)
+
+
+def test_unsupported_deletion_fails_fast():
+    capabilities.CAPABILITY_CACHE.update('https://unsupported.example/', supports_deletion=False)
+    try:
+        privatebinapi.delete('https://unsupported.example/?1#k', 'token')
+    except privatebinapi.UnsupportedFeatureError:
+        pass
+    else:
+        raise AssertionError('delete did not fail fast')
+    finally:
+        capabilities.CAPABILITY_CACHE.invalidate('https://unsupported.example/')
+
+
+def test_unparsable_deletion_response():
+    import requests
+
+    server = 'https://flaky.example/'
+    for status, cached in ((502, None), (500, None), (200, False)):
+        response = requests.Response()
+        response.status_code = status
+        response.url = server
+        response._content = b'<html>Not JSON</html>'  # pylint: disable=protected-access
+        try:
+            deletion.process_delete_response(response, server)
+        except privatebinapi.UnsupportedFeatureError:
+            assert status != 502
+        except privatebinapi.ServerUnavailableError:
+            assert status == 502
+        else:
+            assert False
+        entry = capabilities.CAPABILITY_CACHE.get(server)
+        assert (entry.supports_deletion if entry is not None else None) is cached
+    capabilities.CAPABILITY_CACHE.invalidate(server)
+
+
+@pytest.mark.parametrize("compression", ('zlib', None))
+def test_encrypt_paste_stream_offline(compression):
+    body, passcode = upload.encrypt_paste_stream(
+        text=MESSAGE, file=FILE, password='foobar', compression=compression, chunk_size=3 * 7
+    )
+    data = {**json.loads(b''.join(body)), 'id': '', 'status': 0, 'url': ''}
+    paste = download.decrypt_paste(data, passcode, password='foobar')
+    assert paste['text'] == MESSAGE
+    assert paste['attachment']['filename'] == '__init__.py'
+    with open(FILE, 'rb') as file:
+        assert paste['attachment']['content'] == file.read()
+
+
+def test_base64_encoder():
+    data = bytes(range(256)) * 3
+    encoder = crypto.Base64Encoder()
+    encoded = b''.join(encoder.encode(data[i:i + 7]) for i in range(0, len(data), 7)) + encoder.flush()
+    assert encoded == base64.b64encode(data)
+
+
+def test_object_parser():
+    document = {'id': 'a"b', 'ct': 'ab\\/c/\u00e9', 'adata': [[1, '],}'], None], 'meta': {'a': True}, 'n': -1.5}
+    text = json.dumps(document)
+    chunks = []
+    parser = streaming.ObjectParser(streamed=('ct',), on_chunk=lambda key, chunk: chunks.append(chunk))
+    for index in range(0, len(text), 3):
+        parser.feed(text[index:index + 3])
+    parser.close()
+    assert ''.join(chunks) == document.pop('ct')
+    assert parser.values == document
+
+
+def test_bad_object_parser():
+    parser = streaming.ObjectParser()
+    try:
+        parser.feed('{"a": 1')
+        parser.close()
+    except streaming.StreamFormatError:
+        pass
+
+
+def test_paste_reader_ciphertext_first():
+    payload, passcode = upload.encrypt_paste(version=2, text=MESSAGE, file=FILE)
+    data = json.loads(payload)
+    body = json.dumps({'status': 0, 'ct': data.pop('ct'), **data}).encode()
+    sink = io.BytesIO()
+    reader = streaming.PasteReader(passcode, None, sink)
+    for index in range(0, len(body), 100):
+        reader.feed(body[index:index + 100])
+    reader.close()
+    assert reader.message.values['paste'] == MESSAGE
+    with open(FILE, 'rb') as file:
+        assert sink.getvalue() == file.read()
+
+
+@pytest.mark.parametrize("server, file", SERVERS_AND_FILES)
+def test_get_stream(server, file, tmp_path):
+    send_data = privatebinapi.send(server, text=MESSAGE, file=file)
+    get_data = privatebinapi.get_stream(send_data['full_url'], tmp_path / 'attachment')
+    assert get_data['text'] == MESSAGE
+    with open(file, 'rb') as original:
+        assert (tmp_path / 'attachment').read_bytes() == original.read()
+
+
+def test_key_cache():
+    cache = crypto.KeyCache(maxsize=2)
+    salts = [bytes([i]) * 8 for i in range(3)]
+    expected = crypto.derive_key(b'key', 'password', salts[0], 1000)
+    assert cache.derive(b'key', 'password', salts[0], 1000) == expected
+    assert cache.derive(b'key', 'password', salts[0], 1000) == expected
+    assert cache.derive(b'key', 'other', salts[0], 1000) != expected
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    cache.derive(b'key', 'password', salts[1], 1000)
+    assert len(cache) == 2
+    stored = list(cache._entries.values())
+    cache.clear()
+    assert len(cache) == 0
+    assert all(not any(buffer) for buffer in stored)
+
+
+def test_key_cache_decrypt():
+    payload, passcode = upload.encrypt_paste(version=2, text=MESSAGE, password='hunter2')
+    data = dict(json.loads(payload), id='id', status=0, url='url', meta={})
+    cache = crypto.enable_key_cache()
+    try:
+        for _ in range(2):
+            assert download.decrypt_paste(data, passcode, password='hunter2')['text'] == MESSAGE
+        assert (cache.hits, cache.misses) == (1, 1)
+    finally:
+        crypto.disable_key_cache()
+    assert crypto.get_key_cache() is None
+
+
+def test_choose_deflate(tmp_path):
+    noise = tmp_path / 'noise.bin'
+    noise.write_bytes(os.urandom(2 ** 16))
+    assert compression.choose_deflate(None) is None
+    assert compression.choose_deflate('zlib', 9, file=str(noise)) == compression.Deflate(9)
+    assert compression.choose_deflate('auto', file=FILE).strategy == zlib.Z_DEFAULT_STRATEGY
+    assert compression.choose_deflate('auto', file=str(noise)).strategy == zlib.Z_HUFFMAN_ONLY
+    assert compression.choose_deflate('auto', 0, file=str(noise)) == compression.Deflate(0)
+
+
+@pytest.mark.parametrize("level", [0, 9])
+def test_compression_level_offline(level):
+    payload, passcode = upload.encrypt_paste(version=2, text=MESSAGE, file=FILE, compression='auto',
+                                             compression_level=level)
+    data = dict(json.loads(payload), id='id', status=0, url='url', meta={})
+    assert data['adata'][0][7] == 'zlib'
+    assert download.decrypt_paste(data, passcode)['text'] == MESSAGE
+
+
+def test_bad_compression_level():
+    try:
+        upload.encrypt_paste(version=2, text=MESSAGE, compression_level=10)
+    except privatebinapi.BadCompressionTypeError:
+        pass
+
+
+@pytest.mark.parametrize("backend", ['json', 'orjson', 'ujson'])
+def test_json_backends(backend):
+    try:
+        serialization.set_json_backend(backend)
+    except ImportError:
+        pytest.skip('%s is not installed' % backend)
+    try:
+        payload, passcode = upload.encrypt_paste(version=2, text=MESSAGE)
+        data = json.loads(payload)
+        assert serialization.loads(payload) == data
+        assert json.loads(serialization.dumps(data)) == data
+        try:
+            common.verify_response(FakeResponse(error=True))  # noqa
+        except privatebinapi.BadServerResponseError:
+            pass
+    finally:
+        serialization.set_json_backend()
+
+
+def test_encode_payload():
+    data = {'v': 2, 'adata': [['a/b', 'c'], 'plaintext', 0, 0], 'ct': 'AAAA/+==', 'meta': {'expire': '1day'}}
+    assert json.loads(upload.encode_payload(data)) == data
+
+
+def test_retry_policy():
+    policy = privatebinapi.RetryPolicy(attempts=3, backoff=1)
+    busy = privatebinapi.ServerUnavailableError('', status_code=503, retry_after=2)
+    flood = privatebinapi.PrivateBinAPIError('Please wait 10 seconds between each post.')
+    gateway = privatebinapi.ServerUnavailableError('', status_code=504)
+    assert policy.classify(busy, idempotent=False) == (True, 2)
+    assert policy.classify(flood, idempotent=False) == (True, 10)
+    assert policy.classify(gateway) == (True, None)
+    assert policy.classify(gateway, idempotent=False) == (False, None)
+    assert policy.classify(privatebinapi.PrivateBinAPIError('Invalid data.')) == (False, None)
+    assert 2 <= policy.delay(busy, 0) <= 2.1
+    assert 0 <= policy.delay(gateway, 1) <= 2
+    assert policy.delay(gateway, 2) is None
+    assert policy.delay(privatebinapi.ServerUnavailableError('', 429, retry_after=3600), 0) is None
+
+
+def test_parse_retry_after():
+    assert common.parse_retry_after('5') == 5
+    assert common.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert common.parse_retry_after('soon') is None
+    assert common.parse_retry_after(None) is None
+
+
+def test_call_with_retry():
+    calls = []
+
+    def flaky():
+        calls.append(None)
+        if len(calls) < 3:
+            raise privatebinapi.ServerUnavailableError('', status_code=429, retry_after=0)
+        return 'done'
+
+    policy = privatebinapi.RetryPolicy(attempts=3, backoff=0.01)
+    assert common.call_with_retry(flaky, 'https://example.com', policy, idempotent=False) == 'done'
+    assert len(calls) == 3
+
+    calls.clear()
+    try:
+        common.call_with_retry(flaky, 'https://example.com', policy._replace(attempts=2))
+    except privatebinapi.ServerUnavailableError:
+        pass
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_call_with_retry_async():
+    calls = []
+
+    async def flaky():
+        calls.append(None)
+        if len(calls) < 2:
+            raise privatebinapi.ServerUnavailableError('', status_code=503)
+        return 'done'
+
+    policy = privatebinapi.RetryPolicy(backoff=0.01)
+    assert await common.call_with_retry_async(flaky, 'https://example.com', policy) == 'done'
+    assert len(calls) == 2
+
+
+def test_rate_limiter():
+    limiter = privatebinapi.RateLimiter(rate=10, burst=2)
+    assert limiter.reserve('https://example.com/') == 0
+    assert limiter.reserve('https://EXAMPLE.com') == 0
+    assert 0.05 < limiter.reserve('https://example.com/?paste#key') <= 0.1
+    assert limiter.reserve('https://example.org') == 0
+    limiter.defer('https://example.org', 5)
+    assert 4.9 < limiter.reserve('https://example.org') <= 5
+
+
+def test_host_pool():
+    pool = privatebinapi.HostPool(['https://a.example', 'https://b.example', 'https://B.example/'])
+    assert len(pool) == 2
+    started = pool.start('https://a.example')
+    pool.succeeded('https://a.example', started - 1)
+    assert pool.candidates() == ['https://b.example', 'https://a.example']
+    started = pool.start('https://b.example')
+    pool.succeeded('https://b.example', started - 2)
+    assert pool.candidates() == ['https://a.example', 'https://b.example']
+    pool.start('https://a.example')
+    pool.start('https://a.example')
+    assert pool.candidates() == ['https://b.example', 'https://a.example']
+    pool.abandon('https://a.example')
+    pool.abandon('https://a.example')
+    assert [status.in_flight for status in pool.status()] == [0, 0]
+
+    try:
+        privatebinapi.HostPool([])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError
+
+
+def test_host_pool_error_rate():
+    pool = privatebinapi.HostPool(['https://a.example', 'https://b.example', 'https://c.example'], smoothing=0.4)
+    for server, latency in (('https://a.example', 1), ('https://b.example', 1.5), ('https://c.example', 0.1)):
+        pool.succeeded(server, pool.start(server) - latency)
+    pool.start('https://a.example')
+    pool.failed('https://a.example')
+    assert pool.candidates() == ['https://c.example', 'https://b.example', 'https://a.example']
+    for _ in range(2):
+        pool.start('https://c.example')
+        pool.failed('https://c.example')
+    assert pool.status()[2].error_rate >= pool.error_threshold
+    assert pool.candidates() == ['https://b.example', 'https://a.example', 'https://c.example']
+
+
+def test_host_pool_circuit_breaker():
+    pool = privatebinapi.HostPool(['https://a.example', 'https://b.example'], failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        pool.start('https://a.example')
+        pool.failed('https://a.example')
+    assert pool.candidates() == ['https://b.example']
+    assert not pool.status()[0].available
+    assert pool.status()[0].error_rate > 0
+
+    pool.start('https://b.example')
+    pool.failed('https://b.example')
+    pool.start('https://b.example')
+    pool.failed('https://b.example')
+    assert pool.candidates() == ['https://a.example']
+
+    pool.reset_timeout = 0
+    pool.start('https://b.example')
+    pool.failed('https://b.example')
+    assert pool.candidates() == ['https://b.example']
+    pool.succeeded('https://b.example', pool.start('https://b.example'))
+    assert pool.status()[1].available
+
+
+def test_host_pool_half_open():
+    pool = privatebinapi.HostPool(['https://a.example', 'https://b.example'], failure_threshold=1, reset_timeout=0)
+    pool.start('https://a.example')
+    pool.failed('https://a.example')
+    assert pool.candidates() == ['https://b.example', 'https://a.example']
+    started = pool.start('https://a.example')
+    assert started is not None
+    assert pool.start('https://a.example') is None
+    assert pool.candidates() == ['https://b.example']
+    assert not pool.status()[0].available
+    pool.failed('https://a.example')
+    assert pool.status()[0].in_flight == 0
+
+    pool.start('https://b.example')
+    pool.failed('https://b.example')
+    started = pool.start('https://a.example')
+    pool.start('https://b.example')
+    assert pool.candidates() == []
+    pool.abandon('https://b.example')
+    assert pool.candidates() == ['https://b.example']
+    pool.succeeded('https://a.example', started)
+    assert pool.status()[0].available
+
+
+def test_hooks():
+    events = []
+    hooks.add_hook(events.append)
+    try:
+        payload, passcode = upload.encrypt_paste(version=2, text=MESSAGE * 10)
+        data = json.loads(payload)
+        data.update(id='', meta={}, status=0, url='')
+        download.decrypt_paste(data, passcode)
+        try:
+            common.verify_response(FakeResponse(), operation='get')  # noqa
+        except privatebinapi.PrivateBinAPIError:
+            pass
+        common.call_with_retry(
+            _flaky_once(), 'https://example.com', privatebinapi.RetryPolicy(backoff=0.01), operation='get'
+        )
+    finally:
+        hooks.remove_hook(events.append)
+
+    encrypt, decrypt, request, retry = events
+    assert (encrypt.operation, encrypt.phase) == ('send', 'encrypt')
+    assert encrypt.attributes['plaintext_size'] > encrypt.attributes['compressed_size']
+    assert encrypt.attributes['payload_size'] == len(payload)
+    assert (decrypt.operation, decrypt.phase) == ('get', 'decrypt')
+    assert (request.operation, request.phase, request.attributes['status_code']) == ('get', 'request', 200)
+    assert (retry.phase, retry.server, retry.attributes['attempt']) == ('retry', 'https://example.com', 1)
+
+    upload.encrypt_paste(version=2, text=MESSAGE)
+    assert len(events) == 4
+
+    try:
+        hooks.remove_hook(events.append)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError
+
+
+def _flaky_once():
+    calls = []
+
+    def flaky():
+        calls.append(None)
+        if len(calls) < 2:
+            raise privatebinapi.ServerUnavailableError('', status_code=503)
+        return 'done'
+
+    return flaky
+
+
+def test_hook_errors_are_warnings():
+    def broken(event):
+        raise RuntimeError(event)
+
+    hooks.add_hook(broken)
+    try:
+        with pytest.warns(RuntimeWarning):
+            upload.encrypt_paste(version=2, text=MESSAGE)
+    finally:
+        hooks.clear_hooks()
+
+
+@pytest.fixture(params=[1, 2])
+def local_server(request):
+    with serve(request.param) as server:
+        yield server
+
+
+def test_local_full(local_server):
+    send_data = privatebinapi.send(local_server.url, text=MESSAGE, file=FILE, password='foobar')
+    get_data = privatebinapi.get(send_data['full_url'], password='foobar')
+    assert get_data['text'] == MESSAGE
+    with open(FILE, 'rb') as file:
+        assert get_data['attachment']['content'] == file.read()
+    privatebinapi.delete(send_data['full_url'], send_data['deletetoken'])
+    assert not local_server.pastes
+    try:
+        privatebinapi.get(send_data['full_url'], password='foobar')
+    except privatebinapi.PrivateBinAPIError:
+        pass
+    else:
+        raise AssertionError
+
+
+@pytest.mark.asyncio
+async def test_local_async_full(local_server):
+    async with privatebinapi.AsyncPrivateBinClient() as client:
+        send_data = await client.send(local_server.url, text=MESSAGE, burn_after_reading=True)
+        get_data = await client.get(send_data['full_url'])
+        assert get_data['text'] == MESSAGE
+        assert not local_server.pastes
+
+
+@pytest.mark.asyncio
+async def test_local_async_inline_decrypt(local_server):
+    send_data = await privatebinapi.send_async(local_server.url, text=MESSAGE, file=FILE, password='foobar')
+    crypto.enable_key_cache()
+    try:
+        for inline_size in (0, download.INLINE_DECRYPT_SIZE, download.INLINE_DECRYPT_SIZE):
+            get_data = await privatebinapi.get_async(send_data['full_url'], password='foobar', inline_size=inline_size)
+            assert get_data['text'] == MESSAGE
+            assert get_data['attachment']['filename'] == os.path.basename(FILE)
+        if local_server.version == 2:
+            assert crypto.get_key_cache().hits >= 1
+    finally:
+        crypto.disable_key_cache()
+
+
+@pytest.mark.asyncio
+async def test_local_async_timeout():
+    with serve(latency=0.5) as server:
+        try:
+            await privatebinapi.send_async(server.url, text=MESSAGE, timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            assert False
+        assert not server.pastes
+
+
+def test_async_never_imports_requests(local_server):
+    code = (
+        'import asyncio, sys, privatebinapi\n'
+        'async def main(url):\n'
+        '    paste = await privatebinapi.send_async(url, text="hello", timeout=10)\n'
+        '    assert (await privatebinapi.get_async(paste["full_url"]))["text"] == "hello"\n'
+        '    await privatebinapi.delete_async(paste["full_url"], paste["deletetoken"])\n'
+        'asyncio.get_event_loop().run_until_complete(main(sys.argv[1]))\n'
+        'print("requests" in sys.modules)'
+    )
+    output = subprocess.run([sys.executable, '-c', code, local_server.url], stdout=subprocess.PIPE, check=True,
+                            universal_newlines=True).stdout
+    assert output.strip() == 'False'
+
+
+def test_local_results(local_server):
+    send_data = privatebinapi.send(local_server.url, text=MESSAGE, file=FILE)
+    assert isinstance(send_data, privatebinapi.UploadResult)
+    assert send_data['full_url'] == send_data.full_url
+    assert sorted(dict(send_data)) == ['deletetoken', 'full_url', 'id', 'passcode', 'status', 'url']
+
+    get_data = privatebinapi.get(send_data['full_url'])
+    assert isinstance(get_data, privatebinapi.PasteResult)
+    assert not hasattr(get_data, '__dict__')
+    assert get_data.text == get_data['text'] == MESSAGE
+    assert isinstance(get_data['attachment']['content'], memoryview)
+    with open(FILE, 'rb') as file:
+        content = file.read()
+    assert get_data['attachment']['content'] == content
+    assert get_data['attachment']['size'] == len(content)
+    assert get_data.to_dict()['attachment']['content'] == content
+    assert pickle.loads(pickle.dumps(get_data)) == get_data
+    json.dumps({**send_data})
+    try:
+        get_data['missing']  # pylint: disable=pointless-statement
+    except KeyError:
+        pass
+
+    delete_data = privatebinapi.delete(send_data['full_url'], send_data['deletetoken'])
+    assert delete_data == {'id': send_data['id'], 'status': 0, 'url': send_data['url']}
+
+
+def test_local_cache(local_server, tmp_path):
+    from privatebinapi.cache import CacheEntry, PasteCache, paste_key
+
+    local_server.etags = True
+    send_data = privatebinapi.send(local_server.url, text=MESSAGE)
+    cache = privatebinapi.MemoryCache(max_age=60)
+    for _ in range(3):
+        assert privatebinapi.get(send_data['full_url'], cache=cache)['text'] == MESSAGE
+    assert local_server.downloads == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    key = paste_key(send_data['full_url'])
+    entry = cache.load(key)
+    assert 'ct' in entry.data or 'data' in entry.data
+    assert MESSAGE not in json.dumps(entry.data)
+    cache.save(key, entry._replace(stale_after=0))
+    assert privatebinapi.get(send_data['full_url'], cache=cache)['text'] == MESSAGE
+    assert local_server.downloads == 2
+    assert cache.load(key).stale_after > 0
+
+    cache.save(key, entry._replace(expires=0))
+    assert privatebinapi.get(send_data['full_url'], cache=cache)['text'] == MESSAGE
+    assert local_server.downloads == 3
+
+    burn_data = privatebinapi.send(local_server.url, text=MESSAGE, burn_after_reading=True)
+    assert privatebinapi.get(burn_data['full_url'], cache=cache)['text'] == MESSAGE
+    assert cache.load(paste_key(burn_data['full_url'])) is None
+
+    privatebinapi.delete(send_data['full_url'], send_data['deletetoken'])
+    cache.save(key, CacheEntry(entry.data, None, 0))
+    try:
+        privatebinapi.get(send_data['full_url'], cache=cache)
+    except privatebinapi.PrivateBinAPIError:
+        pass
+    else:
+        assert False
+    assert cache.load(key) is None
+
+    class Incomplete(PasteCache):
+        def load(self, key):
+            return None
+
+    try:
+        Incomplete()
+    except TypeError:
+        pass
+    else:
+        assert False
+
+
+@pytest.mark.asyncio
+async def test_local_async_disk_cache(local_server, tmp_path):
+    send_data = await privatebinapi.send_async(local_server.url, text=MESSAGE)
+    cache = privatebinapi.DiskCache(str(tmp_path))
+    async with privatebinapi.AsyncPrivateBinClient(cache=cache) as client:
+        for _ in range(2):
+            assert (await client.get(send_data['full_url']))['text'] == MESSAGE
+    assert local_server.downloads == 1
+    reopened = privatebinapi.DiskCache(str(tmp_path))
+    assert privatebinapi.get(send_data['full_url'], cache=reopened)['text'] == MESSAGE
+    assert local_server.downloads == 1
+    assert reopened.prune() == 0
+    reopened.clear()
+    assert not os.listdir(str(tmp_path))
+
+
+def test_local_dedup(local_server, tmp_path):
+    dedup = privatebinapi.Deduplicator()
+    first = privatebinapi.send(local_server.url, text=MESSAGE, file=FILE, dedup=dedup)
+    second = privatebinapi.send(local_server.url, text=MESSAGE, file=FILE, dedup=dedup)
+    assert second.full_url == first.full_url
+    assert len(local_server.pastes) == 1
+    assert (dedup.hits, dedup.misses) == (1, 1)
+    assert privatebinapi.get(second.full_url)['text'] == MESSAGE
+
+    privatebinapi.send(local_server.url, text=MESSAGE, file=FILE, expiration='1week', dedup=dedup)
+    privatebinapi.send(local_server.url, text=MESSAGE, burn_after_reading=True, dedup=dedup)
+    privatebinapi.send(local_server.url, text=MESSAGE, burn_after_reading=True, dedup=dedup)
+    assert len(local_server.pastes) == 4
+
+    key = os.urandom(32)
+    path = str(tmp_path / 'uploads.sqlite')
+    index = privatebinapi.SQLiteIndex(path)
+    stored = privatebinapi.send(local_server.url, text=MESSAGE, dedup=privatebinapi.Deduplicator(index, key=key))
+    index.close()
+    reopened = privatebinapi.SQLiteIndex(path)
+    with privatebinapi.PrivateBinClient(dedup=privatebinapi.Deduplicator(reopened, key=key)) as client:
+        assert client.send(local_server.url, text=MESSAGE).full_url == stored.full_url
+        items = [{'text': MESSAGE}, {'text': MESSAGE, 'password': 'foo'}]
+        results = sorted(client.send_many(local_server.url, items), key=lambda result: result.index)
+    assert results[0].result.full_url == stored.full_url
+    assert results[1].result.full_url != stored.full_url
+    assert len(local_server.pastes) == 6
+    assert reopened.prune() == 0
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_local_async_dedup(local_server):
+    dedup = privatebinapi.Deduplicator(privatebinapi.MemoryIndex(maxsize=1), margin=0)
+    first = await privatebinapi.send_async(local_server.url, text=MESSAGE, dedup=dedup)
+    second = await privatebinapi.send_async(local_server.url, text=MESSAGE, dedup=dedup)
+    assert second.full_url == first.full_url
+    await privatebinapi.send_async(local_server.url, text=MESSAGE, formatting='markdown', dedup=dedup)
+    assert len(dedup.index) == 1
+    async for result in privatebinapi.send_many_async(local_server.url, [{'text': MESSAGE}] * 2, concurrency=1,
+                                                      dedup=dedup):
+        assert result.result is not None
+    assert len(local_server.pastes) == 3
+
+
+@pytest.mark.asyncio
+async def test_local_cli(local_server, tmp_path):
+    (tmp_path / 'a.txt').write_text(MESSAGE)
+    (tmp_path / 'b.txt').write_text(MESSAGE)
+    pattern = str(tmp_path / '*.txt')
+
+    sent = io.StringIO()
+    args = cli.parse_args(['--processes', '2', 'send', '--text', local_server.url, pattern, str(tmp_path / 'no')])
+    assert not await cli.run(args, output=sent)
+    records = [json.loads(line) for line in sent.getvalue().splitlines()]
+    assert sorted(record['index'] for record in records) == [0, 1, 2]
+    assert [record['error']['type'] for record in records if 'error' in record] == ['FileNotFoundError']
+    assert len(local_server.pastes) == 2
+
+    uploads = '\n'.join(json.dumps(record) for record in records if 'result' in record) + '\nnot a link\n'
+    received = io.StringIO()
+    assert not await cli.run(cli.parse_args(['get']), stdin=io.StringIO(uploads), output=received)
+    records = [json.loads(line) for line in received.getvalue().splitlines()]
+    assert sorted(record['result']['text'] for record in records if 'result' in record) == [MESSAGE, MESSAGE]
+
+    attached = io.StringIO()
+    args = cli.parse_args(['--processes', '0', 'send', local_server.url, FILE])
+    assert await cli.run(args, output=attached)
+    link = json.loads(attached.getvalue())['result']['full_url']
+    received = io.StringIO()
+    assert await cli.run(cli.parse_args(['get', link, '--attachments', str(tmp_path / 'out')]), output=received)
+    path = json.loads(received.getvalue())['result']['attachment']['path']
+    with open(FILE, 'rb') as expected, open(path, 'rb') as saved:
+        assert saved.read() == expected.read()
+
+    deleted = io.StringIO()
+    assert await cli.run(cli.parse_args(['delete']), stdin=io.StringIO(uploads.replace('not a link\n', '')),
+                         output=deleted)
+    assert len(deleted.getvalue().splitlines()) == 2
+    assert len(local_server.pastes) == 1
+
+
+def test_cli_hostile_paste_id(tmp_path):
+    from privatebinapi.results import Attachment, PasteResult
+
+    directory = tmp_path / 'out'
+    directory.mkdir()
+    for paste_id in ('../escaped', '/tmp/escaped', 'ABC'):
+        data = {'id': paste_id, 'meta': {}, 'status': 0, 'url': '/?' + paste_id}
+        result = PasteResult(data, MESSAGE, Attachment(b'content', 'file.txt'))
+        try:
+            cli.save_attachment(str(directory), result)
+        except ValueError:
+            pass
+        else:
+            assert False
+    assert not os.listdir(str(directory))
+    assert os.listdir(str(tmp_path)) == ['out']
+
+
+def test_local_attachment_sources(tmp_path, monkeypatch):
+    import mmap
+    from privatebinapi import attachments
+
+    content = os.urandom(1000)
+    mapped = mmap.mmap(-1, len(content))
+    mapped.write(content)
+    with serve() as server:
+        for source in (content, bytearray(content), memoryview(content), io.BytesIO(content), mapped):
+            send_data = privatebinapi.send(server.url, file=source, filename='report.csv', mimetype='text/csv')
+            get_data = privatebinapi.get(send_data['full_url'])
+            assert get_data['attachment']['content'] == content
+            assert get_data['attachment']['filename'] == 'report.csv'
+        mapped.close()
+
+        monkeypatch.setattr(attachments, 'MMAP_THRESHOLD', 4096)
+        path = tmp_path / 'large.bin'
+        path.write_bytes(os.urandom(5000))
+        with attachments.open_attachment(str(path)) as source:
+            assert isinstance(source.content.obj, mmap.mmap)
+            assert source.name == 'large.bin'
+            assert source.mimetype == 'application/octet-stream'
+        send_data = privatebinapi.send(server.url, text=MESSAGE, file=path)
+        assert privatebinapi.get(send_data['full_url'])['attachment']['content'] == path.read_bytes()
+
+        with open(str(path), 'rb') as file:
+            send_data = privatebinapi.send(server.url, file=file, mimetype='application/x-test')
+        assert privatebinapi.get(send_data['full_url'])['attachment']['filename'] == 'large.bin'
+
+        try:
+            privatebinapi.send(server.url, file=content)
+        except ValueError:
+            pass
+        else:
+            assert False
+
+        dedup = privatebinapi.Deduplicator()
+        first = privatebinapi.send(server.url, file=content, filename='a.bin', dedup=dedup)
+        assert privatebinapi.send(server.url, file=memoryview(content), filename='a.bin', dedup=dedup) == first
+        assert privatebinapi.send(server.url, file=content, filename='b.bin', dedup=dedup) != first
+
+
+@pytest.mark.asyncio
+async def test_local_async_attachment_sources(local_server):
+    content = os.urandom(5000)
+    stream = local_server.version == 2
+    send_data = await privatebinapi.send_async(
+        local_server.url, file=io.BytesIO(content), filename='data.bin', stream=stream,
+        retry_policy=privatebinapi.RetryPolicy(backoff=0.01)
+    )
+    get_data = await privatebinapi.get_async(send_data['full_url'])
+    assert get_data['attachment']['content'] == content
+    assert get_data['attachment']['filename'] == 'data.bin'
+
+
+def test_local_comments(local_server):
+    send_data = privatebinapi.send(local_server.url, text=MESSAGE, password='foo', discussion=True)
+    url = send_data['full_url']
+    first = privatebinapi.comment(url, 'First!', nickname='alice', password='foo')
+    with privatebinapi.PrivateBinClient() as client:
+        reply = client.comment(url, 'Réponse', parent_id=first.id, password='foo')
+    assert (first.parentid, reply.parentid) == (send_data['id'], first.id)
+    paste_id = send_data['id']
+    local_server.pastes[paste_id]['comments'].append({
+        'id': 'forged', 'pasteid': paste_id, 'parentid': paste_id, 'meta': {}, 'data': '{}',
+        'v': 2, 'adata': ['AAAA', 'AAAA', 1000, 256, 128, 'aes', 'gcm', 'zlib'], 'ct': 'AAAA'
+    })
+
+    assert 'comments' not in privatebinapi.get(url, password='foo')
+    with ThreadPoolExecutor(2) as executor:
+        get_data = privatebinapi.get(url, password='foo', include_comments=True, decrypt_executor=executor)
+    assert get_data['text'] == MESSAGE
+    assert [(item.comment, item.nickname) for item in get_data.comments] == [
+        ('First!', 'alice'), ('Réponse', None), (None, None)
+    ]
+    assert get_data['comments'][1]['parentid'] == first.id
+    assert pickle.loads(pickle.dumps(get_data)) == get_data
+    assert json.loads(json.dumps(get_data.to_dict()))['comments'][0]['comment'] == 'First!'
+
+    data = {'comments': local_server.pastes[paste_id]['comments'], 'v': local_server.version}
+    with ThreadPoolExecutor(2) as executor:
+        chunked = comments.decrypt_discussion(data, url.rsplit('#', 1)[1], 'foo', executor=executor, chunk_size=1)
+    assert chunked == get_data.comments
+
+
+def test_local_cached_comments(local_server):
+    local_server.etags = True
+    url = privatebinapi.send(local_server.url, text=MESSAGE, discussion=True)['full_url']
+    cache = privatebinapi.MemoryCache(max_age=60)
+    assert privatebinapi.get(url, include_comments=True, cache=cache).comments == []
+    privatebinapi.comment(url, 'First!')
+    assert privatebinapi.get(url, cache=cache).get('comments') is None
+    assert [item.comment for item in privatebinapi.get(url, include_comments=True, cache=cache).comments] == [
+        'First!'
+    ]
+    downloads = local_server.downloads
+    assert len(privatebinapi.get(url, include_comments=True, cache=cache).comments) == 1
+    assert local_server.downloads == downloads + 1
+
+
+@pytest.mark.asyncio
+async def test_local_async_comments(local_server):
+    send_data = await privatebinapi.send_async(local_server.url, text=MESSAGE, discussion=True)
+    cache = privatebinapi.MemoryCache()
+    await privatebinapi.get_async(send_data['full_url'], cache=cache)
+    for index in range(3):
+        await privatebinapi.comment_async(send_data['full_url'], 'Comment %d' % index)
+    get_data = await privatebinapi.get_async(send_data['full_url'], include_comments=True, cache=cache)
+    assert [item.comment for item in get_data.comments] == ['Comment 0', 'Comment 1', 'Comment 2']
+
+    try:
+        await privatebinapi.comment_async(send_data['full_url'].replace(send_data['id'], '0' * 16), MESSAGE)
+    except privatebinapi.PrivateBinAPIError:
+        pass
+    else:
+        assert False
+
+
+def test_local_comments_on_upgraded_host():
+    with serve(1) as server:
+        url = privatebinapi.send(server.url, text=MESSAGE, discussion=True)['full_url']
+        server.version = 2
+        capabilities.CAPABILITY_CACHE.invalidate(server.url)
+        privatebinapi.comment(url, 'Still version 1', nickname='alice')
+        downloads = server.downloads
+        privatebinapi.comment(url, 'Known version', version=1)
+        assert server.downloads == downloads
+        get_data = privatebinapi.get(url, include_comments=True)
+        assert [(item.comment, item.nickname) for item in get_data.comments] == [
+            ('Still version 1', 'alice'), ('Known version', None)
+        ]
+
+
+def test_local_get_many_broken_executor(local_server):
+    urls = [privatebinapi.send(local_server.url, text=MESSAGE)['full_url'] for _ in range(3)]
+
+    class BrokenExecutor(Executor):
+        def submit(self, *args, **kwargs):  # pylint: disable=arguments-differ
+            future = Future()
+            future.set_exception(BrokenProcessPool('A child process terminated abruptly'))
+            return future
+
+    results = sorted(privatebinapi.get_many(urls, decrypt_executor=BrokenExecutor(), chunk_size=2))
+    assert [result.index for result in results] == [0, 1, 2]
+    assert all(isinstance(result.error, BrokenProcessPool) for result in results)
+
+
+def test_local_stream_without_attachment(local_server, tmp_path):
+    path = tmp_path / 'attachment'
+    send_data = privatebinapi.send(local_server.url, text=MESSAGE)
+    get_data = privatebinapi.get_stream(send_data['full_url'], path)
+    assert get_data['text'] == MESSAGE
+    assert get_data['attachment']['filename'] is None
+    assert not path.exists()
+    assert list(tmp_path.iterdir()) == []
+
+    send_data = privatebinapi.send(local_server.url, text=MESSAGE, file=FILE)
+    privatebinapi.get_stream(send_data['full_url'], path)
+    with open(FILE, 'rb') as file:
+        assert path.read_bytes() == file.read()
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_local_retry(local_server):
+    local_server.retry_after = 2
+    policy = privatebinapi.RetryPolicy(backoff=0.01)
+    send_data = privatebinapi.send(local_server.url, text=MESSAGE, retry_policy=policy)
+    assert privatebinapi.get(send_data['full_url'])['text'] == MESSAGE
+    assert len(local_server.bodies) == 3
+
+
+def test_local_host_pool_failover(local_server):
+    pool = privatebinapi.HostPool(['http://127.0.0.1:1/', local_server.url], failure_threshold=1)
+    send_data = privatebinapi.send(pool, text=MESSAGE)
+    assert send_data['full_url'].startswith(local_server.url)
+    assert [status.available for status in pool.status()] == [False, True]
+
+
+def test_benchmark(tmp_path):
+    from benchmarks import bench
+
+    output = str(tmp_path / 'results.json')
+    assert bench.main([
+        '--operations', 'delete', '--modes', 'sync', '--text-sizes', '64', '--attachment-sizes', '0',
+        '--concurrency', '2', '--count', '2', '--output', output
+    ]) == 0
+    with open(output) as file:
+        report = json.load(file)
+    result, = report['results']
+    assert result['count'] == 2
+    assert result['latency']['p50'] <= result['latency']['p99']
+    assert bench.main([
+        '--operations', 'delete', '--modes', 'sync', '--text-sizes', '64', '--attachment-sizes', '0',
+        '--concurrency', '2', '--count', '2', '--output', output, '--compare', output, '--threshold', '100'
+    ]) == 0
+
+
+def test_lazy_imports():
+    code = (
+        'import sys, privatebinapi; loaded = lambda: sorted({"requests", "httpx", "pbincli"} & set(sys.modules)); '
+        'print(loaded()); privatebinapi.delete; print(loaded()); privatebinapi.send; print(loaded())'
+    )
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+                            universal_newlines=True).stdout.splitlines()
+    assert output == ['[]', '[]', "['pbincli']"]
+    assert 'send' in dir(privatebinapi)
+    try:
+        privatebinapi.no_such_name  # pylint: disable=pointless-statement
+    except AttributeError:
+        pass
+    else:
+        assert False
+
+
+def test_import_benchmark(tmp_path):
+    from benchmarks import imports
+
+    output = str(tmp_path / 'imports.json')
+    assert imports.main(['--statements', 'import,delete', '--count', '1', '--output', output]) == 0
+    with open(output) as file:
+        results = json.load(file)['results']
+    assert [result['name'] for result in results] == ['import/import', 'import/delete']
+    assert results[0]['modules'] == []